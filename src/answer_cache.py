@@ -0,0 +1,130 @@
+import math
+import time
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterable, List, Optional, Tuple
+from langchain_core.documents import Document
+from src.config import ANSWER_CACHE_MAX_DISTANCE, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES
+from src.manifest import content_hash
+from src.resources import registry
+
+if TYPE_CHECKING:
+    from src.inference import ComplianceResponse
+
+ChunkKey = FrozenSet[Tuple[str, str]]
+
+def chunk_key(docs: Iterable[Document]) -> ChunkKey:
+    """
+    Identifies the grounding of an answer: the set of (chunk ID, content hash) it was built from.
+    """
+    key = set()
+    for doc in docs:
+        digest = doc.metadata.get("content_hash") or content_hash(doc.page_content)
+        key.add((doc.id or digest, digest))
+    return frozenset(key)
+
+def cosine_distance(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    if norm == 0:
+        return 1.0
+    return 1.0 - dot / norm
+
+class SemanticAnswerCache:
+    """
+    In-process cache of ComplianceResponses for paraphrased questions.
+
+    A stored answer is reused when the new query embedding is within `max_distance`
+    (cosine distance) of a cached query AND retrieval grounded it on exactly the same
+    chunks (same IDs and content hashes). Re-ingesting a chunk therefore never serves a
+    stale answer; entries referencing re-ingested or deleted chunks are also dropped
+    eagerly through `invalidate_chunks`.
+
+    Entries expire after `ttl` seconds and the least recently used ones are evicted
+    beyond `max_entries`.
+    """
+
+    def __init__(
+        self,
+        max_distance: float = ANSWER_CACHE_MAX_DISTANCE,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+    ):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, query_vector: List[float], docs: List[Document]) -> Optional[Tuple["ComplianceResponse", float]]:
+        """
+        Returns (cached response, cosine distance) for the closest matching entry, or None.
+        """
+        key = chunk_key(docs)
+        now = time.monotonic()
+        with self._lock:
+            best = None
+            for entry_id, entry in list(self._entries.items()):
+                if now - entry["created"] > self.ttl:
+                    del self._entries[entry_id]
+                    continue
+                if entry["chunks"] != key:
+                    continue
+                distance = cosine_distance(query_vector, entry["vector"])
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (entry_id, distance)
+
+            if best is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(best[0])
+            return self._entries[best[0]]["response"].model_copy(deep=True), best[1]
+
+    def store(self, query_vector: List[float], docs: List[Document], response: "ComplianceResponse"):
+        with self._lock:
+            self._entries[self._next_id] = {
+                "vector": list(query_vector),
+                "chunks": chunk_key(docs),
+                "response": response.model_copy(deep=True),
+                "created": time.monotonic(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_chunks(self, chunk_ids: Iterable[str]):
+        """
+        Drops every entry grounded on any of the given chunk IDs.
+        """
+        ids = set(chunk_ids)
+        if not ids:
+            return
+        with self._lock:
+            for entry_id, entry in list(self._entries.items()):
+                if any(chunk_id in ids for chunk_id, _ in entry["chunks"]):
+                    del self._entries[entry_id]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """
+    Returns the process-wide answer cache.
+    """
+    return registry.get("answer_cache", SemanticAnswerCache)
+
+def invalidate_cached_answers(chunk_ids: Iterable[str]):
+    """
+    Drops cached answers grounded on re-ingested or deleted chunks. No-op if the cache was never used.
+    """
+    if registry.is_loaded("answer_cache"):
+        get_answer_cache().invalidate_chunks(chunk_ids)
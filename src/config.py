@@ -5,13 +5,115 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
+# Default data and index locations; a run can point elsewhere with src.storage.use_storage
 DATA_DIR = BASE_DIR / "data"
 CHROMA_DIR = BASE_DIR / "chroma_db"
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "models/embedding-001")
+# Embedding backend: "google" (remote Gemini model), or on-box "hashing" (hashing vectorizer, no model)
+# or "onnx" (all-MiniLM-L6-v2 on ONNX Runtime). Local backends encode in batches, optionally over several
+# threads. Changing the backend rebuilds the index on the next ingestion.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "google")
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "1024"))
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "256"))
+LOCAL_EMBEDDING_WORKERS = int(os.getenv("LOCAL_EMBEDDING_WORKERS", "1"))
+# Default grounding threshold per backend, on the cosine similarity of the query and chunk embeddings:
+# the lexical hashing vectors score far lower than Gemini's (0.06 separates the off-topic question of
+# docs/compliance_questions.md from the rest). Calibrate with `python -m src.scripts.eval_retrieval`.
+DEFAULT_GROUNDING_THRESHOLDS = {"google": "0.65", "hashing": "0.06", "onnx": "0.5"}
+GROUNDING_THRESHOLD = float(os.getenv("GROUNDING_THRESHOLD", DEFAULT_GROUNDING_THRESHOLDS.get(EMBEDDING_BACKEND, "0.5")))
 LLM_MODEL_NAME = os.getenv("LLM_MODEL", "gemini-3-flash-preview")
-GROUNDING_THRESHOLD = float(os.getenv("GROUNDING_THRESHOLD", "0.5"))
 
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY must be set in the .env file.")
+# Retrieval: candidates over-fetched from the vector store with their stored embeddings, chunks kept
+# after reranking, and the MMR trade-off between relevance and diversity (1.0 = relevance only; on
+# docs/compliance_questions.md diversity drops table rows that list questions need, so it is off by default)
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "1.0"))
+
+# Vector index (HNSW): distance metric of the approximate search ("cosine", "l2" or "ip"), links per node
+# and candidate list sizes while building and searching. Retrieval scores are always the cosine similarity
+# of the stored embeddings; these only trade candidate recall against latency and index size. Metric, M
+# and ef_construction are fixed when the index is built: changing them rebuilds it from the stored
+# embeddings (no re-embedding) on the next ingestion or `python -m src.scripts.check_db compact`.
+VECTOR_SPACE = os.getenv("VECTOR_SPACE", "cosine")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "100"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+
+# Query pipeline: queries processed concurrently per process and per-stage timeouts in seconds
+QUERY_CONCURRENCY = int(os.getenv("QUERY_CONCURRENCY", "32"))
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", "30"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+# HTTP server (src/server.py): bind address, queries admitted at once (in flight or waiting,
+# beyond that requests get 503) and maximum queries per /batch request
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_MAX_PENDING = int(os.getenv("SERVER_MAX_PENDING", "256"))
+SERVER_MAX_BATCH = int(os.getenv("SERVER_MAX_BATCH", "1000"))
+# POST /ingest runs ingestion in a child process and holds queries back for at most this many
+# seconds; past it the child is killed (committed batches are kept, the next run resumes)
+INGEST_TIMEOUT = float(os.getenv("INGEST_TIMEOUT", "3600"))
+
+# Persistent embedding cache (kept outside chroma_db/ so it survives --wipe)
+CACHE_DIR = BASE_DIR / ".cache"
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "1") == "1"
+EMBEDDING_CACHE_PATH = Path(os.getenv("EMBEDDING_CACHE_PATH", str(CACHE_DIR / "embeddings.sqlite3")))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+# Parse cache: chunks produced by the parsers, keyed by file hash, parser version and options,
+# so unchanged documents skip PDF/HTML conversion (also disabled per run with --no-parse-cache)
+PARSE_CACHE_ENABLED = os.getenv("PARSE_CACHE", "1") == "1"
+PARSE_CACHE_DIR = Path(os.getenv("PARSE_CACHE_DIR", str(CACHE_DIR / "parse")))
+PARSE_CACHE_MAX_BYTES = int(float(os.getenv("PARSE_CACHE_MAX_MB", "256")) * (1 << 20))
+# Per-source grounding thresholds written by `python -m src.scripts.eval_retrieval --calibrate`
+GROUNDING_CALIBRATION_PATH = Path(os.getenv("GROUNDING_CALIBRATION_PATH", str(CACHE_DIR / "grounding_thresholds.json")))
+
+# Semantic answer cache: reuse an answer for a paraphrased query (cosine distance of the query
+# embeddings) grounded on the same chunks
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_MAX_DISTANCE = float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", "0.1"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+
+# Context packing: estimated token budget of the retrieved context in the prompt (0 disables packing),
+# per-chunk limit above which chunks are trimmed to their most relevant lines, and the
+# shingle Jaccard similarity above which a chunk counts as a near-duplicate of a packed one
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+CONTEXT_MAX_CHUNK_TOKENS = int(os.getenv("CONTEXT_MAX_CHUNK_TOKENS", "400"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.9"))
+
+# Tracing: append per-stage spans to this JSON Lines file ("json" flat records or "otlp" OpenTelemetry spans)
+TRACE_FILE = Path(os.getenv("TRACE_FILE")) if os.getenv("TRACE_FILE") else None
+TRACE_FORMAT = os.getenv("TRACE_FORMAT", "json")
+
+# Ingestion: number of parser processes (1 parses in-process) and per-file time budget in seconds
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+PARSE_TIMEOUT = float(os.getenv("PARSE_TIMEOUT", "300"))
+# PDF pages without images or vector graphics (no ruled tables or figures) skip the layout model and are
+# converted from their text spans, about 15x faster; 0 runs the layout model on every page
+PDF_FAST_TEXT_PAGES = os.getenv("PDF_FAST_TEXT_PAGES", "1") == "1"
+
+# Deduplication: a chunk identical to one already stored is recorded as a reference to it instead of being
+# stored and embedded again. Near-duplicates (SimHash of the words within DEDUP_MAX_DISTANCE bits, same part
+# and CAS numbers) are reported at ingestion and merged into one result at retrieval (-1 disables merging)
+DEDUP_ENABLED = os.getenv("DEDUP", "1") == "1"
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "3"))
+
+# Ingestion: embedding batches, concurrent batches in flight, rate limit (texts per second, 0 disables)
+# and retries of throttled (429) or unavailable (5xx) embedding calls
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_RATE_LIMIT = float(os.getenv("EMBED_RATE_LIMIT", "0"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+
+def require_google_api_key() -> str:
+    """
+    Returns GOOGLE_API_KEY, raising if it is missing.
+    Checked when a Gemini client is built rather than at import, so commands that
+    need no client (--help, --wipe, parsing scripts) run without a key.
+    """
+    if not GOOGLE_API_KEY:
+        raise ValueError("GOOGLE_API_KEY must be set in the .env file.")
+    return GOOGLE_API_KEY
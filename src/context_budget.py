@@ -0,0 +1,137 @@
+import re
+import math
+from typing import Dict, List, Optional, Set, Tuple
+from langchain_core.documents import Document
+from src.config import CONTEXT_TOKEN_BUDGET, CONTEXT_MAX_CHUNK_TOKENS, CONTEXT_DEDUP_THRESHOLD
+from src.lexical import tokenize
+
+# Rough characters per token of the Gemini tokenizer for English/Markdown text
+CHARS_PER_TOKEN = 4
+# Below this many tokens left in the budget, a chunk is dropped rather than trimmed
+MIN_CHUNK_TOKENS = 32
+ELISION = "[...]"
+TABLE_SEPARATOR_RE = re.compile(r"^\|?\s*:?-{3,}")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of LLM tokens of a text without calling the model.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    tokens = tokenize(text)
+    if len(tokens) <= size:
+        return {tuple(tokens)}
+    return {tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+def jaccard(a: Set, b: Set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def trim_to_relevant(query: str, text: str, max_tokens: int) -> str:
+    """
+    Shortens a chunk to its lines most relevant to the query, within `max_tokens`.
+
+    Lines are scored by the query terms they contain, each weighted by its inverse
+    frequency among the chunk's lines, so identifiers (part or CAS numbers) count far
+    more than common words. The first line and table header lines are always kept
+    when they fit. Kept lines stay in document order; gaps are marked with "[...]".
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    line_tokens = [set(tokenize(line)) for line in lines]
+    terms = set(tokenize(query))
+    doc_freq = {term: sum(1 for tokens in line_tokens if term in tokens) for term in terms}
+
+    def score(i: int) -> float:
+        return sum(math.log(1 + len(lines) / doc_freq[term]) for term in terms if term in line_tokens[i])
+
+    pinned = {0}
+    for i, line in enumerate(lines):
+        if TABLE_SEPARATOR_RE.match(line.strip()):
+            pinned.update({i - 1, i} if i > 0 else {i})
+    ranked = sorted(pinned) + sorted(
+        (i for i in range(len(lines)) if i not in pinned and score(i) > 0),
+        key=lambda i: (-score(i), i),
+    )
+
+    kept = set()
+    used = 0
+    for i in ranked:
+        cost = estimate_tokens(lines[i]) + 1
+        if used + cost > max_tokens:
+            continue
+        kept.add(i)
+        used += cost
+
+    output = []
+    for i, line in enumerate(lines):
+        if i in kept:
+            output.append(line)
+        elif not output or output[-1] != ELISION:
+            output.append(ELISION)
+    return "\n".join(output)
+
+def pack_context(
+    query: str,
+    docs: List[Document],
+    budget: Optional[int] = None,
+    max_chunk_tokens: Optional[int] = None,
+    dedup_threshold: Optional[float] = None,
+) -> Tuple[List[Document], Dict[str, int]]:
+    """
+    Packs retrieved chunks into a token budget before they are sent to the LLM.
+
+    Chunks are taken in retrieval rank order (best score first, as returned by
+    retrieve_context). A chunk whose shingles are near-identical to an already packed
+    one is dropped, a chunk longer than `max_chunk_tokens` is trimmed to its most
+    relevant lines, and once the budget runs low the next chunk is trimmed to what is
+    left, after which packing stops. The best chunk is always kept, trimmed if needed,
+    so a grounded query never ends up with an empty context.
+
+    Args:
+        query: The user query (used to pick relevant lines).
+        docs: Retrieved documents, best first.
+        budget: Context token budget. Defaults to CONTEXT_TOKEN_BUDGET; <= 0 disables packing.
+        max_chunk_tokens: Per-chunk limit. Defaults to CONTEXT_MAX_CHUNK_TOKENS.
+        dedup_threshold: Near-duplicate similarity. Defaults to CONTEXT_DEDUP_THRESHOLD.
+
+    Returns:
+        A tuple containing:
+        - The packed documents (copies; IDs and metadata are preserved).
+        - Counts of input, kept, duplicate and trimmed chunks and the estimated context tokens.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    max_chunk_tokens = CONTEXT_MAX_CHUNK_TOKENS if max_chunk_tokens is None else max_chunk_tokens
+    dedup_threshold = CONTEXT_DEDUP_THRESHOLD if dedup_threshold is None else dedup_threshold
+
+    stats = {"chunks": len(docs), "kept": 0, "duplicates": 0, "trimmed": 0, "tokens": 0}
+    if budget <= 0:
+        stats["kept"] = len(docs)
+        stats["tokens"] = sum(estimate_tokens(doc.page_content) for doc in docs)
+        return list(docs), stats
+
+    packed: List[Document] = []
+    packed_shingles: List[Set] = []
+    for doc in docs:
+        remaining = budget - stats["tokens"]
+        if packed and remaining < MIN_CHUNK_TOKENS:
+            break
+
+        doc_shingles = shingles(doc.page_content)
+        if any(jaccard(doc_shingles, other) >= dedup_threshold for other in packed_shingles):
+            stats["duplicates"] += 1
+            continue
+
+        text = trim_to_relevant(query, doc.page_content, min(max_chunk_tokens, remaining))
+        if text != doc.page_content:
+            stats["trimmed"] += 1
+        packed.append(Document(id=doc.id, page_content=text, metadata=doc.metadata))
+        packed_shingles.append(doc_shingles)
+        stats["tokens"] += estimate_tokens(text)
+
+    stats["kept"] = len(packed)
+    return packed, stats
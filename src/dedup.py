@@ -0,0 +1,312 @@
+import json
+import hashlib
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from src.config import DEDUP_MAX_DISTANCE
+from src.storage import storage_paths
+from src.lexical import tokenize, extract_identifiers
+from src.resources import registry
+
+# The 64-bit SimHash is looked up in 4 tables of 16-bit blocks: hashes within 3 bits share at least one block
+SIMHASH_BLOCKS = 4
+# Where a chunk appears: kept for every reference to a chunk stored once
+REFERENCE_FIELDS = ("source", "section_title", "page")
+
+INDEX_VERSION = 1
+
+@lru_cache(maxsize=1 << 16)
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash of a text's words: the hash of every word votes on each bit, so
+    texts differing in a few words (a supplier name, a date) get hashes a few bits apart.
+    """
+    counts = Counter(tokenize(text))
+    if not counts:
+        return 0
+    hashes = np.array([_token_hash(token) for token in counts], dtype="<u8")
+    weights = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    votes = weights @ bits
+    return int(np.packbits(votes * 2 > weights.sum(), bitorder="little").view("<u8")[0])
+
+def fingerprint(text: str) -> str:
+    """
+    Near-duplicate fingerprint of a chunk: "<SimHash>:<digest of its identifiers>".
+
+    Table rows repeat their header and differ by a few cells, so their SimHashes are
+    close; only chunks naming the same part and CAS numbers can be near-duplicates.
+    """
+    identifiers = "|".join(sorted(extract_identifiers(text)))
+    return f"{simhash(text):016x}:{hashlib.sha256(identifiers.encode('utf-8')).hexdigest()[:12]}"
+
+def _parse(value: str) -> Tuple[int, str]:
+    hash_hex, identifiers = value.split(":", 1)
+    return int(hash_hex, 16), identifiers
+
+def is_near_duplicate(a: str, b: str, max_distance: int = DEDUP_MAX_DISTANCE) -> bool:
+    """
+    Whether two fingerprints belong to near-duplicate chunks.
+    """
+    (hash_a, ids_a), (hash_b, ids_b) = _parse(a), _parse(b)
+    return ids_a == ids_b and (hash_a ^ hash_b).bit_count() <= max_distance
+
+def doc_fingerprint(doc: Document) -> str:
+    # Chunks ingested before fingerprints existed have none in their metadata
+    return doc.metadata.get("fingerprint") or fingerprint(doc.page_content)
+
+def reference(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: metadata[field] for field in REFERENCE_FIELDS if metadata.get(field) is not None}
+
+def _add_references(doc: Document, references: Iterable[Dict[str, Any]]):
+    merged = doc.metadata.setdefault("references", [reference(doc.metadata)])
+    for ref in references:
+        if ref not in merged:
+            merged.append(ref)
+
+class DuplicateIndex:
+    """
+    Side index of duplicate chunks, persisted as JSON next to the vector store.
+
+    It holds the fingerprint of every stored chunk, so near-duplicates of a new chunk
+    are found at ingestion, and the references of every chunk stored once for several
+    identical chunks (see SharedChunks), so retrieval can list each file and section
+    the content appears in. Like the lexical index, it is reconciled with the ingestion
+    manifest after every run.
+
+    Args:
+        path: JSON file the index is loaded from and saved to.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self._fingerprints: Dict[str, str] = {}
+        self._blocks: List[Dict[Tuple[int, str], Set[str]]] = [{} for _ in range(SIMHASH_BLOCKS)]
+        self._references: Dict[str, List[Dict[str, Any]]] = {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: Path) -> "DuplicateIndex":
+        """
+        Loads the index from `path`; returns an empty index if the file is missing or outdated.
+        """
+        index = cls(path)
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                for doc_id, value in data["fingerprints"].items():
+                    index._add(doc_id, value)
+                index._references = data["references"]
+        return index
+
+    def save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": INDEX_VERSION, "fingerprints": self._fingerprints, "references": self._references},
+                f, separators=(",", ":"),
+            )
+        tmp_path.replace(self.path)
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def ids(self) -> Set[str]:
+        return set(self._fingerprints)
+
+    def _keys(self, value: str) -> List[Tuple[int, str]]:
+        hash_value, identifiers = _parse(value)
+        return [((hash_value >> (16 * block)) & 0xFFFF, identifiers) for block in range(SIMHASH_BLOCKS)]
+
+    def _add(self, doc_id: str, value: str):
+        self._fingerprints[doc_id] = value
+        for table, key in zip(self._blocks, self._keys(value)):
+            table.setdefault(key, set()).add(doc_id)
+
+    def add(self, docs: Iterable[Document]):
+        """
+        Indexes (or re-indexes) the fingerprints of stored chunks.
+        """
+        for doc in docs:
+            self.remove([doc.id])
+            self._add(doc.id, doc_fingerprint(doc))
+            self.dirty = True
+
+    def remove(self, doc_ids: Iterable[str]):
+        for doc_id in doc_ids:
+            value = self._fingerprints.pop(doc_id, None)
+            if value is None:
+                continue
+            for table, key in zip(self._blocks, self._keys(value)):
+                ids = table[key]
+                ids.discard(doc_id)
+                if not ids:
+                    del table[key]
+            self.dirty = True
+
+    def near_duplicates(self, value: str, exclude: Optional[str] = None, max_distance: int = DEDUP_MAX_DISTANCE) -> List[str]:
+        """
+        IDs of the stored chunks whose fingerprint is a near-duplicate of `value`.
+        """
+        if max_distance < 0:
+            return []
+        candidates = set()
+        for table, key in zip(self._blocks, self._keys(value)):
+            candidates.update(table.get(key, ()))
+        candidates.discard(exclude)
+        return sorted(doc_id for doc_id in candidates if is_near_duplicate(value, self._fingerprints[doc_id], max_distance))
+
+    def set_references(self, aliases: Dict[str, Dict[str, Any]]):
+        """
+        Replaces the references of the shared chunks with those of the manifest's aliases.
+        """
+        references: Dict[str, List[Dict[str, Any]]] = {}
+        for alias_id in sorted(aliases):
+            entry = aliases[alias_id]
+            references.setdefault(entry["of"], []).append(reference(entry["metadata"]))
+        if references != self._references:
+            self._references = references
+            self.dirty = True
+
+    def references(self, doc_id: str) -> List[Dict[str, Any]]:
+        """
+        Where else the content of a stored chunk appears (empty if it is not shared).
+        """
+        return self._references.get(doc_id, [])
+
+def get_duplicate_index() -> DuplicateIndex:
+    """
+    Returns the process-wide duplicate index, loading it from disk on first use.
+    """
+    return registry.get("duplicate_index", lambda: DuplicateIndex.load(storage_paths().duplicate_index_path))
+
+def collapse_near_duplicates(docs: Sequence[Document], max_distance: int = DEDUP_MAX_DISTANCE) -> List[int]:
+    """
+    Positions of the documents to keep from a ranked list: a near-duplicate of a better
+    ranked document is dropped and its references are added to that document's
+    metadata["references"], so boilerplate repeated across files takes one slot.
+    """
+    if max_distance < 0:
+        return list(range(len(docs)))
+    kept: List[int] = []
+    kept_fingerprints: List[str] = []
+    for i, doc in enumerate(docs):
+        value = doc_fingerprint(doc)
+        for j, other in zip(kept, kept_fingerprints):
+            if is_near_duplicate(value, other, max_distance):
+                _add_references(docs[j], doc.metadata.get("references") or [reference(doc.metadata)])
+                break
+        else:
+            kept.append(i)
+            kept_fingerprints.append(value)
+    return kept
+
+def merge_duplicates(docs: Sequence[Document]) -> List[Document]:
+    """
+    Collapses the near-duplicates of a ranked list (see collapse_near_duplicates) and adds
+    the references of the identical chunks each kept chunk was stored once for.
+    """
+    index = get_duplicate_index()
+    merged = [docs[i] for i in collapse_near_duplicates(docs)]
+    for doc in merged:
+        shared = index.references(doc.id)
+        if shared:
+            _add_references(doc, shared)
+    return merged
+
+class SharedChunks:
+    """
+    Identical chunks stored once, tracked in the ingestion manifest.
+
+    A chunk whose content is identical to a stored chunk becomes an alias: it has no
+    Chroma record (so no embedding) and is listed in manifest["duplicates"] as
+    {"of": <stored chunk ID>, "metadata": <its own metadata>}. Aliases are recorded in
+    their file's manifest entry like any chunk, so unchanged files skip them. When a
+    stored chunk is deleted or overwritten, one of its aliases takes over its record
+    (see `promote`).
+
+    Args:
+        manifest: The ingestion manifest (updated in place).
+    """
+
+    def __init__(self, manifest: Dict[str, Any]):
+        self.aliases: Dict[str, Dict[str, Any]] = manifest.setdefault("duplicates", {})
+        self._stored: Dict[str, str] = {}
+        self._aliases_of: Dict[str, Set[str]] = {}
+        for entry in manifest["files"].values():
+            for chunk_id, digest in entry["chunks"].items():
+                if chunk_id not in self.aliases:
+                    self._stored.setdefault(digest, chunk_id)
+        for alias_id, entry in self.aliases.items():
+            self._aliases_of.setdefault(entry["of"], set()).add(alias_id)
+
+    def is_alias(self, chunk_id: str) -> bool:
+        return chunk_id in self.aliases
+
+    def find(self, digest: str) -> Optional[str]:
+        """
+        ID of the stored chunk with this content hash, if any.
+        """
+        return self._stored.get(digest)
+
+    def store(self, chunk_id: str, digest: str):
+        """
+        Records a chunk stored under its own record (embedded and upserted).
+        """
+        self._stored.setdefault(digest, chunk_id)
+
+    def unstore(self, chunk_id: str, digest: Optional[str]):
+        """
+        Forgets a stored chunk whose record is deleted or overwritten (after `promote`).
+        """
+        if digest is not None and self._stored.get(digest) == chunk_id:
+            del self._stored[digest]
+
+    def add_alias(self, doc: Document, stored_id: str):
+        self.aliases[doc.id] = {"of": stored_id, "metadata": doc.metadata}
+        self._aliases_of.setdefault(stored_id, set()).add(doc.id)
+
+    def remove_alias(self, alias_id: str) -> Optional[str]:
+        """
+        Removes an alias; returns the ID of the stored chunk it referenced.
+        """
+        entry = self.aliases.pop(alias_id, None)
+        if entry is None:
+            return None
+        aliases = self._aliases_of.get(entry["of"], set())
+        aliases.discard(alias_id)
+        if not aliases:
+            self._aliases_of.pop(entry["of"], None)
+        return entry["of"]
+
+    def promote(self, stored_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        The record of `stored_id` is going away: its first alias takes over the content
+        and the other aliases now reference it. The caller copies the record.
+
+        Returns:
+            The promoted alias ID and its metadata, or None if the chunk has no alias.
+        """
+        aliases = sorted(self._aliases_of.pop(stored_id, ()))
+        if not aliases:
+            return None
+        promoted = aliases[0]
+        metadata = self.aliases.pop(promoted)["metadata"]
+        for alias_id in aliases[1:]:
+            self.aliases[alias_id]["of"] = promoted
+        if aliases[1:]:
+            self._aliases_of[promoted] = set(aliases[1:])
+        if self._stored.get(metadata["content_hash"]) == stored_id:
+            self._stored[metadata["content_hash"]] = promoted
+        return promoted, metadata
@@ -0,0 +1,139 @@
+import time
+import array
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from src.tracing import tracer
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper backed by a persistent SQLite cache.
+
+    Vectors are stored as float32 blobs keyed by (model name, task, sha256(text)).
+    The task ("document" or "query") is part of the key because retrieval models
+    embed queries and documents differently. The cache survives --wipe, so rebuilding
+    the index or repeating a question costs no embedding API calls.
+
+    The cache holds at most `max_entries` vectors; the least recently used ones are
+    evicted first. Hit/miss counters are kept per process.
+
+    Args:
+        embeddings: The underlying (remote) embedding model.
+        model_name: Name of the underlying model, part of the cache key.
+        path: SQLite file holding the cache.
+        max_entries: Maximum number of cached vectors.
+        query_batch: Optional callable embedding several queries in one call.
+            Without it, uncached queries of `embed_queries` are embedded one by one.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        path: Path,
+        max_entries: int = 100_000,
+        query_batch: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    ):
+        self.embeddings = embeddings
+        self.query_batch = query_batch
+        self.model_name = model_name
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _key(self, task: str, text: str) -> str:
+        return f"{self.model_name}:{task}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array.array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                self._conn.commit()
+        return found
+
+    def _store(self, items: Dict[str, List[float]]):
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array.array("f", vector).tobytes(), now) for key, vector in items.items()],
+            )
+            self._size += self._conn.total_changes - before
+            if self._size > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (self._size - self.max_entries,),
+                )
+                self._size = self.max_entries
+            self._conn.commit()
+
+    def _embed(self, task: str, texts: List[str], compute) -> List[List[float]]:
+        keys = [self._key(task, text) for text in texts]
+        found = self._lookup(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        misses = sum(1 for key in keys if key not in found)
+        with self._lock:
+            self.hits += len(keys) - misses
+            self.misses += misses
+        tracer.current().add(cache_hits=len(keys) - misses, cache_misses=misses)
+
+        if missing:
+            # The remote call happens outside the lock so concurrent batches are not serialized
+            vectors = compute(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("document", texts, self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed("query", [text], lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds several queries, sending only the uncached ones to the model.
+        """
+        compute = self.query_batch or (lambda missing: [self.embeddings.embed_query(text) for text in missing])
+        return self._embed("query", texts, compute)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": self._size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,122 @@
+import re
+import asyncio
+import time
+import hashlib
+import math
+import threading
+from typing import List, Optional
+from langchain_core.embeddings import Embeddings
+
+class ThrottledError(Exception):
+    """
+    Mimics a provider error carrying an HTTP status code (e.g. 429 or 503).
+    """
+    def __init__(self, code: int, message: str = "throttled"):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic, offline stand-in for the remote embedding model.
+
+    Texts are embedded as L2-normalized hashed bag-of-words counts, so texts that
+    share words are close to each other and cosine similarities stay in [0, 1]. Latency and throttling can be simulated
+    to exercise batching, rate limiting and retry logic.
+
+    Args:
+        dim: Vector dimension.
+        latency: Seconds slept per call.
+        throttle_every: If set, every n-th call fails with `throttle_code`.
+        throttle_code: Status code of simulated failures (429 by default).
+        fail_after: If set, every call after this many successful calls fails with a
+            non-retryable error (simulates a crash mid-ingestion).
+    """
+
+    def __init__(
+        self,
+        dim: int = 64,
+        latency: float = 0.0,
+        throttle_every: Optional[int] = None,
+        throttle_code: int = 429,
+        fail_after: Optional[int] = None,
+    ):
+        self.dim = dim
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.throttle_code = throttle_code
+        self.fail_after = fail_after
+        self.calls = 0
+        self.successful_calls = 0
+        self.embedded_texts = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _call(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+            if self.fail_after is not None and self.successful_calls >= self.fail_after:
+                raise RuntimeError("simulated embedding outage")
+            if self.throttle_every and call % self.throttle_every == 0:
+                raise ThrottledError(self.throttle_code)
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.successful_calls += 1
+            self.embedded_texts += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._call(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call([text])[0]
+
+class FakeAnswerChain:
+    """
+    Offline stand-in for the answer chains returned by get_chain() and get_stream_chain().
+    Answers with the first line of the context after simulating `latency` seconds.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def _respond(self, inputs: dict):
+        # Imported lazily: src.inference pulls in the Gemini client
+        from src.inference import ComplianceAnswer
+        self.calls += 1
+        context = inputs["context"]
+        first_line = context.splitlines()[1] if "\n" in context else context
+        return ComplianceAnswer(answer=first_line, is_compliant=None, confidence=0.0, sources=[])
+
+    def invoke(self, inputs: dict, config=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(inputs)
+
+    async def ainvoke(self, inputs: dict, config=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(inputs)
+
+    async def astream(self, inputs: dict, config=None):
+        """
+        Yields growing partial dicts like the streaming answer chain: the answer
+        word by word (spread over `latency` seconds), then the complete response.
+        """
+        response = self._respond(inputs)
+        words = response.answer.split(" ")
+        for i in range(1, len(words) + 1):
+            if self.latency:
+                await asyncio.sleep(self.latency / len(words))
+            yield {"answer": " ".join(words[:i])}
+        yield response.model_dump()
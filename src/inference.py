@@ -1,19 +1,36 @@
-from typing import List, Optional, Dict
+import time
+from typing import Any, Callable, List, Optional, Dict, Tuple
 from pydantic import BaseModel, Field
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
-from src.config import GOOGLE_API_KEY, LLM_MODEL_NAME
+from langchain_core.output_parsers import BaseOutputParser, JsonOutputParser
+from langchain_core.runnables import Runnable, RunnableSequence
+from src.config import LLM_MODEL_NAME, require_google_api_key
+from src.context_budget import pack_context, estimate_tokens
+from src.resources import registry
+from src.tracing import span
 
-class ComplianceResponse(BaseModel):
+class ComplianceAnswer(BaseModel):
     """
-    Schema for structured compliance response.
+    Schema of the structured answer generated by the LLM.
     """
     answer: str = Field(description="Concise natural language response answering the user query.")
     is_compliant: Optional[bool] = Field(description="Explicit compliance status if mentioned in the text. True for compliant, False for non-compliant, None if unknown.")
     confidence: float = Field(description="The maximum similarity score from the vector search.")
     sources: List[Dict[str, str]] = Field(description="List of sources used, each containing 'file' and 'section'.")
 
+class ComplianceResponse(ComplianceAnswer):
+    """
+    Schema for structured compliance response: the LLM's answer plus the retrieval
+    scores attached after the call (not part of the schema the LLM fills).
+    """
+    chunk_scores: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Retrieval score of each context chunk, each containing 'file', 'section' and 'score'.",
+    )
+
+ERROR_ANSWER_PREFIX = "An error occurred during response generation"
+
 SYSTEM_PROMPT = """You are a Lead AI Compliance Engineer. Your task is to answer queries based ONLY on the provided context.
 
 Context:
@@ -27,7 +44,146 @@ Guidelines:
 5. If no context is provided, return a response indicating that the information was not found.
 """
 
-def generate_answer(query: str, context_docs: List[Document], max_confidence: float) -> ComplianceResponse:
+def _build_structured_llm() -> Runnable:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    llm = ChatGoogleGenerativeAI(
+        model=LLM_MODEL_NAME,
+        google_api_key=require_google_api_key(),
+        temperature=0,
+        response_mime_type="application/json",
+    )
+    return llm.with_structured_output(ComplianceAnswer)
+
+def _build_prompt() -> ChatPromptTemplate:
+    return ChatPromptTemplate.from_messages([
+        ("system", SYSTEM_PROMPT),
+        ("human", "{query}")
+    ])
+
+def _build_chain() -> Runnable:
+    """
+    Builds the prompt | structured LLM chain used to answer queries.
+    """
+    # Create the chain with structured output
+    return _build_prompt() | _build_structured_llm()
+
+def _build_stream_chain() -> Runnable:
+    """
+    Builds a chain with the same model and JSON schema as the answer chain, whose output
+    is parsed as partial JSON while tokens arrive: it streams growing dicts instead
+    of one ComplianceAnswer at the end.
+    """
+    structured_llm = _build_structured_llm()
+    # with_structured_output returns (schema-bound model | Pydantic parser); keep the model only
+    return _build_prompt() | structured_llm.first | JsonOutputParser()
+
+def get_chain() -> Runnable:
+    """
+    Returns the process-wide answer chain, building it on first use.
+    """
+    return registry.get("chain", _build_chain)
+
+def get_stream_chain() -> Runnable:
+    """
+    Returns the process-wide streaming answer chain, building it on first use.
+    """
+    return registry.get("stream_chain", _build_stream_chain)
+
+def _split_chain(chain: Runnable) -> Tuple[Runnable, Optional[BaseOutputParser]]:
+    """
+    Splits a prompt | model | output parser chain into (prompt | model, parser) so the
+    LLM call and the JSON parse can be timed separately. Other runnables are returned whole.
+    """
+    steps = getattr(chain, "steps", None)
+    if steps and len(steps) > 1 and isinstance(steps[-1], BaseOutputParser):
+        model = steps[0] if len(steps) == 2 else RunnableSequence(*steps[:-1])
+        return model, steps[-1]
+    return chain, None
+
+def _record_usage(llm_span, output: Any):
+    """
+    Adds the token usage reported by the model (if any) to the LLM call span.
+    """
+    usage = getattr(output, "usage_metadata", None)
+    if usage:
+        llm_span.set(input_tokens=usage.get("input_tokens", 0), output_tokens=usage.get("output_tokens", 0))
+
+def chunk_scores(context_docs: List[Document]) -> List[Dict[str, Any]]:
+    """
+    Retrieval score of each context chunk, as reported in the response.
+    Lexical-only hits have no vector score (None).
+    """
+    return [
+        {"file": doc.metadata.get("source"), "section": doc.metadata.get("section_title"), "score": doc.metadata.get("score")}
+        for doc in context_docs
+    ]
+
+def _to_response(answer: ComplianceAnswer, max_confidence: float, context_docs: List[Document]) -> ComplianceResponse:
+    """
+    Completes the LLM's answer with our verified retrieval scores: the confidence and the chunk scores.
+    """
+    fields = answer.model_dump(include=set(ComplianceAnswer.model_fields))
+    fields["confidence"] = max_confidence
+    return ComplianceResponse(**fields, chunk_scores=chunk_scores(context_docs))
+
+def _not_found_response(max_confidence: float) -> ComplianceResponse:
+    return ComplianceResponse(
+        answer="Information not found. The query did not meet the required grounding threshold or no relevant documents were found.",
+        is_compliant=None,
+        confidence=max_confidence,
+        sources=[]
+    )
+
+def error_response(error: Exception, max_confidence: float) -> ComplianceResponse:
+    """
+    Safe fallback returned when generation fails or times out.
+    """
+    return ComplianceResponse(
+        answer=f"{ERROR_ANSWER_PREFIX}: {str(error) or type(error).__name__}",
+        is_compliant=None,
+        confidence=max_confidence,
+        sources=[]
+    )
+
+def _header(doc: Document) -> str:
+    header = f"Document: {doc.metadata.get('source')} | Section: {doc.metadata.get('section_title')}"
+    # Content shared by several files or sections is retrieved once (see src/dedup.py)
+    others = doc.metadata.get("references", [])[1:]
+    if others:
+        header += " | Also in: " + "; ".join(f"{ref.get('source')} ({ref.get('section_title')})" for ref in others)
+    return header
+
+def build_context(context_docs: List[Document]) -> str:
+    """
+    Formats retrieved documents into the context string of the prompt.
+    """
+    return "\n\n".join([f"--- {_header(doc)} ---\n{doc.page_content}" for doc in context_docs])
+
+def prepare_context(query: str, context_docs: List[Document], verbose: bool = False) -> str:
+    """
+    Packs the retrieved documents into the context token budget (see pack_context)
+    and formats them. In verbose mode the estimated prompt size is printed.
+    """
+    with span("prompt_build") as build_span:
+        packed, stats = pack_context(query, context_docs)
+        context = build_context(packed)
+        prompt_tokens = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(context) + estimate_tokens(query)
+        build_span.set(prompt_tokens=prompt_tokens, chunks=stats["chunks"], kept=stats["kept"])
+    if verbose:
+        print(
+            f"Prompt tokens (est.): {prompt_tokens} "
+            f"(context: {stats['kept']}/{stats['chunks']} chunks, {stats['duplicates']} duplicate(s) dropped, "
+            f"{stats['trimmed']} trimmed)"
+        )
+    return context
+
+def generate_answer(
+    query: str,
+    context_docs: List[Document],
+    max_confidence: float,
+    verbose: bool = False,
+) -> ComplianceResponse:
     """
     Generates a structured answer using Gemini based on retrieved context.
     
@@ -35,51 +191,102 @@ def generate_answer(query: str, context_docs: List[Document], max_confidence: fl
         query: The user query.
         context_docs: List of retrieved documents.
         max_confidence: The maximum similarity score found during retrieval.
+        verbose: Print the estimated prompt token count.
         
     Returns:
         A ComplianceResponse object.
     """
     
     if not context_docs:
-        return ComplianceResponse(
-            answer="Information not found. The query did not meet the required grounding threshold or no relevant documents were found.",
-            is_compliant=None,
-            confidence=max_confidence,
-            sources=[]
-        )
+        return _not_found_response(max_confidence)
 
-    llm = ChatGoogleGenerativeAI(
-        model=LLM_MODEL_NAME,
-        google_api_key=GOOGLE_API_KEY,
-        temperature=0,
-        response_mime_type="application/json",
-    )
-    
-    # Prepare context string
-    context_str = "\n\n".join([
-        f"--- Document: {doc.metadata.get('source')} | Section: {doc.metadata.get('section_title')} ---\n{doc.page_content}"
-        for doc in context_docs
-    ])
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", SYSTEM_PROMPT),
-        ("human", "{query}")
-    ])
-    
-    # Create the chain with structured output
-    structured_llm = llm.with_structured_output(ComplianceResponse)
-    chain = prompt | structured_llm
+    chain = get_chain()
     
     try:
-        response = chain.invoke({"context": context_str, "query": query})
-        # Override the confidence with our verified retrieval score
-        response.confidence = max_confidence
-        return response
+        inputs = {"context": prepare_context(query, context_docs, verbose), "query": query}
+        model, parser = _split_chain(chain)
+        with span("llm_call") as llm_span:
+            response = model.invoke(inputs)
+            _record_usage(llm_span, response)
+        if parser is not None:
+            with span("json_parse"):
+                response = parser.invoke(response)
+        return _to_response(response, max_confidence, context_docs)
     except Exception as e:
         # Fallback if parsing or generation fails
-        return ComplianceResponse(
-            answer=f"An error occurred during response generation: {str(e)}",
-            is_compliant=None,
-            confidence=max_confidence,
-            sources=[]
-        )
+        return error_response(e, max_confidence)
+
+async def agenerate_answer(
+    query: str,
+    context_docs: List[Document],
+    max_confidence: float,
+    verbose: bool = False,
+) -> ComplianceResponse:
+    """
+    Async version of generate_answer. The LLM call does not block the event loop,
+    so many answers can be in flight at once.
+    """
+    if not context_docs:
+        return _not_found_response(max_confidence)
+
+    chain = get_chain()
+
+    try:
+        inputs = {"context": prepare_context(query, context_docs, verbose), "query": query}
+        model, parser = _split_chain(chain)
+        with span("llm_call") as llm_span:
+            response = await model.ainvoke(inputs)
+            _record_usage(llm_span, response)
+        if parser is not None:
+            with span("json_parse"):
+                response = await parser.ainvoke(response)
+        return _to_response(response, max_confidence, context_docs)
+    except Exception as e:
+        return error_response(e, max_confidence)
+
+async def astream_answer(
+    query: str,
+    context_docs: List[Document],
+    max_confidence: float,
+    on_token: Callable[[str], None],
+    verbose: bool = False,
+) -> ComplianceResponse:
+    """
+    Streaming version of agenerate_answer: `on_token` is called with each new piece
+    of the answer text as it arrives; the complete response (status, sources) is
+    returned once the structured output is complete.
+
+    Args:
+        query: The user query.
+        context_docs: List of retrieved documents.
+        max_confidence: The maximum similarity score found during retrieval.
+        on_token: Called with every new fragment of the `answer` field.
+        verbose: Print the estimated prompt token count.
+
+    Returns:
+        A ComplianceResponse object. Failures return a safe error response; whatever
+        was streamed before the failure is not retracted.
+    """
+    if not context_docs:
+        return _not_found_response(max_confidence)
+
+    chain = get_stream_chain()
+
+    streamed = ""
+    partial: Dict = {}
+    try:
+        inputs = {"context": prepare_context(query, context_docs, verbose), "query": query}
+        with span("llm_call", streamed=1) as llm_span:
+            start = time.perf_counter()
+            async for partial in chain.astream(inputs):
+                answer = partial.get("answer") if isinstance(partial, dict) else None
+                if isinstance(answer, str) and answer.startswith(streamed) and len(answer) > len(streamed):
+                    if not streamed:
+                        llm_span.set(first_token_ms=round((time.perf_counter() - start) * 1000, 1))
+                    on_token(answer[len(streamed):])
+                    streamed = answer
+        with span("json_parse"):
+            response = ComplianceAnswer.model_validate(partial)
+        return _to_response(response, max_confidence, context_docs)
+    except Exception as e:
+        return error_response(e, max_confidence)
@@ -1,85 +1,729 @@
-import os
-import shutil
+import json
+import time
+import random
+import tempfile
+import threading
+import collections
+import contextvars
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
-from typing import List
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_chroma import Chroma
+from typing import TYPE_CHECKING, List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
 from langchain_core.documents import Document
-from src.parser import ingest_fmd_pdf, ingest_reach_pdf, ingest_parts_html
-from src.config import DATA_DIR, CHROMA_DIR, GOOGLE_API_KEY, EMBEDDING_MODEL_NAME
+from langchain_core.embeddings import Embeddings
+from src.parser import PARSER_VERSION, parse_file, load_converters, is_supported
+from src.config import (
+    PARSE_WORKERS, PARSE_TIMEOUT,
+    EMBED_BATCH_SIZE, EMBED_CONCURRENCY, EMBED_RATE_LIMIT, EMBED_MAX_RETRIES, DEDUP_ENABLED,
+)
+from src.manifest import load_manifest, save_manifest, file_hash, content_hash, iter_chunk_ids, clear_database
+from src.parse_cache import get_parse_cache, parse_cache_counts
+from src.storage import storage_paths
+from src.tracing import tracer, span, traced
+from src.context_budget import estimate_tokens
+from src.answer_cache import invalidate_cached_answers
+from src.lexical import get_lexical_index
+from src.table_index import get_table_index
+from src.dedup import SharedChunks, fingerprint, get_duplicate_index
+from src.retriever import get_vectorstore, get_embeddings, embedding_cache_stats, embedding_model_id
+from src.vector_index import compact_index, index_drift
+
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Extra wall-clock seconds a parser process gets past PARSE_TIMEOUT before it is killed
+PARSE_KILL_GRACE = 10.0
 
 def is_ingested() -> bool:
     """
-    Checks if ChromaDB contains data by looking for the existance of the CHROMA_DIR.
+    Checks if ChromaDB contains data by looking for a non-empty ingestion manifest.
     """
-    return CHROMA_DIR.exists() and any(CHROMA_DIR.iterdir())
+    manifest_path = storage_paths().manifest_path
+    return manifest_path.exists() and bool(load_manifest(manifest_path)["files"])
 
-def clear_database():
+def iter_documents(chunks: Iterable[Dict[str, Any]]) -> Iterator[Document]:
     """
-    Deletes the ChromaDB directory.
+    Converts parser chunks into Documents with deterministic IDs, a content hash and a
+    near-duplicate fingerprint in the metadata, one chunk at a time.
+    """
+    for chunk_id, chunk in iter_chunk_ids(chunks):
+        yield Document(
+            id=chunk_id,
+            page_content=chunk["content"],
+            metadata={
+                **chunk["metadata"],
+                "content_hash": content_hash(chunk["content"]),
+                "fingerprint": fingerprint(chunk["content"]),
+            }
+        )
+
+def chunks_to_documents(chunks: List[Dict[str, Any]]) -> List[Document]:
+    """
+    Converts parser chunks into Documents (see iter_documents).
+    """
+    return list(iter_documents(chunks))
+
+def _spool_chunks(path: Path, timeout: Optional[float], spool_path: Path) -> Dict[str, int]:
     """
-    if CHROMA_DIR.exists():
-        print(f"Clearing database at {CHROMA_DIR}...")
-        shutil.rmtree(CHROMA_DIR)
-        print("Database cleared.")
-    else:
-        print("Database directory does not exist. Nothing to clear.")
+    Parses a file into a JSON Lines spool file, one chunk per line.
+    Chunks are written as the parser yields them, so no process holds a whole file's chunks.
+
+    Returns:
+        The number of chunks and the parse cache hits and misses of this file
+        (counted here because the parse may run in a worker process).
+    """
+    before = parse_cache_counts()
+    with span("parse", file=path.name) as parse_span:
+        count = 0
+        with open(spool_path, "w", encoding="utf-8") as f:
+            for chunk in parse_file(path, timeout):
+                f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+                count += 1
+        parse_span.set(chunks=count)
+    after = parse_cache_counts()
+    return {
+        "chunks": count,
+        "cache_hits": after["hits"] - before["hits"],
+        "cache_misses": after["misses"] - before["misses"],
+    }
+
+def _spool_chunks_collecting(path: Path, timeout: Optional[float], spool_path: Path) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """
+    Worker process entry point when tracing: returns the parse counts and the spans recorded while parsing.
+    """
+    return tracer.collect(_spool_chunks, path, timeout, spool_path)
+
+def _read_spool(spool_path: Path) -> Iterator[Dict[str, Any]]:
+    try:
+        with open(spool_path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+    finally:
+        spool_path.unlink(missing_ok=True)
 
-def ingest_data(verbose: bool = True):
+def _terminate_pool(executor: ProcessPoolExecutor):
     """
-    Orchestrates the ingestion of all files in the DATA_DIR into ChromaDB.
-    Uses specific ingestion functions for each file type/name.
+    Stops a process pool without waiting for its running tasks, which may be stuck in C code
+    that SIGALRM cannot interrupt.
+    """
+    processes = list((executor._processes or {}).values())
+    for process in processes:
+        process.terminate()
+    executor.shutdown(wait=True, cancel_futures=True)
+    for process in processes:
+        process.join()
+
+def parse_files(
+    paths: Iterable[Path],
+    workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+    stats: Optional[Dict[str, int]] = None,
+) -> Iterator[Tuple[Path, Iterator[Dict[str, Any]], Optional[str]]]:
+    """
+    Parses files across a process pool and yields results as each file finishes,
+    so downstream stages can start before the whole corpus is parsed.
+
+    Each file is parsed into a spool file on disk (in its worker process, or in-process
+    with one worker) and its chunks are streamed back from there, so memory stays flat
+    however large the file, and a file failing halfway never yields partial output.
+
+    Args:
+        paths: Files to parse (each must have a registered parser).
+        workers: Number of parser processes. Defaults to PARSE_WORKERS; 1 parses in-process.
+        timeout: Per-file time budget in seconds. Defaults to PARSE_TIMEOUT. Parser processes
+            still running PARSE_KILL_GRACE seconds past it (e.g. stuck in C code that the
+            in-worker alarm cannot interrupt) are killed and the pool is replaced.
+        stats: Optional dict in which the parse cache "cache_hits" and "cache_misses" are counted.
+
+    Yields:
+        (path, chunks, error) tuples, where chunks iterates over the file's chunks and must
+        be consumed before the next tuple is requested (its spool is deleted afterwards).
+        On failure chunks is empty and error describes the problem; one failing file
+        never aborts the others.
+    """
+    paths = list(paths)
+    workers = PARSE_WORKERS if workers is None else workers
+    timeout = PARSE_TIMEOUT if timeout is None else timeout
+    workers = max(1, min(workers, len(paths)))
+
+    def count(result: Dict[str, int]):
+        if stats is not None:
+            for name in ("cache_hits", "cache_misses"):
+                stats[name] = stats.get(name, 0) + result[name]
+
+    with tempfile.TemporaryDirectory(prefix="rag-parse-") as spool_dir:
+        spools = {path: Path(spool_dir) / f"{i}.jsonl" for i, path in enumerate(paths)}
+
+        if workers == 1:
+            for path in paths:
+                try:
+                    count(_spool_chunks(path, timeout, spools[path]))
+                except Exception as e:
+                    spools[path].unlink(missing_ok=True)
+                    yield path, iter([]), f"{type(e).__name__}: {e}"
+                    continue
+                yield path, _read_spool(spools[path]), None
+            return
+
+        # Imported once here so forked workers inherit the libraries instead of each importing them
+        load_converters()
+        collect_spans = tracer.enabled
+        task = _spool_chunks_collecting if collect_spans else _spool_chunks
+        pending = collections.deque(paths)
+        # At most one file per worker is in flight, so a file's deadline runs from when it starts
+        running: Dict[Future, Tuple[Path, float]] = {}
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            while pending or running:
+                while pending and len(running) < workers:
+                    path = pending.popleft()
+                    deadline = time.monotonic() + timeout + PARSE_KILL_GRACE if timeout > 0 else float("inf")
+                    running[executor.submit(task, path, timeout, spools[path])] = (path, deadline)
+
+                next_deadline = min(deadline for _, deadline in running.values())
+                wait_seconds = None if next_deadline == float("inf") else max(next_deadline - time.monotonic(), 0)
+                done, _ = wait(running, timeout=wait_seconds, return_when=FIRST_COMPLETED)
+
+                if not done:
+                    # A worker is stuck past its budget: replace the pool, failing the expired
+                    # files and parsing the others it was running again
+                    _terminate_pool(executor)
+                    executor = ProcessPoolExecutor(max_workers=workers)
+                    now = time.monotonic()
+                    for path, deadline in running.values():
+                        if deadline > now:
+                            pending.appendleft(path)
+                            continue
+                        spools[path].unlink(missing_ok=True)
+                        yield path, iter([]), f"ParseTimeoutError: exceeded the {timeout:g}s parsing budget (parser process killed)"
+                    running.clear()
+                    continue
+
+                for future in done:
+                    path, _ = running.pop(future)
+                    try:
+                        result = future.result()
+                        if collect_spans:
+                            result, spans = result
+                            tracer.adopt(spans)
+                        count(result)
+                    except Exception as e:
+                        spools[path].unlink(missing_ok=True)
+                        yield path, iter([]), f"{type(e).__name__}: {e}"
+                        continue
+                    yield path, _read_spool(spools[path]), None
+        finally:
+            # Left with running tasks when the consumer stops early or fails
+            if running:
+                _terminate_pool(executor)
+            else:
+                executor.shutdown()
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `acquire(n)` blocks until n tokens are available.
+
+    Args:
+        rate: Tokens added per second. A rate <= 0 disables limiting.
+        capacity: Maximum burst size. Defaults to one second worth of tokens.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        if self.rate <= 0:
+            return
+        # Requests larger than the bucket wait for a full bucket instead of forever
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_seconds = (tokens - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether an embedding error is transient (throttling or server side), looking
+    through wrapped exceptions for an HTTP-like status code.
+    """
+    while error is not None:
+        code = getattr(error, "code", None) or getattr(error, "status_code", None)
+        if isinstance(code, int) and code in RETRYABLE_STATUS_CODES:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+class EmbeddingStage:
+    """
+    Embeds documents in fixed-size batches and commits each batch to Chroma.
+
+    - Up to `concurrency` batches are embedded at once in worker threads.
+    - Every call goes through a token bucket limiting texts per second.
+    - Throttled (429) and 5xx errors are retried with exponential backoff and jitter.
+    - Each batch is upserted as soon as it is embedded and reported through
+      `on_commit`, so an interrupted run keeps every committed batch.
+
+    Use as a context manager: `submit()` documents, then `flush()`.
+
+    Args:
+        embeddings: Embedding model.
+        vectorstore: Target Chroma store.
+        on_commit: Called in the submitting thread with each committed batch.
+        batch_size: Documents per embedding call. Defaults to EMBED_BATCH_SIZE.
+        concurrency: Batches embedded in parallel. Defaults to EMBED_CONCURRENCY.
+        rate_limit: Texts per second (0 disables). Defaults to EMBED_RATE_LIMIT.
+        max_retries: Retries per batch on transient errors. Defaults to EMBED_MAX_RETRIES.
+        backoff: Base delay in seconds of the exponential backoff.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        vectorstore: "Chroma",
+        on_commit: Optional[Callable[[List[Document]], None]] = None,
+        batch_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        rate_limit: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        backoff: float = 1.0,
+    ):
+        self.embeddings = embeddings
+        self.vectorstore = vectorstore
+        self.on_commit = on_commit
+        self.batch_size = max(1, batch_size if batch_size is not None else EMBED_BATCH_SIZE)
+        self.concurrency = max(1, concurrency if concurrency is not None else EMBED_CONCURRENCY)
+        self.max_retries = max_retries if max_retries is not None else EMBED_MAX_RETRIES
+        self.backoff = backoff
+        self.limiter = TokenBucket(rate_limit if rate_limit is not None else EMBED_RATE_LIMIT)
+        self.stats = {"batches": 0, "chunks": 0, "retries": 0}
+
+        self._pending: List[Document] = []
+        self._in_flight: Dict[Any, List[Document]] = {}
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embed")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, docs: Iterable[Document]):
+        """
+        Queues documents, dispatching every full batch.
+        Blocks while too many batches are in flight (backpressure on the parse stage).
+        """
+        self._pending.extend(docs)
+        while len(self._pending) >= self.batch_size:
+            batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            self._dispatch(batch)
+
+    def flush(self):
+        """
+        Dispatches the last partial batch and waits until everything is committed.
+        """
+        if self._pending:
+            batch, self._pending = self._pending, []
+            self._dispatch(batch)
+        while self._in_flight:
+            self._drain()
+
+    def _dispatch(self, batch: List[Document]):
+        while len(self._in_flight) >= self.concurrency * 2:
+            self._drain()
+        # The copied context makes the batch's span a child of the current (ingestion) span
+        future = self._executor.submit(
+            contextvars.copy_context().run, self._embed_batch, [doc.page_content for doc in batch]
+        )
+        self._in_flight[future] = batch
+
+    def _drain(self):
+        """
+        Commits every finished batch; re-raises the first failure after committing the others.
+        """
+        done, _ = wait(self._in_flight, return_when=FIRST_COMPLETED)
+        error = None
+        for future in done:
+            batch = self._in_flight.pop(future)
+            try:
+                vectors = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            self._commit(batch, vectors)
+        if error is not None:
+            raise error
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        with span("embed", texts=len(texts), tokens=sum(estimate_tokens(text) for text in texts)) as embed_span:
+            attempt = 0
+            while True:
+                self.limiter.acquire(len(texts))
+                try:
+                    return self.embeddings.embed_documents(texts)
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        raise
+                    delay = self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+                    attempt += 1
+                    embed_span.add(retries=1)
+                    with self._stats_lock:
+                        self.stats["retries"] += 1
+                    time.sleep(delay)
+
+    def _commit(self, batch: List[Document], vectors: List[List[float]]):
+        if vectors:
+            self.stats.setdefault("dimensions", len(vectors[0]))
+        with span("chroma_upsert", chunks=len(batch)):
+            self.vectorstore._collection.upsert(
+                ids=[doc.id for doc in batch],
+                embeddings=vectors,
+                documents=[doc.page_content for doc in batch],
+                metadatas=[doc.metadata for doc in batch],
+            )
+        self.stats["batches"] += 1
+        self.stats["chunks"] += len(batch)
+        if self.on_commit is not None:
+            self.on_commit(batch)
+
+def sync_side_indexes(manifest: Dict[str, Any], verbose: bool = True):
+    """
+    Makes the BM25 index, the table row index and the duplicate index match the stored
+    chunks recorded in the manifest and saves them. Chunks missing from an index (e.g. after an interrupted
+    run, or for a database built before the index existed) are loaded from Chroma
+    without re-embedding.
+    """
+    with span("index_sync"):
+        _sync_side_indexes(manifest, verbose)
+
+def _sync_side_indexes(manifest: Dict[str, Any], verbose: bool):
+    # Chunks stored once for identical content have no record of their own (see SharedChunks)
+    aliases = manifest.get("duplicates", {})
+    expected = {chunk_id for entry in manifest["files"].values() for chunk_id in entry["chunks"] if chunk_id not in aliases}
+    duplicate_index = get_duplicate_index()
+    duplicate_index.set_references(aliases)
+    for name, index in (("lexical", get_lexical_index()), ("table row", get_table_index()), ("duplicate", duplicate_index)):
+        indexed = index.ids()
+        index.remove(indexed - expected)
+        missing = sorted(expected - indexed)
+        if missing:
+            if verbose:
+                print(f"Adding {len(missing)} chunk(s) to the {name} index...")
+            vectorstore = get_vectorstore()
+            for start in range(0, len(missing), 1000):
+                data = vectorstore.get(ids=missing[start:start + 1000], include=["documents", "metadatas"])
+                index.add(
+                    Document(id=chunk_id, page_content=text, metadata=metadata or {})
+                    for chunk_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+                )
+
+        if index.dirty:
+            index.save()
+
+@traced("ingest")
+def ingest_data(
+    verbose: bool = True,
+    workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, int]:
+    """
+    Incrementally synchronizes the files of the data directory into ChromaDB
+    (DATA_DIR and CHROMA_DIR unless redirected, see src/storage.py).
+
+    A manifest of file and chunk content hashes is kept next to the database:
+    - unchanged files are not parsed again,
+    - only new or changed chunks are embedded and upserted,
+    - chunks of removed files (or removed sections) are deleted,
+    - chunks identical to a stored chunk are recorded as references to it rather than
+      stored and embedded again (see SharedChunks); near-duplicates are counted.
+
+    Changed files are parsed in parallel (see parse_files) and their chunks are
+    streamed into the batched embedding stage (see EmbeddingStage), which commits
+    to Chroma batch by batch. No stage holds a whole file's chunks, so peak memory
+    does not grow with the size of the files or of the corpus. A file that fails or times out is reported and
+    retried on the next run; its previously ingested chunks are kept. If embedding
+    fails, every committed batch is kept and the next run resumes from there.
+
+    Args:
+        verbose: Print progress and the final summary.
+        workers: Number of parser processes. Defaults to PARSE_WORKERS.
+        timeout: Per-file parsing time budget in seconds. Defaults to PARSE_TIMEOUT.
+
+    Returns:
+        Counts of added, updated, deleted, skipped, deduplicated (stored once) chunks and failed files.
     """
     def vprint(*args, **kwargs):
         if verbose:
             print(*args, **kwargs)
 
-    if not DATA_DIR.exists():
-        vprint(f"Data directory {DATA_DIR} does not exist.")
-        return
+    summary = {"added": 0, "updated": 0, "deleted": 0, "skipped": 0, "deduplicated": 0, "failed": 0}
+    paths = storage_paths()
+    data_dir, chroma_dir, manifest_path = paths.data_dir, paths.chroma_dir, paths.manifest_path
 
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model=EMBEDDING_MODEL_NAME,
-        google_api_key=GOOGLE_API_KEY
-    )
+    if not data_dir.exists():
+        vprint(f"Data directory {data_dir} does not exist.")
+        return summary
 
-    all_docs = []
+    if not manifest_path.exists() and chroma_dir.exists() and any(chroma_dir.iterdir()):
+        # Database built before manifests existed: its chunk IDs are unknown, rebuild it once.
+        vprint("No ingestion manifest found for existing database. Rebuilding it.")
+        clear_database(chroma_dir)
 
-    for file_path in DATA_DIR.iterdir():
-        if file_path.is_file():
-            vprint(f"Processing {file_path.name}...")
-            chunks = []
-            
-            if file_path.name == "FMD_Test_Corporation.pdf":
-                chunks = ingest_fmd_pdf(file_path)
-            elif file_path.name == "REACH_Certificate_of_Compliance_Test_Corporation.pdf":
-                chunks = ingest_reach_pdf(file_path)
-            elif file_path.name == "part_measurements_test_corporation.html":
-                chunks = ingest_parts_html(file_path)
+    manifest = load_manifest(manifest_path)
+    model_id = embedding_model_id()
+    if manifest.get("embedding_model", model_id) != model_id:
+        # Vectors of different embedding models cannot share a collection
+        vprint(f"Embedding model changed ({manifest['embedding_model']} -> {model_id}). Rebuilding the index.")
+        clear_database(chroma_dir)
+        manifest = load_manifest(manifest_path)
+    elif manifest["files"] and manifest.get("parser_version", 1) != PARSER_VERSION:
+        # Chunks of an older parser lack metadata the retriever relies on
+        vprint("Parser output changed. Rebuilding the index.")
+        clear_database(chroma_dir)
+        manifest = load_manifest(manifest_path)
+    elif manifest["files"]:
+        drift = index_drift(chroma_dir)
+        if drift:
+            # Metric and HNSW build parameters are fixed per index: rebuild it from the stored embeddings
+            changes = ", ".join(f"{name} {current} -> {configured}" for name, (current, configured) in drift.items())
+            vprint(f"Vector index parameters changed ({changes}). Rebuilding the index without re-embedding...")
+            compact_index(chroma_dir)
+    manifest["embedding_model"] = model_id
+    manifest["parser_version"] = PARSER_VERSION
+    files = manifest["files"]
+    present = set()
+    digests = {}
+
+    for file_path in sorted(data_dir.iterdir()):
+        if not file_path.is_file():
+            continue
+
+        if not is_supported(file_path):
+            vprint(f"Skipping unsupported file: {file_path.name}")
+            continue
+
+        present.add(file_path.name)
+        digest = file_hash(file_path)
+        entry = files.get(file_path.name)
+        if entry is not None and entry["hash"] == digest:
+            summary["skipped"] += len(entry["chunks"])
+            continue
+        digests[file_path] = digest
+
+    if digests:
+        vprint(f"Parsing {len(digests)} changed file(s)...")
+
+    # Files whose chunks are still being parsed or embedded: name -> file hash, IDs not yet
+    # committed and whether the whole file has been read
+    in_progress: Dict[str, Dict[str, Any]] = {}
+
+    lexical_index = get_lexical_index()
+    table_index = get_table_index()
+    duplicate_index = get_duplicate_index()
+    shared = SharedChunks(manifest)
+    # Text of the chunks stored once rather than again, and new chunks with a near-duplicate
+    savings = {"bytes": 0, "near_duplicates": 0}
+
+    def hand_over(chunks: Dict[str, str]):
+        """
+        Stored chunks (ID -> content hash) whose record is about to be deleted or overwritten
+        may hold the content of aliases: the first alias of each takes the record over, with
+        the stored embedding and its own metadata, so nothing is embedded again.
+        """
+        for chunk_id, digest in chunks.items():
+            promoted = shared.promote(chunk_id)
+            shared.unstore(chunk_id, digest)
+            if promoted is None:
+                continue
+            alias_id, metadata = promoted
+            collection = get_vectorstore()._collection
+            data = collection.get(ids=[chunk_id], include=["embeddings", "documents"])
+            if not data["ids"]:
+                # Never committed (interrupted run): the alias's file is parsed again on the next run
+                entry = files.get(metadata["source"])
+                if entry is not None:
+                    entry["chunks"].pop(alias_id, None)
+                    entry["hash"] = None
+                continue
+            collection.upsert(ids=[alias_id], embeddings=data["embeddings"], documents=data["documents"], metadatas=[metadata])
+            doc = Document(id=alias_id, page_content=data["documents"][0], metadata=metadata)
+            lexical_index.add([doc])
+            table_index.add([doc])
+            duplicate_index.add([doc])
+            invalidate_cached_answers([alias_id])
+
+    def delete_records(chunk_ids: List[str]):
+        if chunk_ids:
+            get_vectorstore().delete(ids=chunk_ids)
+            lexical_index.remove(chunk_ids)
+            table_index.remove(chunk_ids)
+            duplicate_index.remove(chunk_ids)
+            invalidate_cached_answers(chunk_ids)
+
+    def remove_chunks(chunks: Dict[str, str]):
+        """
+        Removes chunks (ID -> content hash): aliases are dropped, stored chunks are handed
+        over to one of their aliases (see hand_over) or deleted.
+        """
+        stored = {}
+        for chunk_id, digest in chunks.items():
+            if shared.is_alias(chunk_id):
+                invalidate_cached_answers([shared.remove_alias(chunk_id)])
             else:
-                vprint(f"Skipping unknown file: {file_path.name}")
+                stored[chunk_id] = digest
+        hand_over(stored)
+        delete_records(list(stored))
+
+    def mark_ingested(name: str):
+        state = in_progress[name]
+        if state["parsed"] and not state["remaining"]:
+            # Only mark the file as ingested once all of its chunks are committed
+            files[name]["hash"] = in_progress.pop(name)["hash"]
+
+    def on_commit(batch: List[Document]):
+        invalidate_cached_answers(doc.id for doc in batch)
+        lexical_index.add(batch)
+        table_index.add(batch)
+        for doc in batch:
+            name = doc.metadata["source"]
+            files[name]["chunks"][doc.id] = doc.metadata["content_hash"]
+            in_progress[name]["remaining"].discard(doc.id)
+        for name in {doc.metadata["source"] for doc in batch}:
+            mark_ingested(name)
+        save_manifest(manifest, manifest_path)
+        vprint(f"Committed {stage.stats['chunks']} chunk(s) in {stage.stats['batches']} batch(es)...")
+
+    vectorstore = get_vectorstore() if digests else None
+    embeddings = get_embeddings() if digests else None
+
+    parse_stats: Dict[str, int] = {}
+    with EmbeddingStage(embeddings, vectorstore, on_commit=on_commit) as stage:
+        for file_path, chunks, error in parse_files(digests, workers, timeout, parse_stats):
+            if error is not None:
+                print(f"Failed to parse {file_path.name}: {error}")
+                summary["failed"] += 1
                 continue
-            
-            for chunk in chunks:
-                all_docs.append(Document(
-                    page_content=chunk["content"],
-                    metadata=chunk["metadata"]
-                ))
-
-    if not all_docs:
-        vprint("No documents found to ingest.")
-        return
-
-    vprint(f"Ingesting {len(all_docs)} chunks into ChromaDB at {CHROMA_DIR}...")
-    
-    # Initialize Chroma vector store
-    vectorstore = Chroma.from_documents(
-        documents=all_docs,
-        embedding=embeddings,
-        persist_directory=str(CHROMA_DIR)
+
+            vprint(f"Processing {file_path.name}...")
+            name = file_path.name
+            entry = files.get(name)
+            old_chunks = entry["chunks"] if entry is not None else {}
+            # Previous chunks stay recorded (they are still in Chroma) until the file is read to
+            # the end; changed ones are recorded as their batches commit. The file hash is left
+            # unset until then so an interrupted run re-parses the file.
+            files[name] = {"hash": None, "chunks": dict(old_chunks)}
+            state = in_progress[name] = {"hash": digests[file_path], "remaining": set(), "parsed": False}
+
+            # Chunks stream from the parser into the embedding stage in batches; only their IDs are kept
+            new_ids = set()
+            retired = []
+            changed: List[Document] = []
+            for doc in iter_documents(chunks):
+                new_ids.add(doc.id)
+                digest = doc.metadata["content_hash"]
+                previous = old_chunks.get(doc.id)
+                if previous == digest:
+                    summary["skipped"] += 1
+                    continue
+                summary["added" if previous is None else "updated"] += 1
+                was_stored = previous is not None and not shared.is_alias(doc.id)
+                if was_stored:
+                    hand_over({doc.id: previous})
+                elif previous is not None:
+                    invalidate_cached_answers([shared.remove_alias(doc.id)])
+
+                stored_id = shared.find(digest) if DEDUP_ENABLED else None
+                if stored_id is not None and stored_id != doc.id:
+                    # Identical to a stored chunk: recorded as a reference to it, neither stored nor embedded
+                    shared.add_alias(doc, stored_id)
+                    files[name]["chunks"][doc.id] = digest
+                    invalidate_cached_answers([stored_id])
+                    summary["deduplicated"] += 1
+                    savings["bytes"] += len(doc.page_content.encode("utf-8"))
+                    if was_stored:
+                        retired.append(doc.id)
+                    continue
+
+                shared.store(doc.id, digest)
+                if duplicate_index.near_duplicates(doc.metadata["fingerprint"], exclude=doc.id):
+                    savings["near_duplicates"] += 1
+                duplicate_index.add([doc])
+                state["remaining"].add(doc.id)
+                changed.append(doc)
+                if len(changed) >= stage.batch_size:
+                    stage.submit(changed)
+                    changed = []
+            stage.submit(changed)
+            delete_records(retired)
+
+            stale = {chunk_id: digest for chunk_id, digest in old_chunks.items() if chunk_id not in new_ids}
+            if stale:
+                remove_chunks(stale)
+                summary["deleted"] += len(stale)
+                for chunk_id in stale:
+                    files[name]["chunks"].pop(chunk_id, None)
+
+            state["parsed"] = True
+            mark_ingested(name)
+            save_manifest(manifest, manifest_path)
+
+        stage.flush()
+
+    for name in [name for name in files if name not in present]:
+        vprint(f"Removing chunks of deleted file {name}...")
+        stale = files.pop(name)["chunks"]
+        if stale:
+            remove_chunks(stale)
+            summary["deleted"] += len(stale)
+        save_manifest(manifest, manifest_path)
+
+    sync_side_indexes(manifest, verbose)
+
+    tracer.current().set(**summary, near_duplicates=savings["near_duplicates"])
+    if digests and get_parse_cache() is not None:
+        vprint(f"Parse cache: {parse_stats.get('cache_hits', 0)} hits, {parse_stats.get('cache_misses', 0)} misses")
+    cache_stats = embedding_cache_stats()
+    if cache_stats is not None and digests:
+        vprint(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    if summary["deduplicated"] or savings["near_duplicates"]:
+        vector_bytes = summary["deduplicated"] * stage.stats.get("dimensions", 0) * 4
+        vprint(
+            f"Deduplication: {summary['deduplicated']} identical chunk(s) stored once "
+            f"({summary['deduplicated']} embeddings and {(savings['bytes'] + vector_bytes) / 1024:.1f} KB saved), "
+            f"{savings['near_duplicates']} near-duplicate(s) merged at retrieval; "
+            f"{len(shared.aliases)} of {sum(len(entry['chunks']) for entry in files.values())} chunks share a stored copy"
+        )
+    vprint(
+        f"Ingestion complete. Added: {summary['added']}, Updated: {summary['updated']}, "
+        f"Deleted: {summary['deleted']}, Skipped: {summary['skipped']}, Deduplicated: {summary['deduplicated']}, "
+        f"Failed files: {summary['failed']}"
     )
-    
-    vprint("Ingestion complete.")
+    return summary
+
+def main():
+    """
+    Runs one ingestion from the command line. With --json the progress output is off and
+    the summary is printed as JSON on the last line of stdout (the HTTP server's /ingest
+    runs ingestion this way, in a child process).
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Synchronize the data directory into ChromaDB.")
+    parser.add_argument("--json", action="store_true", help="Print only the summary, as JSON.")
+    args = parser.parse_args()
+    summary = ingest_data(verbose=not args.json)
+    if args.json:
+        print(json.dumps(summary))
 
 if __name__ == "__main__":
-    ingest_data()
+    main()
@@ -0,0 +1,176 @@
+import re
+import json
+import math
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from langchain_core.documents import Document
+from src.storage import storage_paths
+from src.resources import registry
+
+# Keeps identifiers such as part numbers (TC-3541-A) and CAS numbers (7439-92-1) as single tokens
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+# Tokens treated as exact identifiers:
+# - CAS numbers: 2-7 digits, 2 digits and a check digit (7439-92-1)
+# - part and document numbers: letters and digits in three or more segments (TC-3541-A, TC-QSP-17)
+# - lot numbers: a prefix and one code mixing letters and digits (LOT-7Q1D2K9Z)
+# Dates (2023-01-15), regulation and standard numbers (1907-2006, rohs-2, ipc-1752) are not identifiers.
+IDENTIFIER_RE = re.compile(
+    r"^(?:\d{2,7}-\d{2}-\d"
+    r"|(?=[a-z0-9-]*[a-z])(?=[a-z0-9-]*\d)[a-z0-9]+(?:-[a-z0-9]+){2,}"
+    r"|[a-z0-9]+-(?=[a-z0-9]*[a-z])(?=[a-z0-9]*\d)[a-z0-9]+)$"
+)
+
+INDEX_VERSION = 1
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+def extract_identifiers(text: str) -> List[str]:
+    """
+    Returns the identifier-like tokens (part numbers, CAS numbers) of a text.
+    """
+    return [token for token in dict.fromkeys(tokenize(text)) if IDENTIFIER_RE.match(token)]
+
+class LexicalIndex:
+    """
+    Compact in-process inverted index with BM25 scoring.
+
+    Only term frequencies are stored (document text stays in Chroma), and the
+    index is persisted as JSON next to the vector store.
+
+    Args:
+        path: JSON file the index is loaded from and saved to.
+        k1, b: BM25 parameters.
+    """
+
+    def __init__(self, path: Optional[Path] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, Dict[str, int]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._total_len = 0
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: Path) -> "LexicalIndex":
+        """
+        Loads the index from `path`; returns an empty index if the file is missing or outdated.
+        """
+        index = cls(path)
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                for doc_id, terms in data["docs"].items():
+                    index._add_terms(doc_id, terms)
+        return index
+
+    def save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "docs": self._doc_terms}, f, separators=(",", ":"))
+        tmp_path.replace(self.path)
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def ids(self) -> Set[str]:
+        return set(self._doc_terms)
+
+    def _add_terms(self, doc_id: str, terms: Dict[str, int]):
+        self._doc_terms[doc_id] = terms
+        length = sum(terms.values())
+        self._doc_len[doc_id] = length
+        self._total_len += length
+        for term, count in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = count
+
+    def add(self, docs: Iterable[Document]):
+        """
+        Indexes (or re-indexes) documents by their ID.
+        """
+        for doc in docs:
+            self.remove([doc.id])
+            terms: Dict[str, int] = {}
+            for token in tokenize(doc.page_content):
+                terms[token] = terms.get(token, 0) + 1
+            self._add_terms(doc.id, terms)
+            self.dirty = True
+
+    def remove(self, doc_ids: Iterable[str]):
+        for doc_id in doc_ids:
+            terms = self._doc_terms.pop(doc_id, None)
+            if terms is None:
+                continue
+            self._total_len -= self._doc_len.pop(doc_id)
+            for term in terms:
+                posting = self._postings[term]
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self._postings[term]
+            self.dirty = True
+
+    def search(self, query: str, k: int = 5, require: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Ranks documents against the query with BM25.
+
+        Args:
+            query: Query text.
+            k: Number of results.
+            require: Tokens every returned document must contain (e.g. identifiers).
+
+        Returns:
+            (document ID, BM25 score) pairs, best first.
+        """
+        if not self._doc_terms:
+            return []
+
+        terms = list(dict.fromkeys(tokenize(query)))
+        if require:
+            candidates = None
+            for token in require:
+                posting = set(self._postings.get(token, ()))
+                candidates = posting if candidates is None else candidates & posting
+            if not candidates:
+                return []
+        else:
+            candidates = set()
+            for term in terms:
+                candidates.update(self._postings.get(term, ()))
+
+        n_docs = len(self._doc_terms)
+        avg_len = self._total_len / n_docs if n_docs else 0.0
+        scores = {}
+        for term in terms:
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id in candidates.intersection(posting):
+                tf = posting[doc_id]
+                norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len) if avg_len else self.k1
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+def get_lexical_index() -> LexicalIndex:
+    """
+    Returns the process-wide lexical index, loading it from disk on first use.
+    """
+    return registry.get("lexical_index", lambda: LexicalIndex.load(storage_paths().lexical_index_path))
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> Dict[str, float]:
+    """
+    Fuses several ranked ID lists: each ID scores sum(1 / (k + rank)) over the lists it appears in.
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return fused
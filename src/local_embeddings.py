@@ -0,0 +1,150 @@
+import re
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+# Function words dominate short questions without carrying their topic
+STOP_WORDS = frozenset(
+    "a an and are as at be by did do does for from how in is it its of on or the this that to was were what "
+    "which who with according".split()
+)
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalizes each row of a matrix (rows of zeros stay zero).
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+class LocalEmbeddings(Embeddings):
+    """
+    Base class of the on-box embedding backends.
+
+    Texts are encoded in batches of `batch_size` (optionally spread over `workers`
+    threads) and the resulting matrix is L2-normalized in one NumPy operation.
+    Queries and documents are embedded the same way.
+
+    Subclasses implement `_encode(texts) -> np.ndarray` of shape (len(texts), dim).
+
+    Args:
+        batch_size: Texts encoded per call to `_encode`.
+        workers: Threads encoding batches concurrently (1 encodes in the calling thread).
+    """
+
+    name = "local"
+
+    def __init__(self, batch_size: int = 256, workers: int = 1):
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # encode is called from several embedding threads at once: one executor is created for all of them
+        self._executor_lock = threading.Lock()
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds texts into a normalized float32 matrix.
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        if self.workers > 1 and len(batches) > 1:
+            parts = list(self._get_executor().map(self._encode, batches))
+        else:
+            parts = [self._encode(batch) for batch in batches]
+        return normalize_rows(np.vstack(parts).astype(np.float32, copy=False))
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed")
+            return self._executor
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+class HashingEmbeddings(LocalEmbeddings):
+    """
+    Dependency-free hashing vectorizer: words other than stop words are hashed (CRC32,
+    stable across processes) into `dim` signed buckets with sublinear term frequency.
+    Identifiers such as part and CAS numbers stay single tokens, so texts sharing them
+    land close together. No model, no network; quality is lexical, not semantic.
+
+    Args:
+        dim: Vector dimension.
+        batch_size, workers: See LocalEmbeddings.
+    """
+
+    def __init__(self, dim: int = 1024, batch_size: int = 256, workers: int = 1):
+        super().__init__(batch_size, workers)
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            for token in TOKEN_RE.findall(text.lower()):
+                if token not in STOP_WORDS:
+                    rows.append(row)
+                    hashes.append(zlib.crc32(token.encode("utf-8")))
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if not hashes:
+            return matrix
+        hashes = np.asarray(hashes, dtype=np.uint32)
+        # The low bits pick the bucket and the top bit the sign, so collisions tend to cancel out
+        columns = (hashes % self.dim).astype(np.intp)
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.intp), columns), signs)
+        return np.sign(matrix) * np.log1p(np.abs(matrix))
+
+class OnnxEmbeddings(LocalEmbeddings):
+    """
+    Sentence-transformer embeddings (all-MiniLM-L6-v2) run on the CPU with ONNX Runtime,
+    through the model wrapper shipped with chromadb. The model is downloaded once to
+    ~/.cache/chroma on first use. ONNX Runtime releases the GIL, so `workers` > 1
+    encodes batches in parallel.
+
+    Args:
+        batch_size, workers: See LocalEmbeddings.
+        model: Callable mapping a list of texts to vectors (defaults to chromadb's ONNXMiniLM_L6_V2).
+    """
+
+    name = "onnx-all-MiniLM-L6-v2"
+
+    def __init__(self, batch_size: int = 64, workers: int = 1, model: Optional[Any] = None):
+        super().__init__(batch_size, workers)
+        if model is None:
+            try:
+                from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+            except ImportError as e:
+                raise ImportError("The onnx embedding backend requires chromadb with onnxruntime and tokenizers.") from e
+            model = ONNXMiniLM_L6_V2()
+        self.model = model
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.model(texts), dtype=np.float32)
+
+def build_local_embeddings(backend: str, dim: int, batch_size: int, workers: int) -> LocalEmbeddings:
+    """
+    Builds the local embedding backend named by EMBEDDING_BACKEND ("hashing" or "onnx").
+    """
+    if backend == "hashing":
+        return HashingEmbeddings(dim=dim, batch_size=batch_size, workers=workers)
+    if backend == "onnx":
+        return OnnxEmbeddings(batch_size=batch_size, workers=workers)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}' (expected google, hashing or onnx).")
@@ -1,29 +1,91 @@
 import sys
+import json
+import time
+import asyncio
 import argparse
-from typing import Optional
-from src.retriever import retrieve_context
-from src.inference import generate_answer, ComplianceResponse
-from src.ingestion import ingest_data, is_ingested, clear_database
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
+from src.resources import registry
+from src.tracing import tracer, profile_report, JsonLinesExporter
+from src.config import TRACE_FILE, TRACE_FORMAT
 
-def run_query(query: str, verbose: bool = False):
+# The pipeline pulls in LangChain, Chroma and the Gemini client: it is imported by the
+# commands that run it, so --help and argument errors return immediately
+if TYPE_CHECKING:
+    from src.inference import ComplianceResponse
+
+def run_query(
+    query: str,
+    verbose: bool = False,
+    stream: bool = False,
+    profile: bool = False,
+) -> Dict[str, Optional[float]]:
     """
-    Orchestrates the RAG flow for a single query.
+    Orchestrates the RAG flow for a single query and prints the answer.
+    Thin synchronous wrapper over the async pipeline (see src/pipeline.py).
+
+    Args:
+        query: The user query.
+        verbose: Print retrieval details and resource/cache statistics.
+        stream: Print the answer text as the LLM produces it, then the status,
+            confidence and sources once the structured response is complete.
+        profile: Print the per-stage breakdown of the query (tracing must be enabled).
+
+    Returns:
+        Timings of the query in seconds: "first_token" (streaming only) and "total".
     """
+    from src.pipeline import answer_query, aanswer_query
+    from src.retriever import embedding_cache_stats
+
+    start = time.perf_counter()
+    timings: Dict[str, Optional[float]] = {"first_token": None, "total": None}
+
+    if stream:
+        def on_token(token: str):
+            if timings["first_token"] is None:
+                timings["first_token"] = time.perf_counter() - start
+                print("\n" + "="*50)
+                print("ANSWER: ", end="")
+            print(token, end="", flush=True)
+
+        response = asyncio.run(aanswer_query(query, verbose, on_token=on_token))
+        timings["total"] = time.perf_counter() - start
+        print()
+        _print_details(response)
+        print(f"(first token: {timings['first_token']:.2f}s, total: {timings['total']:.2f}s)")
+    else:
+        response = answer_query(query, verbose)
+        timings["total"] = time.perf_counter() - start
+        _print_response(response)
+
     if verbose:
-        print(f"\nUser Query: {query}")
-        print("Retrieving context...")
-        
-    context_docs, max_confidence = retrieve_context(query)
-    
-    if verbose:
-        print(f"Max Confidence: {max_confidence:.4f}")
-        print(f"Documents Retrieved: {len(context_docs)}")
-    
-    response: ComplianceResponse = generate_answer(query, context_docs, max_confidence)
-    
+        print(registry.report())
+        cache_stats = embedding_cache_stats()
+        if cache_stats is not None:
+            print(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    if profile:
+        _print_profile("query")
+    return timings
+
+def _print_profile(title: str, file=None):
+    """
+    Prints the per-stage breakdown of the spans recorded since the last profile.
+    """
+    print(f"\n--- Profile: {title} ---", file=file or sys.stdout)
+    print(profile_report(tracer.drain()), file=file or sys.stdout)
+
+def _print_response(response: "ComplianceResponse"):
+    """
+    Prints a ComplianceResponse to the terminal.
+    """
     print("\n" + "="*50)
     print(f"ANSWER: {response.answer}")
-    
+    _print_details(response)
+
+def _print_details(response: "ComplianceResponse"):
+    """
+    Prints the status, confidence and sources of a ComplianceResponse (everything but the answer).
+    """
     if response.is_compliant is not None:
         status = "COMPLIANT" if response.is_compliant else "NON-COMPLIANT"
         print(f"STATUS: {status}")
@@ -34,27 +96,135 @@ def run_query(query: str, verbose: bool = False):
         print("\nSOURCES:")
         for idx, src in enumerate(response.sources, 1):
             print(f"  {idx}. {src['file']} (Section: {src['section']})")
+    if response.chunk_scores:
+        print("\nCHUNK SCORES:")
+        for idx, chunk in enumerate(response.chunk_scores, 1):
+            score = "lexical" if chunk["score"] is None else f"{chunk['score']:.4f}"
+            print(f"  {idx}. {score}  {chunk['file']} (Section: {chunk['section']})")
     print("="*50 + "\n")
 
+def load_batch(path: Path) -> List[Tuple[Any, str]]:
+    """
+    Reads a JSON Lines file of questions.
+    Each line is either a string or an object with a "query" (or "question") and an optional "id";
+    the line number is used when no id is given.
+    """
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                items.append((line_number, record))
+            else:
+                items.append((record.get("id", line_number), record.get("query") or record["question"]))
+    return items
+
+def completed_ids(path: Optional[Path]) -> Set[str]:
+    """
+    IDs already answered in an existing output file, used to resume an interrupted batch.
+    A truncated last line (from a crash mid-write) is ignored and answered again.
+    """
+    done = set()
+    if path is None or not path.exists():
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError):
+                continue
+    return done
+
+def run_batch(batch_path: Path, output_path: Optional[Path] = None, verbose: bool = False, profile: bool = False):
+    """
+    Answers every question of a JSON Lines file and streams one ComplianceResponse
+    JSON object per line (with the question "id" and "query") to stdout or `output_path`
+    as each answer completes. With an output file, questions already answered there are skipped.
+    """
+    from src.pipeline import abatch_answer
+
+    items = load_batch(batch_path)
+    done = completed_ids(output_path)
+    pending = [(item_id, query) for item_id, query in items if str(item_id) not in done]
+
+    if verbose:
+        print(f"Batch: {len(items)} questions, {len(items) - len(pending)} already answered, {len(pending)} to go.",
+              file=sys.stderr)
+
+    out = open(output_path, "a", encoding="utf-8") if output_path is not None else sys.stdout
+    if out is not sys.stdout and out.tell() > 0:
+        with open(output_path, "rb") as f:
+            f.seek(-1, 2)
+            if f.read(1) != b"\n":
+                # Terminate a line truncated by an interrupted run
+                out.write("\n")
+    try:
+        def on_result(item_id: Any, query: str, response: "ComplianceResponse"):
+            out.write(json.dumps({"id": item_id, "query": query, **response.model_dump()}) + "\n")
+            out.flush()
+
+        asyncio.run(abatch_answer(pending, on_result))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if verbose:
+        print(registry.report(), file=sys.stderr)
+    if profile:
+        _print_profile("batch", file=sys.stderr)
+
 def main():
     parser = argparse.ArgumentParser(description="Regulation Compliance Chatbot")
     parser.add_argument("query", nargs="?", help="The natural language query to ask the chatbot.")
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose output.")
     parser.add_argument("--wipe", action="store_true", help="Wipe the database before proceeding.")
+    parser.add_argument("--no-parse-cache", action="store_true", help="Convert every changed document again instead of reusing cached parser output.")
+    parser.add_argument("--batch", type=Path, help="Answer every question of a JSON Lines file.")
+    parser.add_argument("--output", type=Path, help="Write batch answers to this file (resumes an interrupted run).")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=None,
+                        help="Stream answers as they are generated (default: on in interactive mode, off otherwise).")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print a per-stage timing breakdown (with token counts and cache hits) "
+                             "for the ingestion run and each query.")
+    parser.add_argument("--trace", type=Path, default=TRACE_FILE,
+                        help="Append trace spans to this JSON Lines file (default: TRACE_FILE).")
+    parser.add_argument("--trace-format", choices=["json", "otlp"], default=TRACE_FORMAT,
+                        help="Trace record layout: flat JSON or OpenTelemetry OTLP/JSON spans.")
     
     args = parser.parse_args()
 
+    if args.trace:
+        tracer.enable(JsonLinesExporter(args.trace, args.trace_format))
+    if args.profile:
+        tracer.enable(keep=True)
+
     if args.wipe:
+        from src.manifest import clear_database
         clear_database()
 
-    # Automatic ingestion check
-    if not is_ingested():
-        if args.verbose:
+    from src.ingestion import ingest_data, is_ingested
+
+    if args.no_parse_cache:
+        from src.parse_cache import set_parse_cache_enabled
+        set_parse_cache_enabled(False)
+
+    # Automatic ingestion: a full build on first run, an incremental sync of changed files afterwards
+    if args.verbose:
+        if not is_ingested():
             print("Database is empty. Starting automatic ingestion...")
-        ingest_data(verbose=args.verbose)
+        else:
+            print("Synchronizing database with data directory...")
+    ingest_data(verbose=args.verbose)
+    if args.profile:
+        _print_profile("ingestion")
 
-    if args.query:
-        run_query(args.query, args.verbose)
+    if args.batch:
+        run_batch(args.batch, args.output, args.verbose, args.profile)
+    elif args.query:
+        run_query(args.query, args.verbose, stream=bool(args.stream), profile=args.profile)
     else:
         print("Welcome to the Regulation Compliance Chatbot CLI.")
         print("Type 'exit' or 'quit' to stop.")
@@ -65,7 +235,7 @@ def main():
                     break
                 if not query:
                     continue
-                run_query(query, args.verbose)
+                run_query(query, args.verbose, stream=args.stream is not False, profile=args.profile)
             except KeyboardInterrupt:
                 break
         print("\nGoodbye!")
@@ -0,0 +1,93 @@
+import json
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Dict, Any, Iterable, Iterator, Optional, Tuple
+from src.resources import registry
+from src.storage import storage_paths
+
+MANIFEST_VERSION = 1
+
+def file_hash(path: Path, block_size: int = 1 << 20) -> str:
+    """
+    Returns the sha256 of a file's bytes, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def content_hash(text: str) -> str:
+    """
+    Returns the sha256 of a chunk's text content.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def iter_chunk_ids(chunks: Iterable[Dict[str, Any]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Yields (chunk ID, chunk) pairs, deriving deterministic chunk IDs from each chunk's
+    source, section title and its occurrence number among chunks sharing that section title.
+    The same section of the same file always maps to the same ID, so an edited
+    section is detected as an update rather than an add + delete.
+    Chunks are consumed one at a time, so a parser's output can be streamed through.
+    """
+    seen: Dict[str, int] = {}
+    for chunk in chunks:
+        metadata = chunk["metadata"]
+        key = f"{metadata.get('source')}::{metadata.get('section_title')}"
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        yield hashlib.sha256(f"{key}::{occurrence}".encode("utf-8")).hexdigest()[:32], chunk
+
+def chunk_ids(chunks: Iterable[Dict[str, Any]]) -> list:
+    """
+    Returns the IDs of a list of chunks (see iter_chunk_ids).
+    """
+    return [chunk_id for chunk_id, _ in iter_chunk_ids(chunks)]
+
+def empty_manifest() -> Dict[str, Any]:
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+def load_manifest(path: Optional[Path] = None) -> Dict[str, Any]:
+    """
+    Loads the ingestion manifest (of the current storage paths by default). Returns an empty manifest if none exists
+    or it was written by an incompatible version.
+
+    Layout:
+        {"version": 1, "files": {"<file name>": {"hash": "<sha256>", "chunks": {"<chunk id>": "<sha256>"}}}}
+    """
+    path = path or storage_paths().manifest_path
+    if not path.exists():
+        return empty_manifest()
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return empty_manifest()
+    return manifest
+
+def save_manifest(manifest: Dict[str, Any], path: Optional[Path] = None):
+    """
+    Atomically writes the ingestion manifest (of the current storage paths by default).
+    """
+    path = path or storage_paths().manifest_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    tmp_path.replace(path)
+
+def clear_database(chroma_dir: Optional[Path] = None):
+    """
+    Deletes the ChromaDB directory (with its manifest and side indexes), the current one by default.
+    Any cached vector store handle is released first so it is reopened on next use.
+    Lives here rather than in src.ingestion so `--wipe` does not import the ingestion stack.
+    """
+    chroma_dir = chroma_dir or storage_paths().chroma_dir
+    registry.invalidate("vectorstore", "answer_cache", "lexical_index", "table_index", "duplicate_index")
+    if chroma_dir.exists():
+        print(f"Clearing database at {chroma_dir}...")
+        shutil.rmtree(chroma_dir)
+        print("Database cleared.")
+    else:
+        print("Database directory does not exist. Nothing to clear.")
@@ -0,0 +1,150 @@
+import os
+import gzip
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+from src.config import PARSE_CACHE_ENABLED, PARSE_CACHE_MAX_BYTES
+from src.resources import registry
+from src.storage import storage_paths
+from src.tracing import tracer
+
+_enabled = PARSE_CACHE_ENABLED
+
+class ParseCache:
+    """
+    Content-addressed on-disk cache of parser output.
+
+    Each entry holds the chunks a parser produced for one file, as gzip-compressed JSON
+    Lines (row chunks repeat their table header, which compresses well). Entries are
+    keyed by the sha256 of the file, the parser and everything else its output depends
+    on (see `key`), so an unchanged document skips conversion entirely and any change
+    to the file, parser version or options is a miss.
+
+    Chunks are streamed in both directions: a miss writes them to a temporary file as
+    the parser yields them, and the entry is published atomically once the parser
+    finishes. A parser that fails or is abandoned leaves no entry.
+
+    The cache holds at most `max_bytes`; the least recently used entries are evicted
+    first, and an entry larger than the whole budget is not kept. Hit/miss counters
+    are kept per process.
+
+    Args:
+        directory: Directory holding the entries.
+        max_bytes: Maximum total size of the entries on disk.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 256 << 20):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(file_digest: str, parser: str, options: Dict[str, Any]) -> str:
+        """
+        Cache key of a file's parser output.
+
+        Args:
+            file_digest: sha256 of the file's bytes.
+            parser: Qualified name of the parser function.
+            options: Everything else the output depends on (parser version, library versions, ...).
+        """
+        payload = json.dumps({"file": file_digest, "parser": parser, "options": options}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.jsonl.gz"
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        tracer.current().set(parse_cache="hit" if hit else "miss")
+
+    def through(self, key: str, produce: Callable[[], Iterable[Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the cached chunks of `key`, or the chunks of `produce()` (storing them) on a miss.
+        """
+        path = self._path(key)
+        try:
+            f = gzip.open(path, "rt", encoding="utf-8")
+        except FileNotFoundError:
+            pass
+        else:
+            self._count(hit=True)
+            with f:
+                # Refresh the entry's position in the LRU order
+                os.utime(path)
+                for line in f:
+                    yield json.loads(line)
+            return
+
+        self._count(hit=False)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as out:
+                for chunk in produce():
+                    out.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+                    yield chunk
+            if tmp_path.stat().st_size <= self.max_bytes:
+                tmp_path.replace(path)
+                self._evict()
+        finally:
+            # Left over if the parser failed, was abandoned or produced an entry over budget
+            tmp_path.unlink(missing_ok=True)
+
+    def _evict(self):
+        entries = []
+        for entry in self.directory.glob("*.jsonl.gz"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda item: item[0]):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+
+    def stats(self) -> Dict[str, int]:
+        entries = list(self.directory.glob("*.jsonl.gz")) if self.directory.exists() else []
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(entry.stat().st_size for entry in entries),
+        }
+
+def set_parse_cache_enabled(enabled: bool) -> bool:
+    """
+    Turns the parse cache on or off for this process (and parser processes forked from it).
+    Used by the --no-parse-cache flags; defaults to PARSE_CACHE. Returns the previous setting.
+    """
+    global _enabled
+    previous, _enabled = _enabled, enabled
+    return previous
+
+def get_parse_cache() -> Optional[ParseCache]:
+    """
+    Returns the process-wide parse cache, or None if it is disabled.
+    """
+    if not _enabled:
+        return None
+    return registry.get("parse_cache", lambda: ParseCache(storage_paths().parse_cache_dir, PARSE_CACHE_MAX_BYTES))
+
+def parse_cache_counts() -> Dict[str, int]:
+    """
+    Hit/miss counters of the parse cache in this process (zero if it is disabled or unused).
+    """
+    if not _enabled or not registry.is_loaded("parse_cache"):
+        return {"hits": 0, "misses": 0}
+    cache = get_parse_cache()
+    return {"hits": cache.hits, "misses": cache.misses}
@@ -1,64 +1,925 @@
-import pymupdf4llm
-from langchain_text_splitters import MarkdownHeaderTextSplitter
-from bs4 import BeautifulSoup
-import markdownify
+import re
+import time
+import pickle
+import signal
+import tempfile
+import functools
+import mimetypes
+import threading
+import collections
+import importlib
+import importlib.metadata
+from html.parser import HTMLParser
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
+from src.config import PDF_FAST_TEXT_PAGES
+from src.manifest import file_hash
+from src.parse_cache import get_parse_cache
+from src.tracing import span, tracer
 
-def ingest_fmd_pdf(path: Path) -> List[Dict[str, Any]]:
+# Bumped when the chunks or their metadata change, so existing indexes are rebuilt
+PARSER_VERSION = 3
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*$")
+TABLE_SEPARATOR_RE = re.compile(r"^\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?$")
+PART_NUMBER_RE = re.compile(r"\b(?=[A-Z0-9-]*\d)[A-Z0-9]+(?:-[A-Z0-9]+)+\b")
+REVISION_RE = re.compile(r"\bRev\.?\s+([A-Z0-9]+)\b", re.IGNORECASE)
+
+# Table header keywords mapped to the row metadata field they fill (first match wins)
+TABLE_COLUMNS = [
+    ("part", "part_number"),
+    ("rev", "revision"),
+    ("lot", "lot"),
+    ("type", "product_type"),
+    ("substance", "substance"),
+    ("cas", "cas"),
+    ("amount", "amount"),
+    ("feature", "feature"),
+    ("status", "status"),
+]
+
+def load_converters():
+    """
+    Imports the conversion libraries (pymupdf4llm and the Markdown splitter). They take
+    about a second to import, so the parsers import them on first use; ingestion loads
+    them up front before starting parser workers, which then inherit them.
+    """
+    importlib.import_module("pymupdf4llm")
+    importlib.import_module("langchain_text_splitters")
+
+@functools.lru_cache(maxsize=None)
+def _parser_options(distributions: tuple) -> Dict[str, Any]:
+    versions = {}
+    for name in distributions:
+        try:
+            versions[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            versions[name] = None
+    # The source of this module stands in for parser changes made without bumping PARSER_VERSION
+    return {
+        "parser_version": PARSER_VERSION,
+        "source": file_hash(Path(__file__)),
+        "libraries": versions,
+        "pdf_fast_text_pages": PDF_FAST_TEXT_PAGES,
+    }
+
+def cached_parser(*distributions: str):
+    """
+    Serves a parser's chunks from the parse cache (see src/parse_cache.py) when the same
+    file was parsed before, without importing or running the converters.
+
+    The cache key covers the file's sha256 and name, the parser, PARSER_VERSION, the source of
+    this module and the installed versions of `distributions` (the libraries the output depends on).
+
+    Args:
+        distributions: Names of the packages whose version is part of the cache key.
+    """
+    def decorator(parse: Callable[[Path], Iterable[Dict[str, Any]]]):
+        @functools.wraps(parse)
+        def wrapper(path: Path) -> Iterator[Dict[str, Any]]:
+            cache = get_parse_cache()
+            if cache is None:
+                yield from parse(path)
+                return
+            # The file name is part of the output (the chunks' source metadata)
+            options = {**_parser_options(distributions), "file_name": path.name}
+            key = cache.key(file_hash(path), f"{parse.__module__}.{parse.__qualname__}", options)
+            yield from cache.through(key, lambda: parse(path))
+        return wrapper
+    return decorator
+
+def _clean_markdown(text: str) -> str:
+    return text.replace("**", "").strip()
+
+def _table_cells(line: str) -> List[str]:
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|"):
+        line = line[:-1]
+    return [_clean_markdown(cell) for cell in line.split("|")]
+
+def _render_row(cells: List[str]) -> str:
+    return "| " + " | ".join(cells) + " |"
+
+def _row_metadata(header: List[str], row: List[str]) -> Dict[str, str]:
+    """
+    Maps the cells of a table row to structured metadata fields using the header names.
+    Empty cells are left out (Chroma metadata values cannot be None).
+    """
+    metadata = {}
+    for name, cell in zip(header, row):
+        name = name.lower()
+        for keyword, field in TABLE_COLUMNS:
+            if keyword in name and field not in metadata:
+                if cell:
+                    metadata[field] = cell
+                break
+
+    part_cell = metadata.get("part_number")
+    if part_cell:
+        # Cells like "TC-3541-A Rev R3" carry the revision next to the part number
+        match = PART_NUMBER_RE.search(part_cell)
+        if match:
+            metadata["part_number"] = match.group(0)
+        revision = REVISION_RE.search(part_cell)
+        if revision and "revision" not in metadata:
+            metadata["revision"] = revision.group(1)
+    return metadata
+
+def iter_lines(blocks: Iterable[str]) -> Iterator[str]:
     """
-    Ingests FMD_Test_Corporation.pdf and returns its content as one chunk.
+    Yields the lines of the concatenation of text blocks (e.g. one Markdown string per
+    page) without building the whole text; same lines as "".join(blocks).splitlines().
     """
-    md_text = pymupdf4llm.to_markdown(str(path))
-    return [{
-        "content": md_text,
-        "metadata": {
-            "source": path.name,
-            "section_title": "Full Document"
+    partial = ""
+    for block in blocks:
+        lines = (partial + block).splitlines(keepends=True)
+        partial = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        for line in lines:
+            yield line.rstrip("\r\n")
+    if partial:
+        yield partial
+
+def iter_markdown_table_chunks(lines: Iterable[str], source: str, doc_type: str) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming version of chunk_markdown_tables: consumes Markdown lines and yields each
+    row chunk as soon as its row is read. Only the prose of the current section is
+    buffered, so memory does not grow with the length of a table or of the document.
+    """
+    title = None
+    heading = "General"
+    header: Optional[List[str]] = None
+    prose: List[str] = []
+    in_table = False
+    first_row = False
+    prefix = ""
+
+    def prose_chunk() -> Optional[Dict[str, Any]]:
+        text = "\n".join(prose).strip()
+        prose.clear()
+        if not text:
+            return None
+        return {
+            "content": text,
+            "metadata": {"source": source, "section_title": heading, "doc_type": doc_type, "chunk_type": "text"}
+        }
+
+    for line in lines:
+        if not line.strip().startswith("|"):
+            in_table = False
+            match = HEADING_RE.match(line.strip())
+            if match:
+                # A new section never continues the previous section's table
+                chunk = prose_chunk()
+                if chunk is not None:
+                    yield chunk
+                heading = _clean_markdown(match.group(2)) or heading
+                title = title or heading
+                header = None
+            prose.append(line)
+            continue
+
+        if not in_table:
+            in_table = first_row = True
+            prefix = " > ".join(dict.fromkeys(part for part in (title, heading) if part and part != "General"))
+        if TABLE_SEPARATOR_RE.match(line.strip()):
+            continue
+        row = _table_cells(line)
+        if first_row:
+            first_row = False
+            # A first row without any digit is a header; otherwise the table continues the previous one
+            if header is None or not any(any(ch.isdigit() for ch in cell) for cell in row):
+                header = row
+                continue
+        if not any(row):
+            continue
+
+        row = (row + [""] * len(header))[:len(header)]
+        metadata = _row_metadata(header, row)
+        part_number = metadata.get("part_number")
+        content = "\n".join(filter(None, [
+            prefix,
+            _render_row(header),
+            _render_row(["---"] * len(header)),
+            _render_row(row),
+        ]))
+        yield {
+            "content": content,
+            "metadata": {
+                "source": source,
+                "section_title": f"{heading} — {part_number}" if part_number else heading,
+                "doc_type": doc_type,
+                "chunk_type": "table_row",
+                **metadata,
+            }
         }
-    }]
 
-def ingest_reach_pdf(path: Path) -> List[Dict[str, Any]]:
+    chunk = prose_chunk()
+    if chunk is not None:
+        yield chunk
+
+def chunk_markdown_tables(md_text: str, source: str, doc_type: str) -> List[Dict[str, Any]]:
+    """
+    Splits a Markdown document into one chunk per table row plus chunks of the text around the tables.
+
+    Each row chunk repeats the document title, the current heading and the table header,
+    so it is self-contained, and carries structured metadata (part number, substance,
+    CAS number, status, ...) derived from the column names. Its section title is
+    "<heading> — <part number>", which keeps chunk IDs stable when other parts' rows change.
+
+    Tables continued on a new page (a header-less table right after another table) reuse
+    the previous header. Text outside tables is grouped per heading.
+
+    Args:
+        md_text: Markdown text (tables in pipe syntax).
+        source: File name stored in the chunk metadata.
+        doc_type: Document type stored in the chunk metadata (used to route queries).
+
+    Returns:
+        Chunks with "content" and "metadata" keys.
+    """
+    return list(iter_markdown_table_chunks(md_text.splitlines(), source, doc_type))
+
+# Characters opening a bullet list item in PDF text
+PDF_BULLETS = ("•", "◦", "▪", "‣", "·", "–", "- ", "* ")
+
+# Rows of side-by-side text from which a page is taken to hold a borderless table
+BORDERLESS_TABLE_MIN_ROWS = 3
+
+# The page-by-page layout path builds pymupdf4llm's private layout objects, so it only runs
+# on the release it was tested with (pinned in requirements.txt) and when they all exist
+PYMUPDF4LLM_LAYOUT_VERSION = "1.28.2"
+LAYOUT_API = {
+    "pymupdf4llm.helpers.document_layout": (
+        "FLAGS", "PageLayout", "LayoutBox", "ParsedDocument", "get_raw_lines", "parse_document", "update_header_tags",
+    ),
+    "pymupdf4llm.helpers.utils": ("analyze_page",),
+}
+
+@functools.lru_cache(maxsize=None)
+def _has_layout_api() -> bool:
+    """
+    Whether PyMuPDF Layout is active and the installed pymupdf4llm is the tested release
+    exposing every private layout helper of LAYOUT_API.
+    """
+    import importlib
+    import pymupdf4llm
+
+    if not getattr(pymupdf4llm, "_use_layout", False) or getattr(pymupdf4llm, "__version__", None) != PYMUPDF4LLM_LAYOUT_VERSION:
+        return False
+    for module_name, names in LAYOUT_API.items():
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            return False
+        if not all(hasattr(module, name) for name in names):
+            return False
+    return True
+
+def _is_text_only_page(page) -> bool:
+    """
+    Whether a PDF page holds nothing but running text: no images, no vector graphics
+    (so no ruled tables or figures), no scanned text needing OCR, and fewer than
+    BORDERLESS_TABLE_MIN_ROWS rows of horizontally separated text lines (the cells of a
+    borderless table, or columns). A few milliseconds, against about half a second for
+    the layout model.
+    """
+    import pymupdf
+    from pymupdf4llm.helpers.utils import analyze_page
+
+    analysis = analyze_page(page)
+    if analysis.get("img_area") or analysis.get("vec_area") or analysis.get("needs_ocr"):
+        return False
+
+    rows: Dict[int, List[Tuple[float, float]]] = {}
+    for block in page.get_text("dict", flags=pymupdf.TEXTFLAGS_TEXT)["blocks"]:
+        for line in block.get("lines", []):
+            if any(text_span["text"].strip() for text_span in line["spans"]):
+                x0, y0, x1, y1 = line["bbox"]
+                rows.setdefault(round((y0 + y1) / 6), []).append((x0, x1))
+    side_by_side = 0
+    for extents in rows.values():
+        extents.sort()
+        if len(extents) > 1 and all(right[0] - left[1] > 4 for left, right in zip(extents, extents[1:])):
+            side_by_side += 1
+    return side_by_side < BORDERLESS_TABLE_MIN_ROWS
+
+def _text_page_layout(page):
+    """
+    Builds the layout of a text-only page from its text spans instead of the layout
+    model, so it renders with the same Markdown conventions as the analysed pages.
+
+    Text blocks are classified by their spans: blocks in the top or bottom margin are
+    page headers/footers (one box per line), blocks opening with a bullet are list
+    items, and short blocks that are bold or larger than the page's body text are
+    section headers. Everything else is body text.
+    """
+    import pymupdf
+    from pymupdf4llm.helpers import document_layout
+
+    page.remove_rotation()
+    textpage = page.get_textpage(flags=document_layout.FLAGS, clip=pymupdf.INFINITE_RECT())
+    blocks = [block for block in textpage.extractDICT()["blocks"] if block["type"] == 0]
+
+    # Body text size: the font size covering the most characters
+    sizes = collections.Counter()
+    for block in blocks:
+        for line in block["lines"]:
+            for text_span in line["spans"]:
+                sizes[round(text_span["size"])] += len(text_span["text"].strip())
+    body_size = sizes.most_common(1)[0][0] if sizes else 0
+    margin = page.rect.height * 0.06
+
+    layout = document_layout.PageLayout(
+        page_number=page.number + 1, width=page.rect.width, height=page.rect.height,
+        boxes=[], fulltext=blocks, words=[], links=[],
+    )
+
+    def add_box(bbox, boxclass: str):
+        box = document_layout.LayoutBox(*bbox, boxclass)
+        box.textlines = [
+            {"bbox": line[0], "spans": line[1]}
+            for line in document_layout.get_raw_lines(textpage=None, blocks=blocks, clip=pymupdf.Rect(bbox), ignore_invisible=False)
+        ]
+        if boxclass == "section-header":
+            box.max_fontsize = max(round(text_span["size"]) for line in box.textlines for text_span in line["spans"])
+        layout.boxes.append(box)
+
+    for block in sorted(blocks, key=lambda block: (block["bbox"][1], block["bbox"][0])):
+        spans = [text_span for line in block["lines"] for text_span in line["spans"] if text_span["text"].strip()]
+        if not spans:
+            continue
+        text = " ".join(text_span["text"].strip() for text_span in spans)
+        top, bottom = block["bbox"][1], block["bbox"][3]
+        if bottom <= margin or top >= page.rect.height - margin:
+            for line in block["lines"]:
+                add_box(line["bbox"], "page-header" if bottom <= margin else "page-footer")
+        elif text.startswith(PDF_BULLETS):
+            add_box(block["bbox"], "list-item")
+        elif len(block["lines"]) <= 2 and len(text) <= 120 and (
+            max(round(text_span["size"]) for text_span in spans) > body_size
+            or all(text_span["flags"] & pymupdf.TEXT_FONT_BOLD for text_span in spans)
+        ):
+            add_box(block["bbox"], "section-header")
+        else:
+            add_box(block["bbox"], "text")
+    return layout
+
+def iter_pdf_markdown(path: Path) -> Iterator[str]:
+    """
+    Converts a PDF to Markdown one page at a time, yielding each page's Markdown.
+
+    Heading levels depend on the font sizes of the headings of the whole document. With
+    PyMuPDF Layout, each page's layout is analysed once and spooled to a temporary file
+    while the heading sizes are collected; the pages are rendered from the spool after
+    the last one. Text-only pages skip the layout model (see PDF_FAST_TEXT_PAGES and
+    _text_page_layout). Without PyMuPDF Layout, the document's heading sizes are scanned
+    up front. With a pymupdf4llm release other than PYMUPDF4LLM_LAYOUT_VERSION, each page
+    goes through the public pymupdf4llm.to_markdown, and heading levels are decided per
+    page. Either way one page is held in memory at a time.
+    """
+    import pymupdf
+    import pymupdf4llm
+
+    with pymupdf.open(str(path)) as doc:
+        if not getattr(pymupdf4llm, "_use_layout", False):
+            hdr_info = pymupdf4llm.IdentifyHeaders(doc)
+            for page_number in range(doc.page_count):
+                with span("convert", page=page_number + 1):
+                    md_text = pymupdf4llm.to_markdown(doc, pages=[page_number], hdr_info=hdr_info)
+                yield md_text
+            return
+        if not _has_layout_api():
+            for page_number in range(doc.page_count):
+                with span("convert", page=page_number + 1):
+                    md_text = pymupdf4llm.to_markdown(doc, pages=[page_number], force_text=True, use_ocr=True)
+                yield md_text
+            return
+
+        from pymupdf4llm.helpers import document_layout
+
+        header_sizes = set()
+        with tempfile.TemporaryFile(prefix="rag-pages-") as spool:
+            for page_number in range(doc.page_count):
+                with span("convert", page=page_number + 1) as convert_span:
+                    if PDF_FAST_TEXT_PAGES and _is_text_only_page(doc[page_number]):
+                        page = _text_page_layout(doc[page_number])
+                        convert_span.set(fast_path=True)
+                    else:
+                        page = document_layout.parse_document(doc, pages=[page_number], force_text=True, use_ocr=True).pages[0]
+                header_sizes.update(box.max_fontsize for box in page.boxes if box.boxclass in ("title", "section-header"))
+                pickle.dump(page, spool)
+            spool.seek(0)
+            for _ in range(doc.page_count):
+                page = pickle.load(spool)
+                if header_sizes:
+                    document_layout.update_header_tags([page], header_sizes)
+                yield document_layout.ParsedDocument(page_count=1, pages=[page]).to_markdown()
+
+class HtmlMarkdownConverter(HTMLParser):
+    """
+    Incremental HTML to Markdown converter. Fed the file block by block, it emits
+    Markdown lines to `lines` as soon as each paragraph, heading, list item or table
+    row closes, so neither the document nor its element tree is held in memory.
+
+    The output follows markdownify with ATX headings for what the table chunker relies
+    on: headings, paragraphs (source line breaks kept), bullet lists, bold/italic/code,
+    links and pipe tables whose first row is the header.
+    """
+
+    SKIPPED_TAGS = {"script", "style", "noscript", "template"}
+    BLOCK_TAGS = {
+        "address", "article", "aside", "blockquote", "body", "dd", "div", "dl", "dt", "fieldset",
+        "figcaption", "figure", "footer", "form", "head", "header", "hr", "html", "li", "main",
+        "nav", "ol", "p", "pre", "section", "title", "ul",
+        "h1", "h2", "h3", "h4", "h5", "h6",
+    }
+    INLINE_MARKERS = {"b": "**", "strong": "**", "i": "*", "em": "*", "code": "`"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines: List[str] = []
+        self._text: List[str] = []
+        self._cell: Optional[List[str]] = None
+        self._row: Optional[List[str]] = None
+        self._rows = 0
+        self._tables = 0
+        self._links: List[Optional[str]] = []
+        self._skip = 0
+        self._heading = 0
+        self._list_item = False
+        self._last: Optional[str] = None
+
+    def _append(self, text: str):
+        (self._cell if self._cell is not None else self._text).append(text)
+
+    def _emit(self, lines: List[str], kind: str):
+        # Blocks are separated by a blank line, consecutive list items are not
+        if self._last is not None and not (kind == "li" and self._last == "li"):
+            self.lines.append("")
+        self.lines.extend(lines)
+        self._last = kind
+
+    def _flush(self):
+        text = "".join(self._text)
+        self._text = []
+        heading, list_item = self._heading, self._list_item
+        self._heading, self._list_item = 0, False
+        if heading or list_item:
+            text = " ".join(text.split())
+            if text:
+                self._emit([("#" * heading + " " if heading else "* ") + text], "li" if list_item else "block")
+            return
+        lines = [re.sub(r"[ \t\r\f\v]+", " ", line).strip() for line in text.split("\n")]
+        lines = [line for line in lines if line]
+        if lines:
+            self._emit(lines, "block")
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self._skip += 1
+        if self._skip:
+            return
+        if tag in ("td", "th"):
+            self._cell = []
+        elif tag == "tr":
+            self._row = []
+        elif tag == "table":
+            self._flush()
+            self._tables += 1
+            self._rows = 0
+        elif tag == "br":
+            self._append(" " if self._cell is not None else "\n")
+        elif tag in self.INLINE_MARKERS:
+            self._append(self.INLINE_MARKERS[tag])
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            self._links.append(href)
+            if href:
+                self._append("[")
+        elif tag in self.BLOCK_TAGS:
+            self._flush()
+            if tag[0] == "h" and tag[1:].isdigit():
+                self._heading = int(tag[1:])
+            self._list_item = tag == "li"
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in ("br", "hr"):
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS:
+            self._skip = max(0, self._skip - 1)
+            return
+        if self._skip:
+            return
+        if tag in ("td", "th") and self._cell is not None:
+            if self._row is not None:
+                self._row.append(" ".join("".join(self._cell).split()))
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            row, self._row = self._row, None
+            if not row:
+                return
+            lines = [_render_row(row)]
+            if self._rows == 0:
+                lines.append(_render_row(["---"] * len(row)))
+            self._rows += 1
+            if self._rows == 1:
+                self._emit(lines, "table")
+            else:
+                self.lines.extend(lines)
+        elif tag == "table":
+            self._tables = max(0, self._tables - 1)
+        elif tag in self.INLINE_MARKERS:
+            self._append(self.INLINE_MARKERS[tag])
+        elif tag == "a":
+            href = self._links.pop() if self._links else None
+            if href:
+                self._append(f"]({href})")
+        elif tag in self.BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        # Whitespace between rows and cells is dropped rather than buffered for the whole table
+        if not self._skip and (self._cell is not None or not self._tables):
+            self._append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+def iter_html_markdown(path: Path, block_size: int = 1 << 16) -> Iterator[str]:
+    """
+    Converts an HTML file to Markdown lines while reading it in blocks of `block_size` characters.
+    """
+    converter = HtmlMarkdownConverter()
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            block = f.read(block_size)
+            with span("convert"):
+                if block:
+                    converter.feed(block)
+                else:
+                    converter.close()
+            lines, converter.lines = converter.lines, []
+            yield from lines
+            if not block:
+                return
+
+def timed_split(
+    chunker: Callable[[Iterable[str]], Iterable[Dict[str, Any]]],
+    lines: Iterable[str],
+) -> Iterator[Dict[str, Any]]:
+    """
+    Runs a chunker over Markdown lines and records its own time as one "split" span.
+
+    Conversion is lazy: the chunker pulls lines from the converter while it runs. So the
+    time spent producing each chunk is accumulated, minus the time spent waiting for
+    lines (the "convert" spans), and the total is recorded once the chunker is done.
+    """
+    if not tracer.enabled:
+        yield from chunker(lines)
+        return
+
+    line_seconds = 0.0
+
+    def timed_lines() -> Iterator[str]:
+        nonlocal line_seconds
+        source = iter(lines)
+        while True:
+            start = time.perf_counter()
+            try:
+                line = next(source)
+            except StopIteration:
+                return
+            finally:
+                line_seconds += time.perf_counter() - start
+            yield line
+
+    chunk_seconds, count = 0.0, 0
+    chunks = iter(chunker(timed_lines()))
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                chunk_seconds += time.perf_counter() - start
+            count += 1
+            yield chunk
+    finally:
+        tracer.record("split", max(0.0, chunk_seconds - line_seconds), chunks=count)
+
+@cached_parser("pymupdf4llm", "pymupdf", "pymupdf-layout")
+def ingest_fmd_pdf(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Ingests FMD_Test_Corporation.pdf: one chunk per material substance table row
+    (see chunk_markdown_tables) plus the surrounding text.
+    The PDF is converted and chunked page by page.
+    """
+    yield from timed_split(
+        lambda lines: iter_markdown_table_chunks(lines, path.name, "fmd"), iter_lines(iter_pdf_markdown(path))
+    )
+
+def _reach_sections(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Groups Markdown lines into sections starting at each "#" or "##" heading (outside
+    code fences). A "##" section is prefixed with the "#" heading it belongs to, so it
+    splits the same way as inside the whole document.
+    """
+    h1_line = None
+    section: List[str] = []
+    in_fence = False
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith(("```", "~~~")):
+            in_fence = not in_fence
+        level = 0
+        if not in_fence:
+            for sep in ("##", "#"):
+                if stripped.startswith(sep) and (len(stripped) == len(sep) or stripped[len(sep)] == " "):
+                    level = len(sep)
+                    break
+        if level:
+            if section:
+                yield "\n".join(section)
+            section = [line] if level == 1 or h1_line is None else [h1_line, line]
+            if level == 1:
+                h1_line = line
+        else:
+            section.append(line)
+    if section:
+        yield "\n".join(section)
+
+@cached_parser("pymupdf4llm", "pymupdf", "pymupdf-layout", "langchain-text-splitters")
+def ingest_reach_pdf(path: Path) -> Iterator[Dict[str, Any]]:
     """
     Ingests REACH_Certificate_of_Compliance_Test_Corporation.pdf and stores each section as a chunk.
+    The PDF is converted page by page and split one section at a time.
     """
-    md_text = pymupdf4llm.to_markdown(str(path))
-    
+    from langchain_text_splitters import MarkdownHeaderTextSplitter
+
     headers_to_split_on = [
         ("#", "Header 1"),
         ("##", "Header 2"),
     ]
     splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
-    split_docs = splitter.split_text(md_text)
-    
-    chunks = []
-    for doc in split_docs:
-        section_title = doc.metadata.get("Header 1") or doc.metadata.get("Header 2") or "General"
-        chunks.append({
-            "content": doc.page_content,
-            "metadata": {
-                "source": path.name,
-                "section_title": section_title
-            }
-        })
-    return chunks
 
-def ingest_parts_html(path: Path) -> List[Dict[str, Any]]:
+    def split(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        for section in _reach_sections(lines):
+            for doc in splitter.split_text(section):
+                section_title = doc.metadata.get("Header 1") or doc.metadata.get("Header 2") or "General"
+                yield {
+                    "content": doc.page_content,
+                    "metadata": {
+                        "source": path.name,
+                        "section_title": section_title,
+                        "doc_type": "reach",
+                        "regulation": "REACH",
+                    }
+                }
+
+    yield from timed_split(split, iter_lines(iter_pdf_markdown(path)))
+
+@cached_parser()
+def ingest_parts_html(path: Path) -> Iterator[Dict[str, Any]]:
     """
-    Ingests part_measurements_test_corporation.html and returns its content as one chunk.
-    Extracted tables are preserved in Markdown format.
+    Ingests part_measurements_test_corporation.html: one chunk per measurement table row
+    (see chunk_markdown_tables) plus the surrounding text.
+    The HTML is converted to Markdown incrementally (see HtmlMarkdownConverter).
     """
-    with open(path, "r", encoding="utf-8") as f:
-        html_content = f.read()
-    
-    soup = BeautifulSoup(html_content, "html.parser")
-    # Convert HTML to Markdown, ensuring table integrity
-    md_text = markdownify.markdownify(str(soup), heading_style="ATX")
-    
-    return [{
-        "content": md_text,
-        "metadata": {
-            "source": path.name,
-            "section_title": "Full Document"
-        }
-    }]
+    yield from timed_split(lambda lines: iter_markdown_table_chunks(lines, path.name, "measurement"), iter_html_markdown(path))
+
+@cached_parser("pymupdf4llm", "pymupdf", "pymupdf-layout")
+def ingest_pdf(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Ingests any other PDF: one chunk per table row plus the text of each section
+    (see chunk_markdown_tables), with the "document" type.
+    """
+    yield from timed_split(
+        lambda lines: iter_markdown_table_chunks(lines, path.name, "document"), iter_lines(iter_pdf_markdown(path))
+    )
+
+@cached_parser()
+def ingest_html(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Ingests any other HTML page like ingest_pdf, converted incrementally (see HtmlMarkdownConverter).
+    """
+    yield from timed_split(lambda lines: iter_markdown_table_chunks(lines, path.name, "document"), iter_html_markdown(path))
+
+def _iter_text_lines(path: Path) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            yield line.rstrip("\r\n")
+
+@cached_parser()
+def ingest_markdown(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Ingests Markdown and plain text files like ingest_pdf, read line by line.
+    """
+    yield from timed_split(lambda lines: iter_markdown_table_chunks(lines, path.name, "document"), _iter_text_lines(path))
+
+# Bytes read to identify a file without a known extension, and characters of text its parser is chosen on
+SNIFF_BYTES = 4096
+PROBE_CHARS = 8192
+
+def _pdf_probe(path: Path) -> str:
+    """
+    Text of the first page of a PDF, without layout analysis (a few milliseconds).
+    """
+    import pymupdf
+
+    with pymupdf.open(str(path)) as doc:
+        return doc[0].get_text()[:PROBE_CHARS] if doc.page_count else ""
+
+def _html_probe(path: Path) -> str:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        head = f.read(8 * PROBE_CHARS)
+    head = re.sub(r"<(script|style)\b.*?</\1\s*>", " ", head, flags=re.IGNORECASE | re.DOTALL)
+    return re.sub(r"<[^>]*>", " ", head)[:PROBE_CHARS]
+
+def _text_probe(path: Path) -> str:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read(PROBE_CHARS)
+
+class ParserRegistry:
+    """
+    Chooses the parser of a file from its media type and content.
+
+    The media type comes from the file extension or, for unknown extensions, from the
+    file's leading bytes. The beginning of the document's text (the "probe", extracted
+    without conversion) is then matched against the sniffers of the parsers registered
+    for that type, in registration order; the parser registered without a sniffer is
+    the type's fallback. So supplier files are routed by what they contain, whatever
+    they are named.
+    """
+
+    def __init__(self):
+        self._probes: Dict[str, Callable[[Path], str]] = {}
+        self._parsers: List[Tuple[str, Tuple[str, ...], Optional[re.Pattern], Callable[[Path], Iterable[Dict[str, Any]]]]] = []
+
+    def add_media_type(self, media_type: str, probe: Callable[[Path], str]):
+        """
+        Declares a supported media type and the function extracting its probe text.
+        """
+        self._probes[media_type] = probe
+
+    def register(
+        self,
+        name: str,
+        parse: Callable[[Path], Iterable[Dict[str, Any]]],
+        media_types: Iterable[str],
+        sniff: Optional[str] = None,
+    ):
+        """
+        Registers a parser.
+
+        Args:
+            name: Parser name (reported by ingestion and the benchmarks).
+            parse: Function yielding the chunks of a file.
+            media_types: Media types the parser handles.
+            sniff: Regular expression searched in the lowercased, whitespace-normalized
+                probe text; None registers the fallback parser of its media types.
+        """
+        pattern = re.compile(sniff, re.DOTALL) if sniff is not None else None
+        self._parsers.append((name, tuple(media_types), pattern, parse))
+
+    def media_type(self, path: Path) -> Optional[str]:
+        """
+        Media type of a file if it is supported: from its extension, else from its leading bytes.
+        """
+        media_type = mimetypes.guess_type(path.name, strict=False)[0]
+        if media_type in self._probes:
+            return media_type
+        if media_type is not None and not media_type.startswith("text/"):
+            return None
+        with open(path, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+        if head.startswith(b"%PDF-"):
+            media_type = "application/pdf"
+        elif b"\x00" in head:
+            return None
+        elif re.match(rb"(\xef\xbb\xbf)?\s*(<!--.*?-->\s*)*<(!doctype\s+html|html)\b", head, re.IGNORECASE | re.DOTALL):
+            media_type = "text/html"
+        else:
+            media_type = "text/plain"
+        return media_type if media_type in self._probes else None
+
+    def supports(self, path: Path) -> bool:
+        return self.media_type(path) is not None
+
+    def resolve(self, path: Path) -> Tuple[str, Callable[[Path], Iterable[Dict[str, Any]]]]:
+        """
+        Returns the name and function of the parser for a file.
+
+        Raises:
+            KeyError: If the file's media type is not supported.
+        """
+        media_type = self.media_type(path)
+        if media_type is None:
+            raise KeyError(f"no parser for {path.name}")
+        candidates = [(name, sniff, parse) for name, media_types, sniff, parse in self._parsers if media_type in media_types]
+        if any(sniff is not None for _, sniff, _ in candidates):
+            probe = " ".join(self._probes[media_type](path).lower().split())
+            for name, sniff, parse in candidates:
+                if sniff is not None and sniff.search(probe):
+                    return name, parse
+        for name, sniff, parse in candidates:
+            if sniff is None:
+                return name, parse
+        raise KeyError(f"no parser for {path.name} ({media_type})")
+
+parsers = ParserRegistry()
+parsers.add_media_type("application/pdf", _pdf_probe)
+parsers.add_media_type("text/html", _html_probe)
+parsers.add_media_type("application/xhtml+xml", _html_probe)
+parsers.add_media_type("text/markdown", _text_probe)
+parsers.add_media_type("text/plain", _text_probe)
+
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+parsers.register("fmd", ingest_fmd_pdf, ["application/pdf"], sniff=r"\b(full )?material (disclosure|declaration)\b|\bfmd\b")
+parsers.register("reach", ingest_reach_pdf, ["application/pdf"], sniff=r"\b1907/2006\b|\breach\b.*\b(certificate|declaration)\b|\b(certificate|declaration)\b.*\breach\b")
+parsers.register("measurement", ingest_parts_html, HTML_TYPES, sniff=r"\b(measurement|inspection) report\b")
+parsers.register("pdf", ingest_pdf, ["application/pdf"])
+parsers.register("html", ingest_html, HTML_TYPES)
+parsers.register("markdown", ingest_markdown, ["text/markdown", "text/plain"])
+
+# Parsers pinned to exact file names, checked before the registry (for files whose
+# content does not identify their type). Parsers yield chunks as they are produced.
+PARSERS: Dict[str, Callable[[Path], Iterable[Dict[str, Any]]]] = {}
+
+def resolve_parser(path: Path) -> Tuple[str, Callable[[Path], Iterable[Dict[str, Any]]]]:
+    """
+    Returns the name and function of the parser for a file: its PARSERS entry, or the registry's choice.
+
+    Raises:
+        KeyError: If no parser handles the file.
+    """
+    if path.name in PARSERS:
+        parse = PARSERS[path.name]
+        return getattr(parse, "__name__", "custom"), parse
+    return parsers.resolve(path)
+
+def is_supported(path: Path) -> bool:
+    """
+    Whether a file has a parser, judged from its name and leading bytes only (no text extraction).
+    """
+    return path.name in PARSERS or parsers.supports(path)
+
+class ParseTimeoutError(Exception):
+    """
+    Raised when parsing a single file exceeds its time budget.
+    """
+
+def _raise_timeout(signum, frame):
+    raise ParseTimeoutError("parsing timed out")
+
+def parse_file(path: Path, timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Parses a file with the parser chosen for it (see resolve_parser), yielding its chunks.
+    Runs in ingestion worker processes, so it must stay importable without side effects.
+
+    Args:
+        path: File to parse.
+        timeout: Optional time budget in seconds. Enforced with SIGALRM where available
+            (POSIX, main thread of the process); ignored otherwise. Only time spent in
+            the parser counts: the timer is paused while the caller handles a chunk, so
+            an abandoned iterator never leaves an alarm armed.
+
+    Raises:
+        KeyError: If no parser handles the file.
+        ParseTimeoutError: If the time budget is exceeded.
+    """
+    name, parse = resolve_parser(path)
+    tracer.current().set(parser=name)
+    use_alarm = (
+        timeout is not None and timeout > 0
+        and hasattr(signal, "SIGALRM")
+        and threading.current_thread() is threading.main_thread()
+    )
+    if not use_alarm:
+        yield from parse(path)
+        return
+
+    chunks = None
+    remaining = timeout
+    while True:
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, remaining)
+        try:
+            if chunks is None:
+                chunks = iter(parse(path))
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        except ParseTimeoutError:
+            raise ParseTimeoutError(f"exceeded the {timeout:g}s parsing budget") from None
+        finally:
+            remaining = max(signal.setitimer(signal.ITIMER_REAL, 0)[0], 1e-6)
+            signal.signal(signal.SIGALRM, previous)
+        yield chunk
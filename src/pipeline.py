@@ -0,0 +1,179 @@
+import asyncio
+import weakref
+from typing import Any, Callable, List, Optional, Tuple
+from langchain_core.documents import Document
+from src.config import ANSWER_CACHE_ENABLED, QUERY_CONCURRENCY, RETRIEVAL_TIMEOUT, LLM_TIMEOUT
+from src.retriever import aretrieve_context, retrieve_context_batch, get_embeddings
+from src.answer_cache import get_answer_cache
+from src.inference import agenerate_answer, astream_answer, chunk_scores, error_response, ComplianceResponse, ERROR_ANSWER_PREFIX
+from src.resources import registry
+from src.tracing import span
+
+# One limiter per event loop: asyncio primitives cannot be shared across loops
+_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def _get_limiter() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    limiter = _limiters.get(loop)
+    if limiter is None:
+        limiter = _limiters[loop] = asyncio.Semaphore(QUERY_CONCURRENCY)
+    return limiter
+
+async def aanswer_query(
+    query: str,
+    verbose: bool = False,
+    on_token: Optional[Callable[[str], None]] = None,
+) -> ComplianceResponse:
+    """
+    Orchestrates the RAG flow for a single query without blocking the event loop.
+
+    At most QUERY_CONCURRENCY queries run at once per event loop; the rest wait.
+    Retrieval and generation are bounded by RETRIEVAL_TIMEOUT and LLM_TIMEOUT;
+    a timed out stage yields a safe error response instead of hanging.
+
+    If `on_token` is given, the answer text is streamed to it as the LLM produces it.
+    Answers that do not come from the LLM (cache hits, not found, errors) are passed
+    to it in one piece, so callers can print every answer the same way.
+    """
+    async with _get_limiter():
+        with registry.track_query(), span("query", query=query):
+            return await _aanswer_query(query, verbose, on_token)
+
+async def _aanswer_query(
+    query: str,
+    verbose: bool,
+    on_token: Optional[Callable[[str], None]] = None,
+) -> ComplianceResponse:
+    if verbose:
+        print(f"\nUser Query: {query}")
+        print("Retrieving context...")
+
+    try:
+        context_docs, max_confidence = await asyncio.wait_for(aretrieve_context(query), RETRIEVAL_TIMEOUT)
+    except asyncio.TimeoutError:
+        response = error_response(TimeoutError(f"retrieval timed out after {RETRIEVAL_TIMEOUT:g}s"), 0.0)
+        if on_token is not None:
+            on_token(response.answer)
+        return response
+
+    if verbose:
+        print(f"Max Confidence: {max_confidence:.4f}")
+        print(f"Documents Retrieved: {len(context_docs)}")
+
+    query_vector = None
+    exact = any(doc.metadata.get("match_type") == "exact" for doc in context_docs)
+    if ANSWER_CACHE_ENABLED and context_docs and not exact:
+        # The query embedding was just computed for retrieval, so this is an embedding cache hit
+        with span("answer_cache_embed"):
+            query_vector = await get_embeddings().aembed_query(query)
+
+    return await _agenerate_with_cache(query, context_docs, max_confidence, query_vector, verbose, on_token)
+
+async def _agenerate_with_cache(
+    query: str,
+    context_docs: List[Document],
+    max_confidence: float,
+    query_vector: Optional[List[float]],
+    verbose: bool = False,
+    on_token: Optional[Callable[[str], None]] = None,
+) -> ComplianceResponse:
+    """
+    Serves the answer from the semantic answer cache when possible, otherwise calls
+    the LLM (bounded by LLM_TIMEOUT, streamed to `on_token` if given) and caches the result.
+    """
+    answer_cache = None
+    if ANSWER_CACHE_ENABLED and context_docs and query_vector is not None:
+        answer_cache = get_answer_cache()
+        with span("answer_cache") as cache_span:
+            cached = answer_cache.lookup(query_vector, context_docs)
+            cache_span.set(hits=int(cached is not None), misses=int(cached is None))
+        if cached is not None:
+            response, distance = cached
+            if verbose:
+                print(f"Answer cache: HIT (distance {distance:.4f})")
+            response.confidence = max_confidence
+            response.chunk_scores = chunk_scores(context_docs)
+            if on_token is not None:
+                on_token(response.answer)
+            return response
+        if verbose:
+            print("Answer cache: MISS")
+
+    streamed = []
+
+    def emit(token: str):
+        streamed.append(token)
+        on_token(token)
+
+    if on_token is not None and context_docs:
+        generation = astream_answer(query, context_docs, max_confidence, emit, verbose)
+    else:
+        generation = agenerate_answer(query, context_docs, max_confidence, verbose)
+
+    try:
+        response = await asyncio.wait_for(generation, LLM_TIMEOUT)
+    except asyncio.TimeoutError:
+        response = error_response(TimeoutError(f"generation timed out after {LLM_TIMEOUT:g}s"), max_confidence)
+
+    if on_token is not None:
+        # Complete the streamed text, or print answers that never went through the stream
+        text = "".join(streamed)
+        if not streamed:
+            on_token(response.answer)
+        elif response.answer.startswith(text) and len(response.answer) > len(text):
+            on_token(response.answer[len(text):])
+        elif not response.answer.startswith(text):
+            on_token("\n" + response.answer)
+
+    if answer_cache is not None and not response.answer.startswith(ERROR_ANSWER_PREFIX):
+        answer_cache.store(query_vector, context_docs, response)
+    return response
+
+async def abatch_answer(
+    items: List[Tuple[Any, str]],
+    on_result: Callable[[Any, str, ComplianceResponse], None],
+    concurrency: Optional[int] = None,
+):
+    """
+    Answers many queries with shared work:
+    - all queries are embedded in batched calls,
+    - all similarity searches run against the one open collection,
+    - LLM calls run with at most `concurrency` (default QUERY_CONCURRENCY) in flight.
+
+    Args:
+        items: (id, query) pairs.
+        on_result: Called with (id, query, response) as soon as each answer completes,
+            in completion order.
+        concurrency: Maximum LLM calls in flight.
+    """
+    if not items:
+        return
+
+    with span("batch", queries=len(items)):
+        await _abatch_answer(items, on_result, concurrency)
+
+async def _abatch_answer(
+    items: List[Tuple[Any, str]],
+    on_result: Callable[[Any, str, ComplianceResponse], None],
+    concurrency: Optional[int],
+):
+    queries = [query for _, query in items]
+    contexts, vectors = await asyncio.to_thread(retrieve_context_batch, queries)
+    limiter = asyncio.Semaphore(concurrency or QUERY_CONCURRENCY)
+
+    async def answer(item: Tuple[Any, str], context: Tuple[List[Document], float], vector: Optional[List[float]]):
+        async with limiter:
+            with registry.track_query(), span("query", query=item[1]):
+                response = await _agenerate_with_cache(item[1], context[0], context[1], vector)
+        return item, response
+
+    tasks = [answer(item, context, vector) for item, context, vector in zip(items, contexts, vectors)]
+    for next_done in asyncio.as_completed(tasks):
+        (item_id, query), response = await next_done
+        on_result(item_id, query, response)
+
+def answer_query(query: str, verbose: bool = False) -> ComplianceResponse:
+    """
+    Synchronous wrapper around aanswer_query for the CLI.
+    """
+    return asyncio.run(aanswer_query(query, verbose))
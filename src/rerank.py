@@ -0,0 +1,99 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from src.local_embeddings import normalize_rows
+
+def cosine_similarities(query_vectors: np.ndarray, doc_vectors: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity of every query to every document in one matrix product.
+
+    Args:
+        query_vectors: Matrix of shape (queries, dim).
+        doc_vectors: Matrix of shape (documents, dim).
+
+    Returns:
+        Matrix of shape (queries, documents).
+    """
+    return normalize_rows(np.atleast_2d(query_vectors)) @ normalize_rows(np.atleast_2d(doc_vectors)).T
+
+def mmr_select(query_vector: np.ndarray, doc_vectors: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+    """
+    Maximal marginal relevance: greedily picks `k` documents, trading similarity to the
+    query against similarity to the documents already picked.
+
+    The document/document similarity matrix is computed once; each step is one vectorized
+    max over it, so no embedding call is made and the cost stays negligible next to the search.
+
+    Args:
+        query_vector: Query embedding of shape (dim,).
+        doc_vectors: Candidate embeddings of shape (documents, dim), in search rank order.
+        k: Number of documents to pick.
+        lambda_mult: 1.0 ranks by query similarity only; lower values favour diversity.
+
+    Returns:
+        Indices of the picked documents, in pick order.
+    """
+    count = len(doc_vectors)
+    if count == 0 or k <= 0:
+        return []
+    doc_vectors = normalize_rows(np.asarray(doc_vectors, dtype=np.float32))
+    relevance = doc_vectors @ normalize_rows(np.asarray(query_vector, dtype=np.float32)[None, :])[0]
+    if lambda_mult >= 1.0:
+        return [int(i) for i in np.argsort(-relevance, kind="stable")[:k]]
+
+    pairwise = doc_vectors @ doc_vectors.T
+    picked = [int(np.argmax(relevance))]
+    redundancy = pairwise[picked[0]].copy()
+    available = np.ones(count, dtype=bool)
+    available[picked[0]] = False
+    while len(picked) < min(k, count):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return picked
+
+class GroundingThresholds:
+    """
+    Grounding thresholds calibrated per source file (see src/scripts/eval_retrieval.py).
+
+    Relevance scores are not comparable across documents: a short table row and a long
+    certificate section reach different scores for equally relevant questions. Sources
+    without a calibrated value use the global threshold.
+
+    Args:
+        sources: Threshold per source file name.
+        embedding_model: Embedding model the thresholds were calibrated for.
+    """
+
+    def __init__(self, sources: Optional[Dict[str, float]] = None, embedding_model: Optional[str] = None):
+        self.sources = dict(sources or {})
+        self.embedding_model = embedding_model
+
+    def for_sources(self, sources: Sequence[Optional[str]], default: float) -> np.ndarray:
+        """
+        Threshold of each document, given the source file of each.
+        """
+        return np.array([self.sources.get(source, default) for source in sources], dtype=np.float64)
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"embedding_model": self.embedding_model, "sources": self.sources}
+        path.write_text(json.dumps(payload, indent=2, sort_keys=True), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path, embedding_model: str) -> "GroundingThresholds":
+        """
+        Loads the calibration at `path`. A missing file, or one calibrated for another
+        embedding model, yields no per-source thresholds.
+        """
+        try:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return cls(embedding_model=embedding_model)
+        if payload.get("embedding_model") != embedding_model:
+            return cls(embedding_model=embedding_model)
+        return cls({source: float(value) for source, value in payload.get("sources", {}).items()}, embedding_model)
@@ -0,0 +1,100 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+class ResourceRegistry:
+    """
+    Process-wide registry of expensive, reusable resources (embedding client,
+    vector store, LLM chain). Each resource is built once by its factory and
+    reused until explicitly invalidated (e.g. after --wipe or re-ingestion).
+
+    Time spent building resources is tracked separately from time spent
+    serving queries so both can be reported.
+    """
+
+    def __init__(self):
+        self._resources: Dict[str, Any] = {}
+        self._closers: Dict[str, Callable[[Any], None]] = {}
+        self._lock = threading.RLock()
+        self.setup_count = 0
+        self.setup_seconds = 0.0
+        self.query_count = 0
+        self.query_seconds = 0.0
+
+    def get(self, name: str, factory: Callable[[], Any], close: Optional[Callable[[Any], None]] = None) -> Any:
+        """
+        Returns the cached resource `name`, building it with `factory` on first use.
+
+        Args:
+            name: Registry key of the resource.
+            factory: Zero-argument callable that builds the resource.
+            close: Optional callable invoked with the resource when it is invalidated.
+        """
+        with self._lock:
+            if name in self._resources:
+                return self._resources[name]
+
+            start = time.perf_counter()
+            resource = factory()
+            self.setup_seconds += time.perf_counter() - start
+            self.setup_count += 1
+
+            self._resources[name] = resource
+            if close is not None:
+                self._closers[name] = close
+            return resource
+
+    def invalidate(self, *names: str):
+        """
+        Drops the given resources (all resources if no name is given) so they
+        are rebuilt on next use.
+        """
+        with self._lock:
+            targets = names or tuple(self._resources)
+            for name in targets:
+                resource = self._resources.pop(name, None)
+                close = self._closers.pop(name, None)
+                if resource is not None and close is not None:
+                    close(resource)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._resources
+
+    @contextmanager
+    def track_query(self):
+        """
+        Context manager that accounts the wrapped block as query-serving time.
+        Setup performed lazily inside the block is excluded from the query time.
+        """
+        setup_before = self.setup_seconds
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            setup_during = self.setup_seconds - setup_before
+            self.query_seconds += max(elapsed - setup_during, 0.0)
+            self.query_count += 1
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "resources_loaded": len(self._resources),
+            "setup_count": self.setup_count,
+            "setup_seconds": self.setup_seconds,
+            "query_count": self.query_count,
+            "query_seconds": self.query_seconds,
+        }
+
+    def report(self) -> str:
+        """
+        Human readable summary of setup vs. query time.
+        """
+        s = self.stats()
+        avg = s["query_seconds"] / s["query_count"] if s["query_count"] else 0.0
+        return (
+            f"Setup: {s['setup_seconds']:.3f}s ({s['setup_count']} resources built) | "
+            f"Queries: {s['query_count']} in {s['query_seconds']:.3f}s (avg {avg:.3f}s)"
+        )
+
+registry = ResourceRegistry()
@@ -1,56 +1,512 @@
-from typing import List, Tuple
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import re
+import json
+import asyncio
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import numpy as np
 from langchain_core.documents import Document
-from src.config import CHROMA_DIR, EMBEDDING_MODEL_NAME, GOOGLE_API_KEY, GROUNDING_THRESHOLD
+from langchain_core.embeddings import Embeddings
+from src.config import (
+    EMBEDDING_MODEL_NAME, GROUNDING_THRESHOLD, GROUNDING_CALIBRATION_PATH, require_google_api_key,
+    RETRIEVAL_FETCH_K, RETRIEVAL_TOP_K, RETRIEVAL_MMR_LAMBDA,
+    EMBEDDING_BACKEND, LOCAL_EMBEDDING_DIM, LOCAL_EMBEDDING_BATCH_SIZE, LOCAL_EMBEDDING_WORKERS,
+    EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES,
+)
+from src.embedding_cache import CachedEmbeddings
+from src.local_embeddings import LocalEmbeddings, HashingEmbeddings, OnnxEmbeddings, build_local_embeddings
+from src.lexical import get_lexical_index, extract_identifiers, reciprocal_rank_fusion
+from src.table_index import get_table_index
+from src.dedup import collapse_near_duplicates, merge_duplicates
+from src.router import Route, route_query
+from src.rerank import GroundingThresholds, cosine_similarities, mmr_select
+from src.resources import registry
+from src.storage import storage_paths
+from src.vector_index import COLLECTION_NAME, apply_search_parameters, index_configuration
+from src.tracing import span, traced
 
-def get_vectorstore() -> Chroma:
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+
+# (Document, cosine score, stored embedding) of an over-fetched vector search hit
+Candidate = Tuple[Document, float, List[float]]
+
+# Metadata fields holding a chunk's own identifiers: an exact match must carry the query's identifiers there
+IDENTIFIER_FIELDS = ("part_number", "cas", "lot")
+# Confidence of an exact match: every identifier of the query is the part, CAS or lot number of a
+# returned chunk (grounded by metadata, without a similarity score)
+EXACT_MATCH_CONFIDENCE = 1.0
+
+def embedding_model_id() -> str:
+    """
+    Identifies the configured embedding model. Vectors of different models are not
+    comparable, so the index is rebuilt when it changes.
+    """
+    if EMBEDDING_BACKEND == "google":
+        return EMBEDDING_MODEL_NAME
+    if EMBEDDING_BACKEND == "hashing":
+        return f"hashing-{LOCAL_EMBEDDING_DIM}"
+    return OnnxEmbeddings.name
+
+def _build_embeddings() -> Embeddings:
+    if EMBEDDING_BACKEND == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        embeddings = GoogleGenerativeAIEmbeddings(
+            model=EMBEDDING_MODEL_NAME,
+            google_api_key=require_google_api_key()
+        )
+    else:
+        embeddings = build_local_embeddings(
+            EMBEDDING_BACKEND, LOCAL_EMBEDDING_DIM, LOCAL_EMBEDDING_BATCH_SIZE, LOCAL_EMBEDDING_WORKERS
+        )
+        if isinstance(embeddings, HashingEmbeddings):
+            # Hashing a text is cheaper than looking it up in the cache
+            return embeddings
+    if not EMBEDDING_CACHE_ENABLED:
+        return embeddings
+    return CachedEmbeddings(
+        embeddings,
+        model_name=embedding_model_id(),
+        path=EMBEDDING_CACHE_PATH,
+        max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+        query_batch=lambda texts: _embed_queries_uncached(embeddings, texts),
+    )
+
+def _embed_queries_uncached(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    if isinstance(embeddings, LocalEmbeddings):
+        # Local backends embed queries like documents, in batches
+        return embeddings.embed_documents(texts)
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    if isinstance(embeddings, GoogleGenerativeAIEmbeddings):
+        # Gemini embeds a whole batch of queries in one request when asked for the query task type
+        return embeddings.embed_documents(texts, task_type="RETRIEVAL_QUERY")
+    return [embeddings.embed_query(text) for text in texts]
+
+def get_embeddings() -> Embeddings:
+    """
+    Returns the process-wide embedding client, building it on first use.
+    Unless disabled with EMBEDDING_CACHE=0, it is wrapped in a persistent cache.
+    """
+    return registry.get(
+        "embeddings",
+        _build_embeddings,
+        close=_close_embeddings,
+    )
+
+def _close_embeddings(embeddings: Embeddings):
+    """
+    Closes the embedding cache and shuts down the thread pool of a local backend.
+    """
+    for layer in (embeddings, getattr(embeddings, "embeddings", None)):
+        if isinstance(layer, (CachedEmbeddings, LocalEmbeddings)):
+            layer.close()
+
+def embedding_cache_stats() -> Optional[Dict[str, int]]:
+    """
+    Hit/miss counters of the embedding cache, or None if it is disabled or not loaded yet.
+    """
+    if not registry.is_loaded("embeddings"):
+        return None
+    embeddings = get_embeddings()
+    return embeddings.stats() if isinstance(embeddings, CachedEmbeddings) else None
+
+def _close_vectorstore(vectorstore: "Chroma"):
+    """
+    Releases the underlying Chroma client so the persist directory can be wiped or reopened.
+    """
+    client = getattr(vectorstore, "_client", None)
+    if client is not None and hasattr(client, "close"):
+        client.close()
+
+class _TracedEmbeddings(Embeddings):
+    """
+    Embedding function handed to Chroma. Delegates to the shared client inside a span,
+    so embedding the query is timed apart from the vector search itself.
+    """
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with span("embed", texts=len(texts)):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with span("query_embed"):
+            return self.embeddings.embed_query(text)
+
+def _open_vectorstore() -> "Chroma":
+    from langchain_chroma import Chroma
+
+    vectorstore = Chroma(
+        collection_name=COLLECTION_NAME,
+        persist_directory=str(storage_paths().chroma_dir),
+        embedding_function=_TracedEmbeddings(get_embeddings()),
+        collection_configuration=index_configuration(),
+    )
+    # A new collection is built with the configured metric and HNSW parameters; an existing
+    # one keeps its build parameters (see src/vector_index.py) but searches with HNSW_EF_SEARCH
+    apply_search_parameters(vectorstore._collection)
+    return vectorstore
+
+def get_vectorstore() -> "Chroma":
     """
     Loads the Chroma vector store from the persist directory.
+    The store is opened once per process and reused until invalidated.
+    """
+    return registry.get("vectorstore", _open_vectorstore, close=_close_vectorstore)
+
+def embed_queries(queries: List[str]) -> List[List[float]]:
+    """
+    Embeds several queries in as few model calls as possible.
+    """
+    embeddings = get_embeddings()
+    with span("query_embed", queries=len(queries)):
+        if isinstance(embeddings, CachedEmbeddings):
+            return embeddings.embed_queries(queries)
+        return _embed_queries_uncached(embeddings, queries)
+
+def get_grounding_thresholds() -> GroundingThresholds:
     """
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model=EMBEDDING_MODEL_NAME,
-        google_api_key=GOOGLE_API_KEY
+    Returns the per-source grounding thresholds calibrated for the configured embedding model.
+    """
+    return registry.get(
+        "grounding_thresholds",
+        lambda: GroundingThresholds.load(GROUNDING_CALIBRATION_PATH, embedding_model_id()),
     )
-    
-    return Chroma(
-        persist_directory=str(CHROMA_DIR),
-        embedding_function=embeddings
+
+def _fetch_documents(ids: List[str], where: Optional[Dict] = None) -> List[Document]:
+    """
+    Loads documents by ID from Chroma (no embedding involved), only those matching the
+    `where` metadata filter if given, preserving the order of `ids`.
+    """
+    if not ids:
+        return []
+    data = get_vectorstore().get(ids=ids, where=where, include=["documents", "metadatas"])
+    by_id = {
+        chunk_id: Document(id=chunk_id, page_content=text, metadata=metadata or {})
+        for chunk_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+    }
+    return [by_id[chunk_id] for chunk_id in ids if chunk_id in by_id]
+
+def _ground(candidates: List[Candidate], threshold: Optional[float]) -> Tuple[np.ndarray, float]:
+    """
+    Positions of the candidates scoring at least the threshold of their source (`threshold`
+    for every source when given, otherwise the calibrated per-source thresholds), and the
+    best score found.
+    """
+    if not candidates:
+        return np.zeros(0, dtype=np.int64), 0.0
+    scores = np.array([score for _, score, _ in candidates], dtype=np.float64)
+    if threshold is None:
+        sources = [doc.metadata.get("source") for doc, _, _ in candidates]
+        limits = get_grounding_thresholds().for_sources(sources, GROUNDING_THRESHOLD)
+    else:
+        limits = np.full(len(candidates), threshold)
+    return np.flatnonzero(scores >= limits), max(0.0, float(scores.max()))
+
+def _identifier_filter(query: str, identifiers: List[str]) -> Dict:
+    """
+    Chroma `where` filter matching chunks whose part, CAS or lot number is one of the query's
+    identifiers. Metadata keeps the documents' spelling, so each identifier is matched as
+    written in the query, lower case (as tokenized) and upper case.
+    """
+    spellings = set()
+    for identifier in identifiers:
+        spellings.update({identifier, identifier.upper()})
+        spellings.update(re.findall(re.escape(identifier), query, re.IGNORECASE))
+    values = sorted(spellings)
+    return {"$or": [{field: {"$in": values}} for field in IDENTIFIER_FIELDS]}
+
+def _exact_match(
+    query: str,
+    k: int,
+    route: Optional[Route] = None,
+    fetch_k: int = RETRIEVAL_FETCH_K,
+) -> Optional[List[Document]]:
+    """
+    Answers identifier queries (part, CAS or lot numbers) without embedding the query.
+    A substance question about a part ("lead in TC-3541-A") resolves to the matching
+    table rows through the table row index; otherwise the best chunks containing every
+    identifier of the query are taken from the lexical index.
+
+    The hits are grounded with one metadata-only Chroma `get`: only chunks whose own part,
+    CAS or lot number is an identifier of the query, and that are inside the query's route,
+    are kept (up to `fetch_k` lexical hits are filtered, then `k` kept). A chunk merely
+    mentioning a part in its text, or a part named in a question about the REACH certificate
+    pulling in its FMD rows, does not count. Returns None if the query has no identifier or
+    the chunks left do not carry every identifier of the query, so the query goes through
+    the (routed) vector search. Exact hits have no similarity score.
+    """
+    identifiers = extract_identifiers(query)
+    if not identifiers:
+        return None
+    where = _identifier_filter(query, identifiers)
+    route_where = route.where() if route is not None else None
+    if route_where is not None:
+        where = {"$and": [route_where, where]}
+    with span("exact_match", route=route.describe() if route is not None else "all") as match_span:
+        row_ids = get_table_index().lookup(query)
+        if row_ids:
+            ids = row_ids
+        else:
+            ids = [doc_id for doc_id, _ in get_lexical_index().search(query, k=fetch_k, require=identifiers)]
+        docs = merge_duplicates(_fetch_documents(ids, where)[:k])
+        covered = {
+            str(doc.metadata[field]).lower()
+            for doc in docs for field in IDENTIFIER_FIELDS if doc.metadata.get(field)
+        }
+        if not set(identifiers) <= covered:
+            docs = []
+        match_span.set(hits=len(docs))
+    if not docs:
+        return None
+    for doc in docs:
+        doc.metadata["match_type"] = "exact"
+        doc.metadata["score"] = None
+    return docs
+
+def _route(query: str) -> Route:
+    """
+    Routes a query to the document types and indexed part numbers it targets.
+    """
+    table_index = get_table_index()
+    return route_query(query, known_part=lambda part: bool(table_index.rows(part)))
+
+def vector_candidates(
+    vectors: List[List[float]],
+    where: Optional[Dict] = None,
+    fetch_k: int = RETRIEVAL_FETCH_K,
+) -> List[List[Candidate]]:
+    """
+    Over-fetches the `fetch_k` nearest chunks of each query vector in one multi-query
+    request, with their stored embeddings.
+
+    Chunks are scored by the cosine similarity of the embeddings, computed with NumPy and
+    clipped to [0, 1]. Unlike LangChain's relevance scores, derived from the distance
+    metric of the index, it means the same thing whatever the metric.
+
+    Args:
+        vectors: Query embeddings.
+        where: Optional Chroma metadata filter.
+        fetch_k: Candidates per query.
+
+    Returns:
+        One list of (Document, score, embedding) candidates per query, nearest first.
+    """
+    results = get_vectorstore()._collection.query(
+        query_embeddings=vectors,
+        n_results=fetch_k,
+        where=where,
+        include=["documents", "metadatas", "embeddings"],
     )
+    candidates = []
+    for vector, ids, documents, metadatas, embeddings in zip(
+        vectors, results["ids"], results["documents"], results["metadatas"], results["embeddings"]
+    ):
+        found = [(chunk_id, text, metadata, embedding) for chunk_id, text, metadata, embedding
+                 in zip(ids, documents, metadatas, embeddings) if text is not None]
+        if not found:
+            candidates.append([])
+            continue
+        scores = np.clip(cosine_similarities(
+            np.asarray(vector, dtype=np.float64), np.asarray([item[3] for item in found], dtype=np.float64)
+        )[0], 0.0, 1.0)
+        candidates.append([
+            (Document(id=chunk_id, page_content=text, metadata=metadata or {}), float(score), embedding)
+            for (chunk_id, text, metadata, embedding), score in zip(found, scores)
+        ])
+    return candidates
+
+def _rerank(
+    query_vector: List[float],
+    candidates: List[Candidate],
+    threshold: Optional[float],
+    k: int,
+    mmr_lambda: float,
+) -> Tuple[List[Tuple[Document, float]], float]:
+    """
+    Grounds and reranks over-fetched candidates without any embedding call.
+
+    Candidates below the threshold of their source are dropped (see _ground), and so are
+    near-duplicates of a better candidate (their references are merged into it); MMR
+    over the stored embeddings then picks up to `k` of the others. The score of each kept chunk
+    is recorded in its metadata ("score").
+
+    Returns:
+        The kept (Document, score) pairs in rank order and the best score found.
+    """
+    passed, max_score = _ground(candidates, threshold)
+    if not len(passed):
+        return [], max_score
+    passed = passed[collapse_near_duplicates([candidates[i][0] for i in passed])]
+
+    embeddings = np.asarray([candidates[i][2] for i in passed], dtype=np.float32)
+    ranked = []
+    for pick in mmr_select(np.asarray(query_vector, dtype=np.float32), embeddings, k, mmr_lambda):
+        doc, score, _ = candidates[passed[pick]]
+        doc.metadata["score"] = round(float(score), 4)
+        ranked.append((doc, float(score)))
+    return ranked, max_score
+
+def _fuse(
+    query: str,
+    ranked: List[Tuple[Document, float]],
+    max_score: float,
+    k: int,
+    route: Optional[Route] = None,
+) -> Tuple[List[Document], float]:
+    """
+    Fuses the reranked vector hits with BM25 results through reciprocal-rank fusion.
+
+    Grounding is still decided by the vector scores: if no vector hit passed its
+    threshold, nothing is returned. Otherwise lexical hits may join them (only those
+    inside the query's route), and the top `k` by fused rank are kept once near-duplicates
+    are merged. Each kept chunk lists every file and section its content appears in
+    (metadata["references"]) when it is shared.
+    """
+    if not ranked:
+        return [], max_score
+    with span("lexical_search"):
+        lexical_hits = get_lexical_index().search(query, k=k)
+    if not lexical_hits:
+        return merge_duplicates([doc for doc, _ in ranked]), max_score
 
-def retrieve_context(query: str, threshold: float = None) -> Tuple[List[Document], float]:
+    fused = reciprocal_rank_fusion([
+        [doc.id for doc, _ in ranked],
+        [doc_id for doc_id, _ in lexical_hits],
+    ])
+    candidates = {doc.id: doc for doc, _ in ranked}
+    lexical_only = [doc_id for doc_id, _ in lexical_hits if doc_id not in candidates]
+    for doc in _fetch_documents(lexical_only):
+        if route is None or route.matches(doc.metadata):
+            candidates[doc.id] = doc
+
+    ranked_docs = sorted(candidates.values(), key=lambda doc: fused.get(doc.id, 0.0), reverse=True)
+    return merge_duplicates(ranked_docs)[:k], max_score
+
+def _retrieve(
+    queries: List[str],
+    threshold: Optional[float],
+    k: Optional[int],
+    mmr_lambda: Optional[float],
+    query_batch_size: int,
+) -> Tuple[List[Tuple[List[Document], float]], List[Optional[List[float]]]]:
+    k = k or RETRIEVAL_TOP_K
+    mmr_lambda = RETRIEVAL_MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+    fetch_k = max(RETRIEVAL_FETCH_K, k)
+
+    contexts: List[Optional[Tuple[List[Document], float]]] = [None] * len(queries)
+    vectors: List[Optional[List[float]]] = [None] * len(queries)
+    # Queries are routed first: the route narrows exact matches and vector searches alike
+    routes = [_route(query) for query in queries]
+    to_embed = []
+    for i, query in enumerate(queries):
+        exact = _exact_match(query, k, routes[i] or None, fetch_k)
+        if exact is not None:
+            contexts[i] = (exact, EXACT_MATCH_CONFIDENCE)
+        else:
+            to_embed.append(i)
+
+    if not to_embed:
+        return contexts, vectors
+
+    embedded = embed_queries([queries[i] for i in to_embed])
+    for i, vector in zip(to_embed, embedded):
+        vectors[i] = vector
+
+    def search(positions: List[int], route: Optional[Route]):
+        """
+        Searches a group of queries sharing one route (None: the whole collection).
+        """
+        where = route.where() if route is not None else None
+        for start in range(0, len(positions), query_batch_size):
+            chunk = positions[start:start + query_batch_size]
+            with span("vector_search", queries=len(chunk), route=route.describe() if route is not None else "all"):
+                found = vector_candidates([vectors[i] for i in chunk], where, fetch_k)
+            for i, candidates in zip(chunk, found):
+                with span("rerank", candidates=len(candidates)):
+                    ranked, max_score = _rerank(vectors[i], candidates, threshold, k, mmr_lambda)
+                with span("fuse", candidates=len(ranked)):
+                    contexts[i] = _fuse(queries[i], ranked, max_score, k, route)
+
+    # Queries with the same route share multi-query requests
+    groups: Dict[str, Tuple[Optional[Route], List[int]]] = {}
+    for i in to_embed:
+        route = routes[i]
+        where = route.where()
+        key = json.dumps(where, sort_keys=True)
+        groups.setdefault(key, (route if where else None, []))[1].append(i)
+    for route, positions in groups.values():
+        search(positions, route)
+
+    # A misrouted query must not fail grounding: routed queries that found nothing are
+    # searched again over the whole collection
+    misrouted = [i for route, positions in groups.values() if route is not None for i in positions if not contexts[i][0]]
+    if misrouted:
+        search(misrouted, None)
+
+    return contexts, vectors
+
+@traced("retrieve")
+def retrieve_context(
+    query: str,
+    threshold: float = None,
+    k: int = None,
+    mmr_lambda: float = None,
+) -> Tuple[List[Document], float]:
     """
-    Performs a similarity search on ChromaDB and filters results based on a threshold.
-    
+    Performs a hybrid (vector + BM25) search on ChromaDB and filters results based on a threshold.
+    Queries whose identifiers are all the part, CAS or lot numbers of indexed chunks are
+    answered from the lexical and table row indexes without embedding the query (see _exact_match).
+
+    RETRIEVAL_FETCH_K candidates are fetched with their stored embeddings, scored by
+    cosine similarity, grounded against the threshold and reranked with MMR in memory;
+    the score of each returned chunk is in its metadata ("score").
+
     Args:
         query: The user query string.
-        threshold: Similarity threshold (0.0 to 1.0). Defaults to GROUNDING_THRESHOLD from config.
-        
+        threshold: Similarity threshold (0.0 to 1.0) applied to every source. Defaults to the
+            calibrated per-source thresholds, and GROUNDING_THRESHOLD for uncalibrated sources.
+        k: Maximum chunks returned. Defaults to RETRIEVAL_TOP_K.
+        mmr_lambda: MMR relevance/diversity trade-off. Defaults to RETRIEVAL_MMR_LAMBDA.
+
     Returns:
         A tuple containing:
         - A list of Document objects that passed the threshold.
         - The highest similarity score found.
     """
-    if threshold is None:
-        threshold = GROUNDING_THRESHOLD
-        
-    vectorstore = get_vectorstore()
-    
-    # search_with_score returns (Document, score)
-    # Note: Chroma score is often distance, so lower might be better depending on the method.
-    # However, for LangChain's vectorstore.similarity_search_with_relevance_scores, 
-    # it normalizes it to a similarity score where higher is better (0 to 1).
-    
-    results = vectorstore.similarity_search_with_relevance_scores(query, k=5)
-    
-    filtered_docs = []
-    max_score = 0.0
-    
-    for doc, score in results:
-        if score > max_score:
-            max_score = score
-            
-        if score >= threshold:
-            filtered_docs.append(doc)
-            
-    return filtered_docs, max_score
+    contexts, _ = _retrieve([query], threshold, k, mmr_lambda, query_batch_size=1)
+    return contexts[0]
+
+@traced("retrieve_batch")
+def retrieve_context_batch(
+    queries: List[str],
+    threshold: float = None,
+    query_batch_size: int = 256,
+    k: int = None,
+    mmr_lambda: float = None,
+) -> Tuple[List[Tuple[List[Document], float]], List[List[float]]]:
+    """
+    Retrieves context for many queries at once: queries are embedded in batched calls,
+    and those not answered by an exact identifier match are searched with multi-query
+    requests against the one open collection, then reranked and fused with BM25 results.
+
+    Args:
+        queries: The user queries.
+        threshold, k, mmr_lambda: See retrieve_context.
+        query_batch_size: Queries per Chroma query request.
+
+    Returns:
+        A tuple containing:
+        - One (filtered documents, highest score) pair per query, as retrieve_context returns.
+        - The query embeddings, in the same order (None for exact identifier matches, which are not embedded).
+    """
+    return _retrieve(queries, threshold, k, mmr_lambda, query_batch_size)
+
+async def aretrieve_context(query: str, threshold: float = None) -> Tuple[List[Document], float]:
+    """
+    Async version of retrieve_context.
+    The local Chroma client is synchronous, so the search runs in a worker thread.
+    """
+    return await asyncio.to_thread(retrieve_context, query, threshold)
@@ -0,0 +1,98 @@
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+# Phrases that tie a question to one document type (matched on the lowercased query)
+DOC_TYPE_KEYWORDS = {
+    "reach": ["echa", "candidate list", "certificate", "article 33", "signatory", "annex xiv", "annex xvii"],
+    "fmd": ["fmd", "material disclosure", "cas no", "cas number", "composition", "contain", "substance table"],
+    "measurement": [
+        "measure", "tolerance", "nominal", "inspection", "caliper", "micrometer", "gauge", "pitch",
+        "overall length", "diameter", "height", "thickness",
+    ],
+}
+
+# Regulation names (matched case-sensitively: "REACH", not the verb) mapped to the document type covering them
+REGULATIONS = {
+    "REACH": "reach",
+    "SVHC": "reach",
+    "1907/2006": "reach",
+}
+
+# Document types chunked per table row, whose chunks carry a part_number
+ROW_DOC_TYPES = {"fmd", "measurement"}
+
+PART_NUMBER_RE = re.compile(r"\b(?=[A-Z0-9-]*\d)[A-Z]{2,}[A-Z0-9]*(?:-[A-Z0-9]+){2,}\b")
+
+def _has_phrase(text: str, phrase: str) -> bool:
+    # Anchored at the start of a word only, so "measure" also matches "measured" and "measurement"
+    return re.search(rf"(?<![a-z0-9]){re.escape(phrase)}", text) is not None
+
+class Route:
+    """
+    Where a query should be searched: a subset of document types and/or part numbers.
+    An empty route searches the whole collection.
+
+    Args:
+        doc_types: Document types ("reach", "fmd", "measurement") the query targets.
+        part_numbers: Part numbers named in the query.
+        regulations: Regulations named in the query.
+    """
+
+    def __init__(self, doc_types: List[str] = (), part_numbers: List[str] = (), regulations: List[str] = ()):
+        self.doc_types = list(doc_types)
+        self.part_numbers = list(part_numbers)
+        self.regulations = list(regulations)
+
+    def __bool__(self) -> bool:
+        return self.where() is not None
+
+    def _uses_parts(self) -> bool:
+        # Only table row chunks carry a part number: a filter on it would hide every other section
+        return bool(self.part_numbers) and (not self.doc_types or set(self.doc_types) <= ROW_DOC_TYPES)
+
+    def where(self) -> Optional[Dict[str, Any]]:
+        """
+        Chroma `where` metadata filter of the route, or None for an unrouted query.
+        """
+        clauses = []
+        if self.doc_types:
+            clauses.append({"doc_type": {"$in": self.doc_types}} if len(self.doc_types) > 1 else {"doc_type": self.doc_types[0]})
+        if self._uses_parts():
+            clauses.append({"part_number": {"$in": self.part_numbers}} if len(self.part_numbers) > 1 else {"part_number": self.part_numbers[0]})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def matches(self, metadata: Dict[str, Any]) -> bool:
+        """
+        Whether a chunk with this metadata is inside the route (same semantics as `where`).
+        """
+        if self.doc_types and metadata.get("doc_type") not in self.doc_types:
+            return False
+        if self._uses_parts() and metadata.get("part_number") not in self.part_numbers:
+            return False
+        return True
+
+    def describe(self) -> str:
+        parts = [f"{name}={','.join(values)}" for name, values in
+                 (("doc_type", self.doc_types), ("part", self.part_numbers), ("regulation", self.regulations)) if values]
+        return " ".join(parts) or "all"
+
+def route_query(query: str, known_part: Optional[Callable[[str], bool]] = None) -> Route:
+    """
+    Detects the document types, regulations and part numbers a query targets.
+
+    Args:
+        query: The user query.
+        known_part: Optional predicate keeping only part numbers present in the index,
+            so document IDs shaped like part numbers (TC-QSP-17) do not narrow the search.
+    """
+    text = query.lower()
+    doc_types = [doc_type for doc_type, phrases in DOC_TYPE_KEYWORDS.items() if any(_has_phrase(text, p) for p in phrases)]
+    regulations = [name for name in REGULATIONS if re.search(rf"\b{re.escape(name)}\b", query)]
+    for regulation in regulations:
+        if REGULATIONS[regulation] not in doc_types:
+            doc_types.append(REGULATIONS[regulation])
+    part_numbers = [part for part in dict.fromkeys(PART_NUMBER_RE.findall(query.upper()))
+                    if known_part is None or known_part(part)]
+    return Route(doc_types, part_numbers, regulations)
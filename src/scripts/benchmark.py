@@ -0,0 +1,488 @@
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import platform
+import argparse
+import resource
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from contextlib import ExitStack
+
+# Add the project root to sys.path to allow importing from src
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(project_root))
+
+import pymupdf
+from bs4 import BeautifulSoup
+from src.config import DATA_DIR, CACHE_DIR
+from src.fakes import FakeEmbeddings, FakeAnswerChain
+from src.answer_cache import SemanticAnswerCache
+from src.parse_cache import set_parse_cache_enabled
+from src.parser import ingest_fmd_pdf, ingest_reach_pdf, ingest_parts_html, ingest_pdf, ingest_html, ingest_markdown, resolve_parser
+from src.resources import registry
+from src.storage import use_storage
+from src.tracing import tracer
+from src.scripts.load_test import percentile
+
+RESULTS_DIR = CACHE_DIR / "benchmarks"
+
+PART_PREFIXES = ["TC", "TR", "TP", "TCX", "TCC"]
+PRODUCT_TYPES = ["Connector", "Cable Assy", "Fastener", "Housing", "PCB", "Sensor", "Bracket"]
+SUBSTANCES = [
+    ("Silver (Ag)", "7440-22-4"), ("Aluminum (Al)", "7429-90-5"), ("Nickel (Ni)", "7440-02-0"),
+    ("Polycarbonate (PC)", "25037-45-0"), ("Polyamide 6/6 (PA66)", "32131-17-2"), ("Copper (Cu)", "7440-50-8"),
+    ("Gold (Au)", "7440-57-5"), ("Epoxy Resin", "61788-97-4"), ("Silicon Dioxide (SiO2)", "7631-86-9"),
+    ("Tin (Sn)", "7440-31-5"), ("Iron (Fe)", "7439-89-6"), ("Lead (Pb)", "7439-92-1"),
+]
+FEATURES = [
+    ("Overall Length (L)", 25.00, 0.10, "Digital Caliper"), ("Pin Pitch (P)", 2.54, 0.03, "Optical Comparator"),
+    ("Cable Outer Diameter (OD)", 4.80, 0.15, "Laser Micrometer"), ("Connector Height (H)", 8.50, 0.10, "Height Gauge"),
+    ("Board Thickness (T)", 1.60, 0.10, "Micrometer"), ("Mount Hole Diameter (Ø)", 3.20, 0.05, "Pin Gauge"),
+]
+
+FMD_INTRO = (
+    "This Full Material Disclosure (FMD) provides a summary of material substance content for the articles "
+    "identified by Test Corporation part numbers and revision levels. Percentages are provided as weight percent "
+    "(w/w) at the article level and are derived from internal bill-of-materials allocations and supplier-provided "
+    "declarations. Compliance status is provided for reference against internal restricted substance criteria."
+)
+REACH_SECTIONS = [
+    ("Scope", "This certificate applies to the articles identified in the Product Listing section and covers "
+              "standard commercial shipments made under Test Corporation part numbers and revision levels."),
+    ("Declaration", "Based on the data available at the time of issuance, the listed part numbers are declared "
+                    "compliant with the requirements applicable to articles under REACH, including obligations "
+                    "related to Substances of Very High Concern (SVHC). Where SVHC content exceeds 0.1% w/w in any "
+                    "article, communication obligations under Article 33 shall apply."),
+    ("Due Diligence", "Test Corporation maintains a documented process to capture regulatory updates and "
+                      "coordinate supplier outreach. Restricted Substances Management is covered by TC-QSP-17."),
+]
+
+GENERIC_QUERIES = [
+    "Which parts are flagged as not compliant?",
+    "What is the article-level threshold for SVHC content assessment?",
+    "What regulation number is referenced for REACH compliance?",
+    "Which measurement features failed inspection?",
+    "What internal procedure covers Restricted Substances Management?",
+]
+
+def _part_number(rng: random.Random) -> str:
+    return f"{rng.choice(PART_PREFIXES)}-{rng.randint(1000, 9999)}-{rng.choice('ABCDEF')}"
+
+def _write_pdf(html: str, path: Path):
+    """
+    Renders HTML (headings, paragraphs, bordered tables) to a paginated PDF with PyMuPDF.
+    """
+    story = pymupdf.Story(html=html)
+    writer = pymupdf.DocumentWriter(str(path))
+    mediabox = pymupdf.paper_rect("letter")
+    where = mediabox + (36, 36, -36, -36)
+    more = 1
+    while more:
+        device = writer.begin_page(mediabox)
+        more, _ = story.place(where)
+        story.draw(device)
+        writer.end_page()
+    writer.close()
+
+def _html_table(header: List[str], rows: List[List[str]]) -> str:
+    head = "".join(f"<th>{cell}</th>" for cell in header)
+    body = "".join("<tr>" + "".join(f"<td>{cell}</td>" for cell in row) + "</tr>" for row in rows)
+    return f'<table border="1"><tr>{head}</tr>{body}</table>'
+
+def _fmd_html(rng: random.Random, index: int, parts: List[str]) -> str:
+    rows = []
+    for part in parts:
+        revision, lot, product = f"R{rng.randint(1, 4)}", f"LOT-{rng.randint(10**7, 10**8 - 1)}", rng.choice(PRODUCT_TYPES)
+        substances = rng.sample(SUBSTANCES, rng.randint(2, 3))
+        weights = [rng.random() + 0.1 for _ in substances]
+        for (substance, cas), weight in zip(substances, weights):
+            status = "Not Compliant" if substance.startswith("Lead") else "Compliant"
+            rows.append([part, revision, lot, product, substance, cas, f"{100 * weight / sum(weights):.2f}%", status])
+    return (
+        "<h1>Full Material Disclosure (FMD) — Articles Supplied by Test Corporation</h1>"
+        f"<p><b>Issuer:</b> Test Corporation <b>Document ID:</b> TC-FMD-{index:05d}</p><p>{FMD_INTRO}</p>"
+        "<h2>Material Substance Table</h2>"
+        + _html_table(["Part Number", "Rev", "Lot/Trace", "Type", "Substance", "CAS No.", "Amount (w/w)", "Status"], rows)
+    )
+
+def _reach_html(rng: random.Random, index: int, parts: List[str]) -> str:
+    sections = "".join(f"<h2>{title}</h2><p>{text}</p>" for title, text in REACH_SECTIONS)
+    rows = [[part, f"R{rng.randint(1, 4)}", f"LOT-{rng.randint(10**7, 10**8 - 1)}", rng.choice(PRODUCT_TYPES)]
+            for part in parts]
+    return (
+        "<h1>Certificate of Compliance — REACH (EC) No 1907/2006</h1>"
+        f"<p><b>Issuer:</b> Test Corporation <b>Document ID:</b> TC-REACH-COC-{index:05d}</p>"
+        + sections + "<h2>Product Listing</h2>"
+        + _html_table(["Part Number", "Revision", "Lot / Trace", "Product Type"], rows)
+    )
+
+def _parts_html(rng: random.Random, template: str, parts: List[str]) -> str:
+    """
+    Replaces the measurement rows of the sample report with generated ones.
+    """
+    soup = BeautifulSoup(template, "html.parser")
+    tbody = soup.find("tbody")
+    tbody.clear()
+    for part in parts:
+        revision = f"R{rng.randint(1, 4)}"
+        for feature, nominal, tolerance, method in rng.sample(FEATURES, 2):
+            measured = nominal + rng.uniform(-1.5, 1.5) * tolerance
+            low, high = measured - tolerance / 3, measured + tolerance / 3
+            status = "Pass" if abs(measured - nominal) <= tolerance else "Fail"
+            cells = [f"<b>{part}</b><br /><span>Rev {revision}</span>", feature, f"{nominal:.2f}", f"±{tolerance:.2f}",
+                     f"{measured:.2f}", f"{low:.2f}", f"{high:.2f}", method, status]
+            tbody.append(BeautifulSoup("<tr>" + "".join(f"<td>{cell}</td>" for cell in cells) + "</tr>", "html.parser"))
+    return str(soup)
+
+def _packaging_spec(rng: random.Random, index: int, parts: List[str]) -> Dict[str, str]:
+    """
+    A supplier document of no known type (packaging specification), as HTML and Markdown.
+    """
+    header = ["Part Number", "Box", "Units per Box", "Gross Weight (kg)"]
+    rows = [[part, f"B{rng.randint(10, 99)}", str(rng.choice([10, 25, 50, 100])), f"{rng.uniform(0.5, 12):.2f}"] for part in parts]
+    title, intro = f"Packaging Specification PS-{index:05d}", "Packing units and gross weights of the listed articles."
+    markdown = "\n".join([f"# {title}", "", intro, "", "| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+                          + ["| " + " | ".join(row) + " |" for row in rows]) + "\n"
+    return {"html": f"<h1>{title}</h1><p>{intro}</p>" + _html_table(header, rows), "markdown": markdown}
+
+def generate_corpus(
+    out_dir: Path,
+    fmd: int = 10,
+    reach: int = 10,
+    html: int = 10,
+    parts_per_file: int = 20,
+    seed: int = 0,
+    generic: int = 0,
+) -> Dict[str, Any]:
+    """
+    Writes a deterministic synthetic corpus modeled on the sample documents in data/:
+    FMD PDFs (substance table), REACH certificate PDFs (sections and product listing)
+    and part measurement HTML reports (the sample report with generated rows). With
+    `generic`, that many packaging specifications are added as PDF, HTML and Markdown
+    each, for the generic parsers.
+
+    Returns:
+        The file name -> expected parser mapping of the corpus and the part numbers used.
+    """
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with open(DATA_DIR / "part_measurements_test_corporation.html", "r", encoding="utf-8") as f:
+        template = f.read()
+
+    parsers: Dict[str, Callable] = {}
+    all_parts: List[str] = []
+    for kind, count, parser in (("FMD", fmd, ingest_fmd_pdf), ("REACH", reach, ingest_reach_pdf), ("parts", html, ingest_parts_html)):
+        for i in range(count):
+            parts = [_part_number(rng) for _ in range(parts_per_file)]
+            all_parts.extend(parts)
+            if kind == "parts":
+                name = f"parts_{i:05d}.html"
+                (out_dir / name).write_text(_parts_html(rng, template, parts), encoding="utf-8")
+            else:
+                name = f"{kind}_{i:05d}.pdf"
+                content = _fmd_html(rng, i, parts) if kind == "FMD" else _reach_html(rng, i, parts)
+                _write_pdf(content, out_dir / name)
+            parsers[name] = parser
+    for i in range(generic):
+        parts = [_part_number(rng) for _ in range(parts_per_file)]
+        spec = _packaging_spec(rng, i, parts)
+        _write_pdf(spec["html"], out_dir / f"packaging_{i:05d}.pdf")
+        (out_dir / f"packaging_{i:05d}.html").write_text(f"<html><body>{spec['html']}</body></html>", encoding="utf-8")
+        (out_dir / f"packaging_{i:05d}.md").write_text(spec["markdown"], encoding="utf-8")
+        parsers.update({f"packaging_{i:05d}.pdf": ingest_pdf, f"packaging_{i:05d}.html": ingest_html, f"packaging_{i:05d}.md": ingest_markdown})
+    return {"parsers": parsers, "parts": all_parts}
+
+def directory_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) if path.exists() else 0
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process and of its (parser) child processes, in MB.
+    """
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=project_root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def benchmark_parsers(corpus_dir: Path, expected: Dict[str, Callable]) -> Dict[str, Any]:
+    """
+    Parses every corpus file once in this process, without the parse cache, with the
+    parser the registry picks for it.
+
+    Returns:
+        Per parser: files, MB, pages (PDF) and chunks per second, and the share of PDF
+        pages converted without the layout model; plus the files routed to another
+        parser than the one they were generated for.
+    """
+    totals: Dict[str, Dict[str, float]] = {}
+    misrouted = []
+    tracer.enable(keep=True)
+    tracer.drain()
+    parse_cache_enabled = set_parse_cache_enabled(False)
+    try:
+        for path in sorted(corpus_dir.iterdir()):
+            name, parse = resolve_parser(path)
+            if getattr(expected.get(path.name), "__name__", None) != getattr(parse, "__name__", None):
+                misrouted.append(path.name)
+            start = time.perf_counter()
+            chunks = sum(1 for _ in parse(path))
+            seconds = time.perf_counter() - start
+            pages = [span for span in tracer.drain() if span.name == "convert" and "page" in span.attributes]
+            total = totals.setdefault(name, {"files": 0, "bytes": 0, "pages": 0, "fast_pages": 0, "chunks": 0, "seconds": 0.0})
+            total["files"] += 1
+            total["bytes"] += path.stat().st_size
+            total["pages"] += len(pages)
+            total["fast_pages"] += sum(1 for span in pages if span.attributes.get("fast_path"))
+            total["chunks"] += chunks
+            total["seconds"] += seconds
+    finally:
+        set_parse_cache_enabled(parse_cache_enabled)
+        tracer.disable()
+
+    throughput = {}
+    for name, total in sorted(totals.items()):
+        seconds = total["seconds"] or 1e-9
+        throughput[name] = {
+            "files": total["files"],
+            "mean_ms": 1000 * seconds / total["files"],
+            "files_per_sec": total["files"] / seconds,
+            "mb_per_sec": total["bytes"] / 1e6 / seconds,
+            "chunks_per_sec": total["chunks"] / seconds,
+        }
+        if total["pages"]:
+            throughput[name]["pages_per_sec"] = total["pages"] / seconds
+            throughput[name]["fast_page_share"] = total["fast_pages"] / total["pages"]
+    return {"per_parser": throughput, "misrouted": misrouted}
+
+def _ms_stats(seconds: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(seconds),
+        "mean_ms": 1000 * sum(seconds) / len(seconds) if seconds else 0.0,
+        "p50_ms": 1000 * percentile(seconds, 50),
+        "p99_ms": 1000 * percentile(seconds, 99),
+    }
+
+def run_benchmark(
+    fmd: int = 10,
+    reach: int = 10,
+    html: int = 10,
+    parts_per_file: int = 20,
+    queries: int = 200,
+    concurrency: int = 32,
+    workers: Optional[int] = None,
+    embedding_latency: float = 0.0,
+    llm_latency: float = 0.0,
+    seed: int = 0,
+    work_dir: Optional[Path] = None,
+    generic: int = 0,
+) -> Dict[str, Any]:
+    """
+    Generates a synthetic corpus, ingests it and runs a query workload, all against
+    deterministic fake embedding and LLM backends (no network, no API key).
+
+    Returns:
+        JSON-serializable results: corpus size, parse time per file (per format),
+        per-parser throughput (see benchmark_parsers), embed batches/s, index size on
+        disk, query p50/p99 and throughput, and peak RSS.
+    """
+    from src.ingestion import ingest_data
+    from src.pipeline import aanswer_query
+
+    owns_work_dir = work_dir is None
+    work_dir = Path(tempfile.mkdtemp(prefix="rag-bench-")) if owns_work_dir else Path(work_dir)
+    corpus_dir = work_dir / "data"
+    chroma_dir = work_dir / "chroma_db"
+    stack = ExitStack()
+    params = {
+        "fmd": fmd, "reach": reach, "html": html, "parts_per_file": parts_per_file, "queries": queries,
+        "concurrency": concurrency, "workers": workers, "embedding_latency": embedding_latency,
+        "llm_latency": llm_latency, "seed": seed, "generic": generic,
+    }
+
+    try:
+        start = time.perf_counter()
+        corpus = generate_corpus(corpus_dir, fmd, reach, html, parts_per_file, seed, generic)
+        generate_seconds = time.perf_counter() - start
+
+        registry.invalidate()
+        embeddings = FakeEmbeddings(latency=embedding_latency)
+        chain = FakeAnswerChain(latency=llm_latency)
+        registry.get("embeddings", lambda: embeddings)
+        registry.get("chain", lambda: chain)
+        registry.get("stream_chain", lambda: chain)
+        # Everything is read from and written to the work directory, so the real chroma_db/ is never
+        # touched; a fresh parse cache makes parse timings measure conversion rather than earlier runs
+        stack.enter_context(use_storage(corpus_dir, chroma_dir, work_dir / "parse_cache"))
+
+        tracer.enable(keep=True)
+        tracer.drain()
+        start = time.perf_counter()
+        summary = ingest_data(verbose=False, workers=workers)
+        ingest_seconds = time.perf_counter() - start
+        spans = tracer.drain()
+        tracer.disable()
+
+        parse_seconds: Dict[str, List[float]] = {}
+        for span in spans:
+            if span.name == "parse":
+                parse_seconds.setdefault(Path(span.attributes.get("file", "")).suffix.lstrip("."), []).append(span.duration)
+        embed_batches = sum(1 for span in spans if span.name == "embed")
+        parsers = benchmark_parsers(corpus_dir, corpus["parsers"])
+
+        rng = random.Random(seed)
+        workload = [
+            f"How much lead is in part {rng.choice(corpus['parts'])}?" if i % 2 else GENERIC_QUERIES[i % len(GENERIC_QUERIES)]
+            for i in range(queries)
+        ]
+        # Repeated benchmark queries must reach the LLM stage
+        registry.get("answer_cache", lambda: SemanticAnswerCache(max_distance=-1.0))
+
+        async def run_queries() -> List[float]:
+            limiter = asyncio.Semaphore(concurrency)
+            latencies = []
+
+            async def one(query: str):
+                async with limiter:
+                    query_start = time.perf_counter()
+                    await aanswer_query(query)
+                    latencies.append(time.perf_counter() - query_start)
+
+            await asyncio.gather(*(one(query) for query in workload))
+            return latencies
+
+        start = time.perf_counter()
+        latencies = asyncio.run(run_queries())
+        query_seconds = time.perf_counter() - start
+
+        return {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": params,
+            "corpus": {
+                "files": len(corpus["parsers"]),
+                "bytes": directory_size(corpus_dir),
+                "generate_seconds": generate_seconds,
+            },
+            "ingestion": {
+                "seconds": ingest_seconds,
+                "chunks": summary["added"] + summary["updated"],
+                "failed_files": summary["failed"],
+                "parse_per_file": {fmt: _ms_stats(values) for fmt, values in sorted(parse_seconds.items())},
+                "embed_batches": embed_batches,
+                "embed_batches_per_sec": embed_batches / ingest_seconds if ingest_seconds else 0.0,
+                "chunks_per_sec": (summary["added"] + summary["updated"]) / ingest_seconds if ingest_seconds else 0.0,
+                "index_bytes": directory_size(chroma_dir),
+            },
+            "parsers": parsers,
+            "query": {
+                **_ms_stats(latencies),
+                "seconds": query_seconds,
+                "throughput_qps": queries / query_seconds if query_seconds else 0.0,
+                "llm_calls": chain.calls,
+            },
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    finally:
+        tracer.disable()
+        registry.invalidate()
+        stack.close()
+        if owns_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+# Metrics compared by --compare, with the direction that counts as an improvement
+COMPARED_METRICS = [
+    ("ingestion.seconds", "lower"),
+    ("ingestion.embed_batches_per_sec", "higher"),
+    ("ingestion.index_bytes", "lower"),
+    ("query.p50_ms", "lower"),
+    ("query.p99_ms", "lower"),
+    ("query.throughput_qps", "higher"),
+    ("peak_rss_mb", "lower"),
+]
+
+def _lookup(result: Dict[str, Any], dotted: str) -> Optional[float]:
+    value: Any = result
+    for key in dotted.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> str:
+    """
+    Formats the change of the key metrics between two benchmark results.
+    """
+    lines = [f"{'metric':<34} {'baseline':>12} {'current':>12} {'change':>8}"]
+    for metric, better in COMPARED_METRICS:
+        old, new = _lookup(baseline, metric), _lookup(current, metric)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        regressed = change > 0 if better == "lower" else change < 0
+        flag = "  (worse)" if regressed and abs(change) >= 0.05 else ""
+        lines.append(f"{metric:<34} {old:>12.2f} {new:>12.2f} {change:>+8.1%}{flag}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion and query benchmark on a synthetic corpus.")
+    parser.add_argument("--fmd", type=int, default=10, help="Number of synthetic FMD PDFs.")
+    parser.add_argument("--reach", type=int, default=10, help="Number of synthetic REACH certificate PDFs.")
+    parser.add_argument("--html", type=int, default=10, help="Number of synthetic part measurement HTML reports.")
+    parser.add_argument("--generic", type=int, default=0, help="Packaging specifications (PDF, HTML and Markdown each) for the generic parsers.")
+    parser.add_argument("--parts", type=int, default=20, help="Part numbers per file.")
+    parser.add_argument("-n", "--queries", type=int, default=200, help="Number of queries to run.")
+    parser.add_argument("-c", "--concurrency", type=int, default=32, help="Queries in flight at once.")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: PARSE_WORKERS).")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Simulated embedding latency (s).")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated LLM latency (s).")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus and workload seed.")
+    parser.add_argument("--output", type=Path, help=f"Result file (default: {RESULTS_DIR}/<commit>-<time>.json).")
+    parser.add_argument("--compare", type=Path, help="Previous result file to compare against.")
+    args = parser.parse_args()
+
+    result = run_benchmark(
+        args.fmd, args.reach, args.html, args.parts, args.queries, args.concurrency,
+        args.workers, args.embedding_latency, args.llm_latency, args.seed, generic=args.generic,
+    )
+
+    ingestion, query = result["ingestion"], result["query"]
+    print(f"Corpus: {result['corpus']['files']} files, {result['corpus']['bytes'] / 1e6:.1f} MB")
+    for fmt, stats in ingestion["parse_per_file"].items():
+        print(f"Parse {fmt}: mean {stats['mean_ms']:.0f} ms/file | p50 {stats['p50_ms']:.0f} ms | p99 {stats['p99_ms']:.0f} ms")
+    for name, stats in result["parsers"]["per_parser"].items():
+        pages = f", {stats['pages_per_sec']:.1f} pages/s ({stats['fast_page_share']:.0%} text-only)" if "pages_per_sec" in stats else ""
+        print(f"Parser {name}: {stats['files_per_sec']:.1f} files/s, {stats['mb_per_sec']:.2f} MB/s, {stats['chunks_per_sec']:.0f} chunks/s{pages}")
+    if result["parsers"]["misrouted"]:
+        print(f"Misrouted files: {', '.join(result['parsers']['misrouted'])}")
+    print(f"Ingestion: {ingestion['chunks']} chunks in {ingestion['seconds']:.2f}s, "
+          f"{ingestion['embed_batches_per_sec']:.1f} embed batches/s, index {ingestion['index_bytes'] / 1e6:.1f} MB")
+    print(f"Queries: {query['count']} at {query['throughput_qps']:.1f} q/s | p50 {query['p50_ms']:.1f} ms | p99 {query['p99_ms']:.1f} ms")
+    print(f"Peak RSS: {result['peak_rss_mb']:.0f} MB")
+
+    output = args.output or RESULTS_DIR / f"{result['commit'] or 'unknown'}-{int(time.time())}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print("\n" + compare_results(json.load(f), result))
+
+if __name__ == "__main__":
+    main()
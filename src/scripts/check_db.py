@@ -1,56 +1,116 @@
 import sys
+import argparse
+from collections import Counter
 from pathlib import Path
 
 # Add the project root to sys.path to allow importing from src
 project_root = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(project_root))
 
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from src.config import CHROMA_DIR, GOOGLE_API_KEY, EMBEDDING_MODEL_NAME
+from src.config import CHROMA_DIR, HNSW_EF_SEARCH
+from src.vector_index import open_collection, iter_pages, index_stats, measure_recall, compact_index
 
-def inspect_chroma():
+def _mb(size: int) -> str:
+    return f"{size / (1 << 20):.1f} MB"
+
+def inspect_chroma(page_size: int = 1000, samples: int = 3, source: str = None):
     """
     Connects to the ChromaDB and prints summary information.
+    Records are read page by page, so large collections are never loaded at once.
     """
-    print(f"Connecting to ChromaDB at: {CHROMA_DIR}")
-    
-    if not CHROMA_DIR.exists():
-        print("Error: ChromaDB directory does not exist. Run ingestion first.")
-        return
+    where = {"source": source} if source else None
+    with open_collection(CHROMA_DIR) as collection:
+        print(f"\nTotal documents in collection: {collection.count()}")
+
+        first = collection.get(limit=samples, where=where, include=["documents", "metadatas"])
+        if not first["ids"]:
+            print("The collection is empty." if not source else f"No documents from {source}.")
+            return
 
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model=EMBEDDING_MODEL_NAME,
-        google_api_key=GOOGLE_API_KEY
-    )
-
-    vectorstore = Chroma(
-        persist_directory=str(CHROMA_DIR),
-        embedding_function=embeddings
-    )
-
-    # Get collection info
-    data = vectorstore.get()
-    
-    num_docs = len(data['ids'])
-    print(f"\nTotal documents in collection: {num_docs}")
-
-    if num_docs > 0:
-        print("\n--- Sample Documents (First 3) ---")
-        for i in range(min(3, num_docs)):
-            print(f"\nID: {data['ids'][i]}")
-            print(f"Metadata: {data['metadatas'][i]}")
+        print(f"\n--- Sample Documents (First {len(first['ids'])}) ---")
+        for doc_id, metadata, content in zip(first["ids"], first["metadatas"], first["documents"]):
+            print(f"\nID: {doc_id}")
+            print(f"Metadata: {metadata}")
             # Truncate content for readability
-            content = data['documents'][i]
             sample_content = (content[:200] + '...') if len(content) > 200 else content
             print(f"Content: {sample_content}")
             print("-" * 30)
-            
-        # Example of unique sources
-        sources = set(m.get('source', 'Unknown') for m in data['metadatas'])
-        print(f"\nUnique sources found: {', '.join(sources)}")
+
+        sources, doc_types = Counter(), Counter()
+        for page in iter_pages(collection, page_size, include=("metadatas",), where=where):
+            for metadata in page["metadatas"]:
+                metadata = metadata or {}
+                sources[metadata.get("source", "Unknown")] += 1
+                doc_types[metadata.get("doc_type", "Unknown")] += 1
+
+    print("\nChunks per source:")
+    for name, count in sorted(sources.items()):
+        print(f"  {name}: {count}")
+    print("Chunks per document type: " + ", ".join(f"{name}={count}" for name, count in sorted(doc_types.items())))
+
+def print_stats(ef_values, queries: int, k: int):
+    """
+    Prints the size and fragmentation of the index and its recall/latency trade-off per ef_search.
+    """
+    stats = index_stats(CHROMA_DIR)
+    config = stats["configuration"]
+    print(f"\nRecords: {stats['records']} | HNSW nodes: {stats['hnsw_elements']} "
+          f"({stats['deleted_elements']} deleted, {stats['fragmentation']:.0%} fragmentation)")
+    print(f"On disk: {_mb(stats['bytes'])} (SQLite {_mb(stats['sqlite_bytes'])}, {_mb(stats['sqlite_free_bytes'])} free pages; "
+          f"HNSW {_mb(stats['vector_bytes'])})")
+    print(f"Index: space={config.get('space')} M={config.get('max_neighbors')} "
+          f"ef_construction={config.get('ef_construction')} ef_search={config.get('ef_search')}")
+    if stats["drift"]:
+        changes = ", ".join(f"{name} {current} -> {configured}" for name, (current, configured) in stats["drift"].items())
+        print(f"Configured build parameters differ ({changes}): run `compact` to rebuild the index.")
+    if stats["fragmentation"] > 0.2:
+        print("Over 20% of the HNSW nodes are deleted: run `compact` to reclaim them.")
+
+    if not ef_values or not stats["records"]:
+        return
+    print(f"\nRecall@{k} vs latency ({queries} sampled queries, exact neighbours by brute force):")
+    print(f"{'ef':>6} {'recall':>7} {'mean ms':>8} {'p95 ms':>7}")
+    for r in measure_recall(CHROMA_DIR, ef_values, queries=queries, k=k):
+        marker = "  <- HNSW_EF_SEARCH" if r["ef"] == HNSW_EF_SEARCH else ""
+        print(f"{r['ef']:>6} {r['recall']:>7.1%} {r['mean_ms']:>8.2f} {r['p95_ms']:>7.2f}{marker}")
+
+def compact(page_size: int):
+    """
+    Rebuilds the index from its stored embeddings, dropping deleted nodes and applying the configured parameters.
+    """
+    result = compact_index(CHROMA_DIR, page_size=page_size)
+    before, after = result["configuration_before"], result["configuration_after"]
+    print(f"Compacted {result['records']} records: {_mb(result['bytes_before'])} -> {_mb(result['bytes_after'])}")
+    for name in ("space", "max_neighbors", "ef_construction", "ef_search"):
+        if before.get(name) != after.get(name):
+            print(f"  {name}: {before.get(name)} -> {after.get(name)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, measure and compact the Chroma vector index. No API key is needed.")
+    commands = parser.add_subparsers(dest="command")
+    inspect_parser = commands.add_parser("inspect", help="Sample documents and chunk counts per source (default).")
+    inspect_parser.add_argument("--source", help="Only documents from this source file.")
+    inspect_parser.add_argument("--samples", type=int, default=3, help="Sample documents to print.")
+    inspect_parser.add_argument("--page-size", type=int, default=1000, help="Records read per page.")
+    stats_parser = commands.add_parser("stats", help="Index size, fragmentation and recall/latency per ef_search.")
+    stats_parser.add_argument("--ef", default="10,20,50,100,200", help="Comma-separated ef_search values to measure (empty skips).")
+    stats_parser.add_argument("--queries", type=int, default=100, help="Stored embeddings sampled as queries.")
+    stats_parser.add_argument("-k", type=int, default=10, help="Neighbours per query.")
+    compact_parser = commands.add_parser("compact", help="Rebuild the index from its stored embeddings (no re-embedding).")
+    compact_parser.add_argument("--page-size", type=int, default=1000, help="Records copied per page.")
+    args = parser.parse_args()
+
+    print(f"Connecting to ChromaDB at: {CHROMA_DIR}")
+    if not (CHROMA_DIR / "chroma.sqlite3").exists():
+        print("Error: ChromaDB directory does not exist. Run ingestion first.")
+        return
+
+    if args.command == "stats":
+        print_stats([int(ef) for ef in args.ef.split(",") if ef], args.queries, args.k)
+    elif args.command == "compact":
+        compact(args.page_size)
     else:
-        print("The collection is empty.")
+        inspect_chroma(getattr(args, "page_size", 1000), getattr(args, "samples", 3), getattr(args, "source", None))
 
 if __name__ == "__main__":
-    inspect_chroma()
+    main()
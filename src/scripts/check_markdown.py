@@ -1,10 +1,7 @@
-import os
-from pathlib import Path
+import argparse
 
-# Mock GOOGLE_API_KEY for scripts that don't need it
-os.environ["GOOGLE_API_KEY"] = "mock_key"
-
-from src.parser import ingest_fmd_pdf, ingest_reach_pdf, ingest_parts_html
+from src.parser import resolve_parser, is_supported
+from src.parse_cache import get_parse_cache, set_parse_cache_enabled
 from src.config import DATA_DIR
 
 def main():
@@ -12,29 +9,28 @@ def main():
     Reads files in DATA_DIR, transforms them to Markdown using specialized parsers,
     and prints the resulting chunks to the console.
     """
+    parser = argparse.ArgumentParser(description="Print the chunks the parsers produce for the files in data/.")
+    parser.add_argument("--no-parse-cache", action="store_true", help="Convert every file instead of reusing cached parser output.")
+    args = parser.parse_args()
+    if args.no_parse_cache:
+        set_parse_cache_enabled(False)
+
     if not DATA_DIR.exists():
         print(f"Data directory {DATA_DIR} does not exist.")
         return
 
     print(f"--- Checking Markdown Conversion for files in {DATA_DIR} ---\n")
 
-    for file_path in DATA_DIR.iterdir():
+    for file_path in sorted(DATA_DIR.iterdir()):
         if file_path.is_file():
-            print(f"=== File: {file_path.name} ===")
-            chunks = []
-            
+            if not is_supported(file_path):
+                print(f"=== Skipping unsupported file: {file_path.name} ===\n")
+                continue
+
             try:
-                if file_path.name == "FMD_Test_Corporation.pdf":
-                    chunks = ingest_fmd_pdf(file_path)
-                elif file_path.name == "REACH_Certificate_of_Compliance_Test_Corporation.pdf":
-                    chunks = ingest_reach_pdf(file_path)
-                elif file_path.name == "part_measurements_test_corporation.html":
-                    chunks = ingest_parts_html(file_path)
-                else:
-                    # Logic for unknown files could be added here if needed
-                    continue
-                
-                for i, chunk in enumerate(chunks):
+                name, parse = resolve_parser(file_path)
+                print(f"=== File: {file_path.name} (parser: {name}) ===")
+                for i, chunk in enumerate(parse(file_path)):
                     print(f"--- Chunk {i+1} (Section: {chunk['metadata'].get('section_title')}) ---")
                     print(chunk['content'])
                     print("-" * 40)
@@ -43,5 +39,10 @@ def main():
             except Exception as e:
                 print(f"Error processing {file_path.name}: {e}\n")
 
+    cache = get_parse_cache()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Parse cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries ({stats['bytes'] / 1024:.1f} KB)")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
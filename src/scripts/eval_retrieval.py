@@ -0,0 +1,238 @@
+import re
+import json
+import shutil
+import argparse
+import tempfile
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from src.config import (
+    BASE_DIR, DATA_DIR, GROUNDING_THRESHOLD, GROUNDING_CALIBRATION_PATH,
+    RETRIEVAL_FETCH_K, RETRIEVAL_TOP_K, RETRIEVAL_MMR_LAMBDA,
+)
+from src.context_budget import estimate_tokens
+from src.rerank import GroundingThresholds
+from src.resources import registry
+
+QUESTIONS_PATH = BASE_DIR / "docs" / "compliance_questions.md"
+NOT_FOUND = "information not found"
+# Bold outcomes that are verdicts rather than facts to find in the context
+VERDICTS = {"yes", "no", "pass", "fail"}
+
+QUESTION_RE = re.compile(r'^\|\s*(\d+)\s*\|\s*"(.+?)"\s*\|\s*(.+?)\s*\|\s*$')
+TARGET_RE = re.compile(r"Target File:\s*`([^`]+)`")
+
+def _facts(outcome: str) -> List[str]:
+    """
+    Strings the retrieved context must contain to answer a question: the numbers and
+    identifiers of the bold expected outcome (or the whole phrase if it has none).
+    """
+    facts = []
+    for phrase in re.findall(r"\*\*(.+?)\*\*", outcome):
+        phrase = phrase.strip().rstrip(".")
+        if phrase.lower() in VERDICTS or NOT_FOUND in phrase.lower():
+            continue
+        for item in phrase.split(", "):
+            tokens = [token for token in item.split() if any(c.isdigit() for c in token)]
+            facts.extend(tokens or [item])
+    return facts
+
+def load_questions(path: Path = QUESTIONS_PATH) -> List[Dict[str, Any]]:
+    """
+    Reads the question tables of docs/compliance_questions.md.
+
+    Returns:
+        One dict per question: number, question, source (target file, None for
+        cross-file questions), facts and whether it is answerable from the corpus.
+    """
+    questions = []
+    source = None
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.startswith("## "):
+            source = None
+        target = TARGET_RE.search(line)
+        if target:
+            source = target.group(1)
+        match = QUESTION_RE.match(line)
+        if match:
+            number, question, outcome = match.groups()
+            questions.append({
+                "number": int(number),
+                "question": question,
+                "source": source,
+                "facts": _facts(outcome),
+                "answerable": NOT_FOUND not in outcome.lower(),
+            })
+    return questions
+
+def evaluate(
+    questions: List[Dict[str, Any]],
+    k: int,
+    threshold: Optional[float],
+    mmr_lambda: float,
+) -> Dict[str, Any]:
+    """
+    Retrieves context for every question and scores it.
+
+    Metrics:
+        grounding_accuracy: answerable questions got context, unanswerable ones none.
+        fact_recall: share of the expected facts present in the retrieved chunks.
+        source_hit_rate: answerable questions with a chunk from their target file.
+        mean_chunks, mean_context_tokens: size of the context handed to the LLM.
+    """
+    from src.retriever import retrieve_context_batch
+
+    contexts, _ = retrieve_context_batch([q["question"] for q in questions], threshold=threshold, k=k, mmr_lambda=mmr_lambda)
+    grounded_ok = facts_found = facts_total = source_hits = source_total = chunks = tokens = 0
+    misses = []
+    for q, (docs, _) in zip(questions, contexts):
+        text = "\n".join(doc.page_content for doc in docs).lower()
+        grounded_ok += bool(docs) == q["answerable"]
+        found = [fact for fact in q["facts"] if fact.lower() in text]
+        facts_found += len(found)
+        facts_total += len(q["facts"])
+        if q["answerable"] and q["source"]:
+            source_total += 1
+            source_hits += any(doc.metadata.get("source") == q["source"] for doc in docs)
+        if bool(docs) != q["answerable"] or len(found) < len(q["facts"]):
+            misses.append(q["number"])
+        chunks += len(docs)
+        tokens += estimate_tokens(text)
+    count = len(questions) or 1
+    return {
+        "k": k,
+        "threshold": "calibrated" if threshold is None else threshold,
+        "mmr_lambda": mmr_lambda,
+        "grounding_accuracy": grounded_ok / count,
+        "fact_recall": facts_found / facts_total if facts_total else 1.0,
+        "source_hit_rate": source_hits / source_total if source_total else 1.0,
+        "mean_chunks": chunks / count,
+        "mean_context_tokens": tokens / count,
+        "misses": misses,
+    }
+
+def calibrate(questions: List[Dict[str, Any]], fetch_k: int = RETRIEVAL_FETCH_K) -> Dict[str, float]:
+    """
+    Per-source grounding thresholds: for each target file, the midpoint between the
+    lowest best score of its chunks on the questions it answers and the highest score
+    of its chunks on the unanswerable questions. Sources whose scores do not separate
+    (or that have no question of either kind) keep the global threshold.
+    """
+    from src.retriever import embed_queries, vector_candidates
+
+    vectors = embed_queries([q["question"] for q in questions])
+    candidates = vector_candidates(vectors, None, fetch_k)
+    positives: Dict[str, List[float]] = {}
+    negatives: Dict[str, float] = {}
+    for q, found in zip(questions, candidates):
+        best: Dict[str, float] = {}
+        for doc, score, _ in found:
+            source = doc.metadata.get("source")
+            best[source] = max(best.get(source, 0.0), score)
+        if not q["answerable"]:
+            for source, score in best.items():
+                negatives[source] = max(negatives.get(source, 0.0), score)
+        elif q["source"] in best:
+            positives.setdefault(q["source"], []).append(best[q["source"]])
+
+    thresholds = {}
+    for source, scores in positives.items():
+        if source in negatives and min(scores) > negatives[source]:
+            thresholds[source] = round((min(scores) + negatives[source]) / 2, 4)
+    return thresholds
+
+def _parse_list(text: str, cast) -> List[Any]:
+    return [None if item == "calibrated" else cast(item) for item in text.split(",") if item]
+
+def run_eval(
+    ks: List[int],
+    thresholds: List[Optional[float]],
+    lambdas: List[float],
+    calibrate_sources: bool = False,
+    calibration_path: Path = GROUNDING_CALIBRATION_PATH,
+    existing_index: bool = False,
+    questions_path: Path = QUESTIONS_PATH,
+) -> Dict[str, Any]:
+    """
+    Sweeps k, threshold and MMR lambda over the compliance questions with the configured
+    embedding backend. Unless `existing_index` is set, data/ is ingested into a temporary
+    directory first, so the real chroma_db/ is left untouched.
+    """
+    from src.ingestion import ingest_data
+    from src.retriever import embedding_model_id
+    from src.storage import use_storage
+
+    questions = load_questions(questions_path)
+    work_dir = None
+    stack = ExitStack()
+    try:
+        registry.invalidate()
+        if not existing_index:
+            work_dir = Path(tempfile.mkdtemp(prefix="rag-eval-"))
+            stack.enter_context(use_storage(DATA_DIR, work_dir / "chroma_db", work_dir / "parse_cache"))
+            ingest_data(verbose=False)
+
+        calibration = None
+        if calibrate_sources:
+            calibration = GroundingThresholds(calibrate(questions), embedding_model_id())
+            calibration.save(calibration_path)
+            registry.invalidate("grounding_thresholds")
+            registry.get("grounding_thresholds", lambda: calibration)
+
+        results = [
+            evaluate(questions, k, threshold, mmr_lambda)
+            for k in ks for threshold in thresholds for mmr_lambda in lambdas
+        ]
+        results.sort(key=lambda r: (-r["grounding_accuracy"], -r["fact_recall"], r["mean_context_tokens"]))
+        return {
+            "embedding_model": embedding_model_id(),
+            "questions": len(questions),
+            "calibration": calibration.sources if calibration is not None else None,
+            "results": results,
+        }
+    finally:
+        stack.close()
+        registry.invalidate()
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep retrieval parameters against docs/compliance_questions.md.")
+    parser.add_argument("--k", default=",".join(str(v) for v in sorted({3, RETRIEVAL_TOP_K, 8})), help="Comma-separated chunk counts.")
+    parser.add_argument(
+        "--thresholds",
+        default=",".join(f"{GROUNDING_THRESHOLD * f:.3g}" for f in (0.5, 0.75, 1.0, 1.25, 1.5)) + ",calibrated",
+        help="Comma-separated grounding thresholds; 'calibrated' uses the per-source thresholds.",
+    )
+    parser.add_argument("--mmr-lambda", default=",".join(str(v) for v in dict.fromkeys([RETRIEVAL_MMR_LAMBDA, 1.0, 0.85, 0.7, 0.5])), help="Comma-separated MMR lambdas.")
+    parser.add_argument("--calibrate", action="store_true", help=f"Calibrate per-source thresholds and save them to {GROUNDING_CALIBRATION_PATH}.")
+    parser.add_argument("--existing-index", action="store_true", help="Evaluate the current chroma_db/ instead of a fresh ingestion of data/.")
+    parser.add_argument("--output", type=Path, help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    report = run_eval(
+        _parse_list(args.k, int), _parse_list(args.thresholds, float), _parse_list(args.mmr_lambda, float),
+        calibrate_sources=args.calibrate, existing_index=args.existing_index,
+    )
+
+    print(f"Embedding model: {report['embedding_model']} | {report['questions']} questions")
+    if report["calibration"] is not None:
+        print("Calibrated thresholds:")
+        for source, threshold in sorted(report["calibration"].items()):
+            print(f"  {source}: {threshold:.4f}")
+    print(f"{'k':>3} {'threshold':>10} {'lambda':>6} {'grounding':>9} {'facts':>6} {'source':>6} {'chunks':>6} {'tokens':>7}  misses")
+    for r in report["results"]:
+        threshold = r["threshold"] if isinstance(r["threshold"], str) else f"{r['threshold']:.3g}"
+        print(
+            f"{r['k']:>3} {threshold:>10} {r['mmr_lambda']:>6.2f} {r['grounding_accuracy']:>9.0%} {r['fact_recall']:>6.0%} "
+            f"{r['source_hit_rate']:>6.0%} {r['mean_chunks']:>6.1f} {r['mean_context_tokens']:>7.0f}  {r['misses']}"
+        )
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+# Add the project root to sys.path to allow importing from src
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(project_root))
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from src.fakes import FakeEmbeddings, FakeAnswerChain
+from src.answer_cache import SemanticAnswerCache
+from src.lexical import LexicalIndex
+from src.table_index import TableIndex
+from src.dedup import DuplicateIndex
+from src.rerank import GroundingThresholds
+from src.resources import registry
+
+SAMPLE_CHUNKS = [
+    "Part TC-3541-A contains Lead (CAS 7439-92-1) at 0.1% by weight.",
+    "Part TC-3541-B contains Cadmium (CAS 7440-43-9) at 0.002% by weight.",
+    "Test Corporation declares its products compliant with REACH regulation (EC) No 1907/2006.",
+    "No substances of very high concern (SVHC) above 0.1% w/w are present in the supplied articles.",
+    "Part TC-8812-C measured thickness 2.5 mm, weight 14 g.",
+]
+
+SAMPLE_QUERIES = [
+    "How much lead is in part TC-3541-A?",
+    "Does TC-3541-B contain cadmium?",
+    "Is Test Corporation REACH compliant?",
+    "Are there SVHC substances above 0.1%?",
+    "What is the weight of part TC-8812-C?",
+]
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of a list of values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def install_stub_backends(embedding_latency: float, llm_latency: float) -> FakeAnswerChain:
+    """
+    Registers an in-memory Chroma store over FakeEmbeddings, its lexical index and a
+    FakeAnswerChain (also used as the streaming chain) in the resource registry, so the real pipeline runs without any network call.
+    """
+    registry.invalidate()
+    embeddings = FakeEmbeddings(latency=embedding_latency)
+    chain = FakeAnswerChain(latency=llm_latency)
+    vectorstore = Chroma(
+        collection_name=f"load_test_{time.time_ns()}",
+        embedding_function=embeddings,
+        collection_configuration={"hnsw": {"space": "cosine"}},
+    )
+    docs = [
+        Document(id=f"chunk-{i}", page_content=text, metadata={"source": "synthetic.pdf", "section_title": f"S{i}"})
+        for i, text in enumerate(SAMPLE_CHUNKS)
+    ]
+    vectorstore.add_documents(docs, ids=[doc.id for doc in docs])
+    lexical_index = LexicalIndex()
+    lexical_index.add(docs)
+    registry.get("embeddings", lambda: embeddings)
+    registry.get("vectorstore", lambda: vectorstore)
+    registry.get("chain", lambda: chain)
+    registry.get("stream_chain", lambda: chain)
+    registry.get("lexical_index", lambda: lexical_index)
+    registry.get("table_index", TableIndex)
+    registry.get("duplicate_index", DuplicateIndex)
+    # Hashed bag-of-words similarities stay below GROUNDING_THRESHOLD: every sample query must reach the LLM
+    registry.get("grounding_thresholds", lambda: GroundingThresholds({"synthetic.pdf": 0.3}))
+    # Paraphrased load-test queries must not be served from the answer cache
+    registry.get("answer_cache", lambda: SemanticAnswerCache(max_distance=-1.0))
+    return chain
+
+async def _run(num_queries: int, concurrency: int) -> List[float]:
+    from src.pipeline import aanswer_query
+
+    limiter = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with limiter:
+            start = time.perf_counter()
+            await aanswer_query(f"{SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)]} (request {i})")
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(num_queries)))
+    return latencies
+
+def run_load_test(
+    num_queries: int = 200,
+    concurrency: int = 32,
+    embedding_latency: float = 0.01,
+    llm_latency: float = 0.2,
+) -> Dict[str, float]:
+    """
+    Fires `num_queries` queries through the async pipeline with at most `concurrency`
+    in flight, against stubbed embedding and LLM backends.
+
+    Returns:
+        Throughput (queries/s) and p50/p95/p99 latency in seconds.
+    """
+    chain = install_stub_backends(embedding_latency, llm_latency)
+    start = time.perf_counter()
+    latencies = asyncio.run(_run(num_queries, concurrency))
+    elapsed = time.perf_counter() - start
+    registry.invalidate()
+    return {
+        "queries": num_queries,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "llm_calls": chain.calls,
+        "throughput_qps": num_queries / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the async query pipeline against stubbed backends.")
+    parser.add_argument("-n", "--queries", type=int, default=200, help="Number of queries to run.")
+    parser.add_argument("-c", "--concurrency", type=int, default=32, help="Queries in flight at once.")
+    parser.add_argument("--embedding-latency", type=float, default=0.01, help="Simulated embedding latency (s).")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Simulated LLM latency (s).")
+    args = parser.parse_args()
+
+    result = run_load_test(args.queries, args.concurrency, args.embedding_latency, args.llm_latency)
+    print(f"Queries: {result['queries']} (concurrency {result['concurrency']}) in {result['seconds']:.2f}s, {result['llm_calls']} LLM calls")
+    print(f"Throughput: {result['throughput_qps']:.1f} queries/s")
+    print(f"Latency p50: {result['p50'] * 1000:.0f} ms | p95: {result['p95'] * 1000:.0f} ms | p99: {result['p99'] * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from src.config import SERVER_HOST, SERVER_PORT, SERVER_MAX_PENDING, SERVER_MAX_BATCH, INGEST_TIMEOUT
+from src.manifest import load_manifest
+from src.storage import storage_paths
+from src.resources import registry
+
+# Resources rebuilt from disk when the index changes underneath the server
+INDEX_RESOURCES = ("vectorstore", "lexical_index", "table_index", "duplicate_index", "answer_cache")
+# Runs one ingestion and prints its summary as JSON on the last line of stdout (see src/ingestion.py)
+INGEST_COMMAND = (sys.executable, "-m", "src.ingestion", "--json")
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[List[Tuple[bytes, bytes]]] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or []
+
+class IndexGate:
+    """
+    Readers/writer gate around the index resources. Queries hold it shared; a reload
+    or an ingestion run waits for the queries in flight to finish, holds new ones back
+    while it swaps the index, then lets them through. No request is dropped.
+    """
+
+    def __init__(self):
+        self._readers = 0
+        self._writing = False
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def read(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: not self._writing)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._readers -= 1
+                self._cond.notify_all()
+
+    @asynccontextmanager
+    async def write(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: not self._writing)
+            self._writing = True
+            await self._cond.wait_for(lambda: self._readers == 0)
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+def _manifest_version() -> Optional[int]:
+    """
+    Identifies the on-disk index state: the manifest is rewritten after every ingestion commit.
+    """
+    try:
+        return storage_paths().manifest_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+async def run_ingestion(command: Sequence[str] = INGEST_COMMAND, timeout: float = INGEST_TIMEOUT) -> Dict[str, Any]:
+    """
+    Runs ingestion in a child process and returns its summary.
+
+    Not in a thread of the server: parse timeouts use SIGALRM, which only works on the main
+    thread, and forking the parser pool from a process running threads and an event loop
+    can deadlock on inherited locks. The child runs in its own session, so on timeout it is
+    killed together with its parser processes.
+
+    Raises:
+        HTTPError: 504 if it runs longer than `timeout` seconds, 500 if it fails.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *command, cwd=PROJECT_ROOT, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        os.killpg(process.pid, signal.SIGKILL)
+        await process.wait()
+        raise HTTPError(504, f"Ingestion timed out after {timeout:g}s; committed batches are kept and the next run resumes.")
+    lines = stdout.decode("utf-8", errors="replace").strip().splitlines()
+    if process.returncode != 0 or not lines:
+        errors = stderr.decode("utf-8", errors="replace").strip().splitlines()
+        raise HTTPError(500, f"Ingestion failed: {errors[-1] if errors else f'exit code {process.returncode}'}")
+    return json.loads(lines[-1])
+
+def warm_up():
+    """
+    Builds the embedding client, vector store, side indexes and LLM chains so the
+    first request does not pay for them.
+    """
+    from src.retriever import get_embeddings, get_vectorstore
+    from src.lexical import get_lexical_index
+    from src.table_index import get_table_index
+    from src.dedup import get_duplicate_index
+    from src.inference import get_chain, get_stream_chain
+
+    get_embeddings()
+    get_vectorstore()
+    get_lexical_index()
+    get_table_index()
+    get_duplicate_index()
+    get_chain()
+    get_stream_chain()
+
+class ComplianceServer:
+    """
+    ASGI application serving the RAG pipeline over HTTP/JSON with resources kept warm
+    between requests.
+
+    Endpoints:
+        POST /query   {"query": "..."} -> ComplianceResponse
+        POST /batch   {"queries": ["...", {"id": 1, "query": "..."}]} -> {"results": [...]} (input order)
+        POST /ingest  -> ingestion summary; queries wait while the index is updated (at most `ingest_timeout`)
+        GET  /health  -> liveness
+        GET  /ready   -> index state; 503 until the resources are loaded and the index is not empty
+
+    Queries beyond `max_pending` (in flight or waiting) are rejected with 503 and a
+    Retry-After header instead of queueing without bound. If the index changes on disk
+    (e.g. `python src/main.py` synchronized new files), the index resources are reloaded
+    before the next query.
+
+    Args:
+        max_pending: Queries admitted at once; QUERY_CONCURRENCY of them run, the rest wait.
+        max_batch: Maximum queries per /batch request.
+        warm: Callable loading the resources at startup.
+        ingest_command: Command /ingest runs in a child process (see run_ingestion).
+        ingest_timeout: Seconds /ingest may hold queries back before the child is killed.
+    """
+
+    def __init__(
+        self,
+        max_pending: int = SERVER_MAX_PENDING,
+        max_batch: int = SERVER_MAX_BATCH,
+        warm: Callable[[], None] = warm_up,
+        ingest_command: Sequence[str] = INGEST_COMMAND,
+        ingest_timeout: float = INGEST_TIMEOUT,
+    ):
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self.warm = warm
+        self.ingest_command = ingest_command
+        self.ingest_timeout = ingest_timeout
+        self.gate = IndexGate()
+        self.pending = 0
+        self.ingesting = False
+        self.ready = False
+        self.reloads = 0
+        self.index_version = _manifest_version()
+        self.started = time.time()
+        self._reload_lock = asyncio.Lock()
+
+    async def startup(self):
+        await asyncio.to_thread(self.warm)
+        self.index_version = _manifest_version()
+        self.ready = True
+
+    async def reload_index(self):
+        """
+        Reopens the index resources from disk once the queries in flight are done.
+        """
+        async with self._reload_lock:
+            version = _manifest_version()
+            if version == self.index_version:
+                return
+            async with self.gate.write():
+                registry.invalidate(*INDEX_RESOURCES)
+                await asyncio.to_thread(self.warm)
+                self.index_version = version
+                self.reloads += 1
+
+    @asynccontextmanager
+    async def admit(self, count: int = 1):
+        """
+        Reserves `count` query slots or rejects the request when the server is saturated.
+        """
+        if self.pending + count > self.max_pending:
+            raise HTTPError(503, "Server busy, retry later.", [(b"retry-after", b"1")])
+        self.pending += count
+        try:
+            if not self.ingesting and _manifest_version() != self.index_version:
+                await self.reload_index()
+            async with self.gate.read():
+                yield
+        finally:
+            self.pending -= count
+
+    async def handle_query(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        from src.pipeline import aanswer_query
+
+        query = body.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(400, "Field 'query' must be a non-empty string.")
+        async with self.admit():
+            response = await aanswer_query(query)
+        return response.model_dump()
+
+    async def handle_batch(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        from src.pipeline import abatch_answer
+
+        queries = body.get("queries")
+        if not isinstance(queries, list) or not queries:
+            raise HTTPError(400, "Field 'queries' must be a non-empty list.")
+        if len(queries) > self.max_batch:
+            raise HTTPError(413, f"At most {self.max_batch} queries per batch.")
+        items, ids = [], []
+        for position, entry in enumerate(queries):
+            item_id, query = (entry.get("id", position), entry.get("query")) if isinstance(entry, dict) else (position, entry)
+            if not isinstance(query, str) or not query.strip():
+                raise HTTPError(400, f"Query {position} must be a non-empty string.")
+            items.append((position, query))
+            ids.append(item_id)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+
+        def on_result(position: int, query: str, response):
+            results[position] = {"id": ids[position], "query": query, **response.model_dump()}
+
+        async with self.admit(min(len(items), self.max_pending)):
+            await abatch_answer(items, on_result)
+        return {"results": results}
+
+    async def handle_ingest(self) -> Dict[str, Any]:
+        if self.ingesting:
+            raise HTTPError(409, "Ingestion already running.")
+        self.ingesting = True
+        try:
+            async with self._reload_lock, self.gate.write():
+                start = time.perf_counter()
+                # The child process writes the index (and may rebuild it): close it until the run is over
+                registry.invalidate(*INDEX_RESOURCES)
+                try:
+                    summary = await run_ingestion(self.ingest_command, self.ingest_timeout)
+                finally:
+                    # Whatever the child committed, even if it failed, is reopened from disk
+                    await asyncio.to_thread(self.warm)
+                    self.index_version = _manifest_version()
+        finally:
+            self.ingesting = False
+        return {**summary, "seconds": round(time.perf_counter() - start, 3)}
+
+    def index_state(self) -> Dict[str, Any]:
+        manifest = load_manifest()
+        files = manifest["files"]
+        return {
+            "ready": self.ready and bool(files),
+            "files": len(files),
+            "chunks": sum(len(entry["chunks"]) for entry in files.values()),
+            "index_version": self.index_version,
+            "reloads": self.reloads,
+            "ingesting": self.ingesting,
+            "pending_queries": self.pending,
+            "resources": registry.stats(),
+            "uptime_seconds": round(time.time() - self.started, 1),
+        }
+
+    async def route(self, method: str, path: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        routes = {
+            ("POST", "/query"): lambda: self.handle_query(body),
+            ("POST", "/batch"): lambda: self.handle_batch(body),
+            ("POST", "/ingest"): self.handle_ingest,
+        }
+        if (method, path) in routes:
+            return 200, await routes[(method, path)]()
+        if (method, path) == ("GET", "/health"):
+            return 200, {"status": "ok"}
+        if (method, path) == ("GET", "/ready"):
+            state = self.index_state()
+            return (200 if state["ready"] else 503), state
+        if any(route_path == path for _, route_path in routes) or path in ("/health", "/ready"):
+            raise HTTPError(405, f"Method {method} not allowed on {path}.")
+        raise HTTPError(404, f"Not found: {path}")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        headers: List[Tuple[bytes, bytes]] = []
+        try:
+            body = await self._read_json(receive) if scope["method"] == "POST" else {}
+            status, payload = await self.route(scope["method"], scope["path"], body)
+        except HTTPError as e:
+            status, payload, headers = e.status, {"error": str(e)}, e.headers
+        except Exception as e:
+            print(f"Error handling {scope['method']} {scope['path']}: {e}", file=sys.stderr)
+            status, payload = 500, {"error": "Internal server error."}
+
+        data = json.dumps(payload).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())] + headers,
+        })
+        await send({"type": "http.response.body", "body": data})
+
+    async def _read_json(self, receive) -> Dict[str, Any]:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        raw = b"".join(chunks)
+        if not raw:
+            return {}
+        try:
+            body = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise HTTPError(400, f"Invalid JSON: {e}")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "Request body must be a JSON object.")
+        return body
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                registry.invalidate()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+def main():
+    parser = argparse.ArgumentParser(description="Regulation Compliance RAG HTTP server")
+    parser.add_argument("--host", default=SERVER_HOST, help=f"Bind address (default: {SERVER_HOST}).")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help=f"Port (default: {SERVER_PORT}).")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(ComplianceServer(), host=args.host, port=args.port, lifespan="on")
+
+if __name__ == "__main__":
+    main()
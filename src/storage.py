@@ -0,0 +1,77 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+from src.config import DATA_DIR, CHROMA_DIR, PARSE_CACHE_DIR
+from src.resources import registry
+
+# Resources opened from the storage paths, released when the paths change
+_PATH_RESOURCES = ("vectorstore", "answer_cache", "lexical_index", "table_index", "duplicate_index", "parse_cache")
+
+class StoragePaths(NamedTuple):
+    """
+    Where ingestion reads documents and where the index and the parse cache are kept.
+
+    Args:
+        data_dir: Documents to ingest.
+        chroma_dir: Chroma index, with the ingestion manifest and the side indexes.
+        parse_cache_dir: Parse cache entries (see src/parse_cache.py).
+    """
+    data_dir: Path
+    chroma_dir: Path
+    parse_cache_dir: Path
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.chroma_dir / "ingest_manifest.json"
+
+    @property
+    def lexical_index_path(self) -> Path:
+        return self.chroma_dir / "lexical_index.json"
+
+    @property
+    def table_index_path(self) -> Path:
+        return self.chroma_dir / "table_index.json"
+
+    @property
+    def duplicate_index_path(self) -> Path:
+        return self.chroma_dir / "duplicate_index.json"
+
+_paths = StoragePaths(DATA_DIR, CHROMA_DIR, PARSE_CACHE_DIR)
+
+def storage_paths() -> StoragePaths:
+    """
+    Returns the storage locations of this process: the config defaults unless redirected by use_storage.
+    Read when a file or resource is opened (never copied at import), so a redirect reaches every module.
+    """
+    return _paths
+
+@contextmanager
+def use_storage(
+    data_dir: Optional[Path] = None,
+    chroma_dir: Optional[Path] = None,
+    parse_cache_dir: Optional[Path] = None,
+) -> Iterator[StoragePaths]:
+    """
+    Points ingestion, retrieval and the parse cache at other directories for the duration of
+    the block, e.g. a benchmark's scratch corpus and index, leaving chroma_db/ untouched.
+    Resources opened from the previous paths are released on entry and exit; parser
+    processes forked inside the block inherit the paths.
+
+    Args:
+        data_dir: Documents to ingest. Defaults to the current one.
+        chroma_dir: Index directory. Defaults to the current one.
+        parse_cache_dir: Parse cache directory. Defaults to the current one.
+    """
+    global _paths
+    previous = _paths
+    _paths = StoragePaths(
+        data_dir or previous.data_dir,
+        chroma_dir or previous.chroma_dir,
+        parse_cache_dir or previous.parse_cache_dir,
+    )
+    registry.invalidate(*_PATH_RESOURCES)
+    try:
+        yield _paths
+    finally:
+        registry.invalidate(*_PATH_RESOURCES)
+        _paths = previous
@@ -0,0 +1,161 @@
+import re
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+from langchain_core.documents import Document
+from src.storage import storage_paths
+from src.lexical import tokenize, extract_identifiers
+from src.resources import registry
+
+# Row metadata kept in the index (see parser.chunk_markdown_tables)
+ROW_FIELDS = ("source", "part_number", "substance", "cas")
+
+INDEX_VERSION = 1
+
+def substance_terms(substance: str) -> List[Set[str]]:
+    """
+    Alternative token sets naming a substance: "Lead (Pb)" is named by {"lead"} or {"pb"}.
+    """
+    terms = []
+    name = re.sub(r"\(.*?\)", " ", substance)
+    if tokenize(name):
+        terms.append(set(tokenize(name)))
+    for symbol in re.findall(r"\((.*?)\)", substance):
+        if tokenize(symbol):
+            terms.append(set(tokenize(symbol)))
+    return terms
+
+class TableIndex:
+    """
+    Structured side index of table-row chunks: part number -> row chunk IDs.
+
+    Rows come from parser.chunk_markdown_tables and carry their part number,
+    substance and CAS number in their metadata. The index lets a query such as
+    "lead in TC-3541-A" resolve to the matching row(s) instead of whole documents.
+
+    Every ingested chunk ID is recorded (non-row chunks with no fields), so the
+    index can be reconciled with the ingestion manifest like the lexical index.
+
+    Args:
+        path: JSON file the index is loaded from and saved to.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self._rows: Dict[str, Dict[str, str]] = {}
+        self._parts: Dict[str, Dict[str, None]] = {}
+        self._substances: Dict[str, int] = {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: Path) -> "TableIndex":
+        """
+        Loads the index from `path`; returns an empty index if the file is missing or outdated.
+        """
+        index = cls(path)
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                for doc_id, row in data["rows"].items():
+                    index._add_row(doc_id, row)
+        return index
+
+    def save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "rows": self._rows}, f, separators=(",", ":"))
+        tmp_path.replace(self.path)
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def ids(self) -> Set[str]:
+        return set(self._rows)
+
+    def _add_row(self, doc_id: str, row: Dict[str, str]):
+        self._rows[doc_id] = row
+        part = row.get("part_number")
+        if part:
+            self._parts.setdefault(part.lower(), {})[doc_id] = None
+        substance = row.get("substance")
+        if substance:
+            self._substances[substance] = self._substances.get(substance, 0) + 1
+
+    def add(self, docs: Iterable[Document]):
+        """
+        Indexes (or re-indexes) documents by their ID; only table rows get fields.
+        """
+        for doc in docs:
+            self.remove([doc.id])
+            row = {}
+            if doc.metadata.get("chunk_type") == "table_row":
+                row = {field: doc.metadata[field] for field in ROW_FIELDS if doc.metadata.get(field)}
+            self._add_row(doc.id, row)
+            self.dirty = True
+
+    def remove(self, doc_ids: Iterable[str]):
+        for doc_id in doc_ids:
+            row = self._rows.pop(doc_id, None)
+            if row is None:
+                continue
+            part = row.get("part_number")
+            if part:
+                rows = self._parts[part.lower()]
+                rows.pop(doc_id, None)
+                if not rows:
+                    del self._parts[part.lower()]
+            substance = row.get("substance")
+            if substance:
+                self._substances[substance] -= 1
+                if not self._substances[substance]:
+                    del self._substances[substance]
+            self.dirty = True
+
+    def rows(self, part_number: str) -> List[str]:
+        """
+        Returns the IDs of every row of a part, in ingestion order.
+        """
+        return list(self._parts.get(part_number.lower(), ()))
+
+    def lookup(self, query: str) -> List[str]:
+        """
+        Resolves a "substance in part" query to table rows.
+
+        Returns the rows of the query's part numbers whose substance or CAS number is
+        named in the query. If the query names a known substance that the parts do not
+        contain, all of their substance rows are returned so the absence can be stated.
+        Returns an empty list when the query names no indexed part or no substance.
+        """
+        parts = [token for token in extract_identifiers(query) if token in self._parts]
+        if not parts:
+            return []
+
+        tokens = set(tokenize(query))
+
+        def names(substance: str) -> bool:
+            return any(terms <= tokens for terms in substance_terms(substance))
+
+        composition = [
+            doc_id for part in parts for doc_id in self._parts[part]
+            if self._rows[doc_id].get("substance")
+        ]
+        matches = [
+            doc_id for doc_id in composition
+            if names(self._rows[doc_id]["substance"]) or self._rows[doc_id].get("cas", "").lower() in tokens
+        ]
+        if matches:
+            return matches
+        if any(names(substance) for substance in self._substances):
+            return composition
+        return []
+
+def get_table_index() -> TableIndex:
+    """
+    Returns the process-wide table row index, loading it from disk on first use.
+    """
+    return registry.get("table_index", lambda: TableIndex.load(storage_paths().table_index_path))
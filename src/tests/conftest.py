@@ -0,0 +1,17 @@
+import pytest
+from src.resources import registry
+from src.rerank import GroundingThresholds
+from src.storage import use_storage
+
+@pytest.fixture(autouse=True)
+def reset_registry(tmp_path):
+    """
+    Ensures cached clients and chains never leak between tests (and pick up patches).
+    The index, its side indexes and the parse cache live in the test's directory instead of
+    chroma_db/ and .cache/, and no local grounding calibration is applied.
+    """
+    registry.invalidate()
+    with use_storage(chroma_dir=tmp_path / "chroma_db", parse_cache_dir=tmp_path / "parse_cache"):
+        registry.get("grounding_thresholds", GroundingThresholds)
+        yield
+    registry.invalidate()
@@ -0,0 +1,93 @@
+import os
+from pathlib import Path
+import markdownify
+import pymupdf4llm
+from langchain_core.documents import Document
+
+# Mock GOOGLE_API_KEY for tests that don't need it
+os.environ.setdefault("GOOGLE_API_KEY", "mock_key")
+
+from src.context_budget import pack_context, estimate_tokens, trim_to_relevant
+from src.inference import build_context
+from src.parser import ingest_reach_pdf
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+DATA_DIR = BASE_DIR / "data"
+
+def _doc(doc_id: str, text: str, source: str, section: str = "Full Document") -> Document:
+    return Document(id=doc_id, page_content=text, metadata={"source": source, "section_title": section})
+
+def test_pack_context_dedupes_and_respects_budget():
+    row = "| TC-3541-A | R3 | Silver (Ag) | 7440-22-4 | 44.76% | Compliant |"
+    docs = [
+        _doc("a", "FMD table\n" + row, "fmd.pdf"),
+        _doc("b", "FMD table\n" + row + " ", "fmd_copy.pdf"),
+        _doc("c", "\n".join(f"line {i} about unrelated packaging" for i in range(200)), "other.pdf"),
+        _doc("d", "Another chunk that no longer fits", "late.pdf"),
+    ]
+
+    packed, stats = pack_context("silver in TC-3541-A", docs, budget=120, max_chunk_tokens=100)
+
+    assert [doc.id for doc in packed][:2] == ["a", "c"]
+    assert stats["duplicates"] == 1
+    assert stats["trimmed"] >= 1
+    assert stats["tokens"] <= 120
+    assert packed[0].metadata == docs[0].metadata
+
+    # A budget <= 0 disables packing
+    unpacked, _ = pack_context("silver", docs, budget=0)
+    assert [doc.page_content for doc in unpacked] == [doc.page_content for doc in docs]
+
+def test_trim_keeps_table_header_and_relevant_rows():
+    rows = [f"|TC-{1000 + i}-A|Copper (Cu)|7440-50-8|{i}.00%|" for i in range(100)]
+    text = "\n".join(["# FMD", "|Part Number|Substance|CAS No.|Amount|", "|---|---|---|---|"] + rows)
+
+    trimmed = trim_to_relevant("How much copper is in TC-1042-A?", text, max_tokens=40)
+
+    assert "|Part Number|Substance|CAS No.|Amount|" in trimmed
+    assert "|TC-1042-A|Copper (Cu)|7440-50-8|42.00%|" in trimmed
+    assert "[...]" in trimmed
+    assert estimate_tokens(trimmed) <= 40 + len(trimmed.splitlines())
+
+def test_context_packing_eval():
+    """
+    Eval over questions of docs/compliance_questions.md with whole-document retrieval
+    (the worst case: FMD and part measurement files used to be single chunks).
+    Packing with the default budget must keep every expected fact in the prompt
+    while cutting the prompt size, which is what drives LLM latency and cost.
+    """
+    fmd = _doc("fmd", pymupdf4llm.to_markdown(str(DATA_DIR / "FMD_Test_Corporation.pdf")), "FMD_Test_Corporation.pdf")
+    with open(DATA_DIR / "part_measurements_test_corporation.html", "r", encoding="utf-8") as f:
+        parts = _doc("parts", markdownify.markdownify(f.read(), heading_style="ATX"), "part_measurements_test_corporation.html")
+    reach = [
+        _doc(f"reach-{i}", chunk["content"], chunk["metadata"]["source"], chunk["metadata"]["section_title"])
+        for i, chunk in enumerate(ingest_reach_pdf(DATA_DIR / "REACH_Certificate_of_Compliance_Test_Corporation.pdf"))
+    ]
+
+    def reach_with(text: str):
+        return [doc for doc in reach if text in doc.page_content][:1] + reach[:3]
+
+    cases = [
+        ("How much Lead (Pb) is in part TCC-8334-A?", [fmd, parts, reach[2]], ["TCC-8334-A", "55.24%"]),
+        ("What is the CAS No. for Silicon Dioxide in part TC-2410-F?", [fmd, reach[2], parts], ["TC-2410-F", "7631-86-9"]),
+        ("Which part contains Polyamide 6/6 (PA66) at exactly 56.79% weight?", [fmd, parts], ["TCX-6419-C"]),
+        ("What internal procedure covers Restricted Substances Management?", reach_with("TC-QSP-17"), ["TC-QSP-17"]),
+        ("Is part PN=TCC-9856-B listed in the REACH Certificate?", reach_with("TCC-9856-B"), ["TCC-9856-B"]),
+        ("What is the measured average for the Pin Pitch of TC-3541-A?", [parts, fmd], ["2.55"]),
+        ("Did part TR-7820-D pass the Connector Height (H) measurement?", [parts, fmd], ["8.63", "Fail"]),
+        ("What method was used to measure the Board Thickness of TP-1198-B?", [parts, fmd], ["Micrometer"]),
+        ("Does Test Corporation use 23°C for its measurement environment?", [parts, fmd], ["23°C"]),
+    ]
+
+    baseline_tokens = packed_tokens = 0
+    for query, docs, expected in cases:
+        baseline = build_context(docs)
+        packed, _ = pack_context(query, docs)
+        context = build_context(packed)
+
+        for fact in expected:
+            assert fact in context, f"{fact!r} lost from the context of {query!r}"
+        baseline_tokens += estimate_tokens(baseline)
+        packed_tokens += estimate_tokens(context)
+
+    assert packed_tokens < baseline_tokens * 0.6, f"packed {packed_tokens} of {baseline_tokens} baseline context tokens"
@@ -0,0 +1,357 @@
+import os
+import time
+import pytest
+import numpy as np
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+# Mock GOOGLE_API_KEY for tests that don't need it
+os.environ.setdefault("GOOGLE_API_KEY", "mock_key")
+
+from src import ingestion
+from src.parser import PARSERS
+from src.storage import use_storage
+from src.fakes import FakeEmbeddings, ThrottledError
+
+def fake_parser(path: Path):
+    """
+    Splits a text file into one chunk per blank-line separated section whose first line is its title.
+    """
+    chunks = []
+    for block in path.read_text().split("\n\n"):
+        title = block.splitlines()[0]
+        chunks.append({"content": block, "metadata": {"source": path.name, "section_title": title}})
+    return chunks
+
+def run_ingestion(tmp_path, vectorstore, embeddings=None):
+    data_dir = tmp_path / "data"
+    chroma_dir = tmp_path / "chroma_db"
+    with use_storage(data_dir, chroma_dir), \
+         patch.dict(PARSERS, {"a.txt": fake_parser, "b.txt": fake_parser}), \
+         patch("src.ingestion.get_vectorstore", return_value=vectorstore), \
+         patch("src.ingestion.get_embeddings", return_value=embeddings or FakeEmbeddings()):
+        return ingestion.ingest_data(verbose=False, workers=1)
+
+def test_incremental_ingestion(tmp_path):
+    """
+    Only new or changed chunks are upserted; removed files and sections are deleted.
+    """
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "a.txt").write_text("Intro\nhello\n\nLead\n0.1%")
+    (data_dir / "b.txt").write_text("REACH\ncompliant")
+
+    vectorstore = MagicMock()
+    summary = run_ingestion(tmp_path, vectorstore)
+    assert summary == {"added": 3, "updated": 0, "deleted": 0, "skipped": 0, "deduplicated": 0, "failed": 0}
+
+    # Nothing changed: no parsing, no embedding
+    vectorstore.reset_mock()
+    summary = run_ingestion(tmp_path, vectorstore)
+    assert summary == {"added": 0, "updated": 0, "deleted": 0, "skipped": 3, "deduplicated": 0, "failed": 0}
+    vectorstore._collection.upsert.assert_not_called()
+
+    # One section edited, one file removed
+    (data_dir / "a.txt").write_text("Intro\nhello\n\nLead\n0.2%")
+    (data_dir / "b.txt").unlink()
+    vectorstore.reset_mock()
+    summary = run_ingestion(tmp_path, vectorstore)
+    assert summary == {"added": 0, "updated": 1, "deleted": 1, "skipped": 1, "deduplicated": 0, "failed": 0}
+    upserted = vectorstore._collection.upsert.call_args.kwargs
+    assert upserted["documents"] == ["Lead\n0.2%"]
+    assert len(upserted["embeddings"]) == 1
+
+def test_parse_files_reports_errors_without_aborting(tmp_path):
+    """
+    Files are parsed in a process pool; a failing file is reported and the others still stream back.
+    """
+    data_dir = Path(__file__).resolve().parent.parent.parent / "data"
+    html_path = data_dir / "part_measurements_test_corporation.html"
+    unknown_path = tmp_path / "unknown.bin"
+    unknown_path.write_bytes(b"\x00")
+
+    # Each file's chunks stream back from its spool and are read before the next file
+    results = {path.name: (list(chunks), error) for path, chunks, error in
+               ingestion.parse_files([html_path, unknown_path], workers=2, timeout=60)}
+
+    chunks, error = results[html_path.name]
+    assert error is None and len(chunks) >= 1
+    chunks, error = results[unknown_path.name]
+    assert chunks == [] and "KeyError" in error
+
+def test_parse_file_timeout(tmp_path):
+    """
+    A parser exceeding its time budget fails with a timeout instead of blocking ingestion.
+    """
+    slow = tmp_path / "slow.txt"
+    slow.write_text("x")
+    with patch.dict(PARSERS, {"slow.txt": lambda path: time.sleep(5)}):
+        [(path, chunks, error)] = list(ingestion.parse_files([slow], workers=1, timeout=0.2))
+    assert list(chunks) == [] and "ParseTimeoutError" in error
+
+def test_parse_files_kills_parsers_stuck_past_the_deadline(tmp_path):
+    """
+    A parser the in-worker alarm cannot interrupt is killed after the budget and its grace;
+    the other files are still parsed.
+    """
+    import signal
+
+    def stuck_parser(path):
+        # Stands in for a hang in C code: the alarm is never delivered
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+        time.sleep(60)
+
+    stuck = tmp_path / "stuck.txt"
+    stuck.write_text("x")
+    others = []
+    for name in ("a.txt", "b.txt", "c.txt"):
+        others.append(tmp_path / name)
+        others[-1].write_text(f"{name}\nok")
+
+    parsers = {"stuck.txt": stuck_parser, **{path.name: fake_parser for path in others}}
+    started = time.monotonic()
+    with patch.dict(PARSERS, parsers), patch.object(ingestion, "PARSE_KILL_GRACE", 0.3):
+        results = {path.name: (list(chunks), error) for path, chunks, error in
+                   ingestion.parse_files([stuck, *others], workers=2, timeout=0.2)}
+    assert time.monotonic() - started < 10
+
+    chunks, error = results["stuck.txt"]
+    assert chunks == [] and "ParseTimeoutError" in error
+    for path in others:
+        chunks, error = results[path.name]
+        assert error is None and chunks[0]["content"] == f"{path.name}\nok"
+
+def test_parse_file_timeout_excludes_consumer_time(tmp_path):
+    """
+    The budget covers the parser only: the timer is paused while the caller handles a chunk.
+    """
+    path = tmp_path / "stream.txt"
+    path.write_text("x")
+
+    def streaming_parser(path):
+        for i in range(3):
+            yield {"content": str(i), "metadata": {"source": path.name, "section_title": str(i)}}
+
+    with patch.dict(PARSERS, {"stream.txt": streaming_parser}):
+        chunks = []
+        for chunk in ingestion.parse_file(path, timeout=0.1):
+            time.sleep(0.15)
+            chunks.append(chunk)
+    assert [chunk["content"] for chunk in chunks] == ["0", "1", "2"]
+
+def test_embedding_stage_retries_throttling_and_batches():
+    """
+    Throttled calls are retried with backoff and every batch is committed once.
+    """
+    vectorstore = MagicMock()
+    embeddings = FakeEmbeddings(latency=0.01, throttle_every=3)
+    committed = []
+    docs = [ingestion.Document(id=str(i), page_content=f"chunk {i}", metadata={"source": "x"}) for i in range(50)]
+
+    with ingestion.EmbeddingStage(embeddings, vectorstore, on_commit=committed.extend,
+                                  batch_size=8, concurrency=4, rate_limit=0, backoff=0.001) as stage:
+        stage.submit(docs)
+        stage.flush()
+
+    assert sorted(doc.id for doc in committed) == sorted(doc.id for doc in docs)
+    assert stage.stats["batches"] == 7
+    assert stage.stats["retries"] > 0
+    assert vectorstore._collection.upsert.call_count == 7
+
+def test_embedding_stage_gives_up_on_non_retryable_errors():
+    embeddings = MagicMock()
+    embeddings.embed_documents.side_effect = ThrottledError(400, "bad request")
+    with ingestion.EmbeddingStage(embeddings, MagicMock(), batch_size=2, max_retries=3, backoff=0) as stage:
+        stage.submit([ingestion.Document(id="1", page_content="a")])
+        with pytest.raises(ThrottledError):
+            stage.flush()
+    assert embeddings.embed_documents.call_count == 1
+
+def test_token_bucket_limits_rate():
+    bucket = ingestion.TokenBucket(rate=100, capacity=10)
+    start = time.monotonic()
+    for _ in range(30):
+        bucket.acquire(1)
+    # 10 burst tokens, then 20 tokens at 100/s
+    assert time.monotonic() - start >= 0.15
+
+def test_ingestion_resumes_from_last_committed_batch(tmp_path):
+    """
+    A crash mid-embedding keeps committed batches; the next run only embeds the rest.
+    """
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "a.txt").write_text("\n\n".join(f"Section {i}\nbody {i}" for i in range(10)))
+
+    vectorstore = MagicMock()
+    crashing = FakeEmbeddings(fail_after=2)
+    with patch.object(ingestion, "EMBED_BATCH_SIZE", 2), patch.object(ingestion, "EMBED_CONCURRENCY", 1):
+        with pytest.raises(RuntimeError):
+            run_ingestion(tmp_path, vectorstore, crashing)
+        assert crashing.embedded_texts == 4
+
+        healthy = FakeEmbeddings()
+        summary = run_ingestion(tmp_path, vectorstore, healthy)
+
+    assert healthy.embedded_texts == 6
+    assert summary["skipped"] == 4 and summary["added"] == 6
+
+    summary = run_ingestion(tmp_path, vectorstore, FakeEmbeddings())
+    assert summary["skipped"] == 10
+
+def test_embedding_model_change_rebuilds_index(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "a.txt").write_text("Intro\nhello\n\nLead\n0.1%")
+
+    vectorstore = MagicMock()
+    assert run_ingestion(tmp_path, vectorstore)["added"] == 2
+    assert run_ingestion(tmp_path, vectorstore)["skipped"] == 2
+
+    with patch("src.ingestion.embedding_model_id", return_value="hashing-1024"):
+        summary = run_ingestion(tmp_path, vectorstore)
+    assert summary["added"] == 2 and summary["skipped"] == 0
+    manifest = ingestion.load_manifest(tmp_path / "chroma_db" / "ingest_manifest.json")
+    assert manifest["embedding_model"] == "hashing-1024"
+
+def test_index_parameter_change_compacts_without_reembedding(tmp_path):
+    """
+    An index built with another metric, and holding deleted records, is rebuilt from its
+    stored embeddings on the next ingestion: same records, no deleted nodes, configured metric.
+    """
+    import chromadb
+    from src.vector_index import COLLECTION_NAME, open_collection, iter_pages, index_stats, measure_recall
+    from src.config import HNSW_EF_SEARCH
+
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "a.txt").write_text("Intro\nhello")
+    assert run_ingestion(tmp_path, MagicMock())["added"] == 1
+
+    chroma_dir = tmp_path / "chroma_db"
+    vectors = np.random.default_rng(0).normal(size=(300, 16))
+    client = chromadb.PersistentClient(path=str(chroma_dir))
+    collection = client.create_collection(
+        COLLECTION_NAME, embedding_function=None, configuration={"hnsw": {"space": "l2", "sync_threshold": 100}}
+    )
+    collection.add(
+        ids=[f"id{i}" for i in range(300)], embeddings=vectors,
+        documents=[f"chunk {i}" for i in range(300)], metadatas=[{"source": "a.txt", "n": i} for i in range(300)],
+    )
+    collection.delete(ids=[f"id{i}" for i in range(0, 300, 2)])
+    client.close()
+
+    stats = index_stats(chroma_dir)
+    assert stats["records"] == 150 and stats["fragmentation"] == 0.5
+    assert stats["drift"] == {"space": ("l2", "cosine")}
+
+    embeddings = FakeEmbeddings()
+    summary = run_ingestion(tmp_path, MagicMock(), embeddings)
+    assert summary["skipped"] == 1 and embeddings.calls == 0
+
+    stats = index_stats(chroma_dir)
+    assert stats["records"] == 150 and stats["fragmentation"] == 0.0 and stats["drift"] == {}
+    assert stats["configuration"]["space"] == "cosine"
+    assert (chroma_dir / "ingest_manifest.json").exists()
+    assert not (tmp_path / "chroma_db.compact").exists() and not (tmp_path / "chroma_db.old").exists()
+    with open_collection(chroma_dir) as collection:
+        pages = list(iter_pages(collection, page_size=64))
+        assert [len(page["ids"]) for page in pages] == [64, 64, 22]
+        assert sorted(i for page in pages for i in page["ids"]) == sorted(f"id{i}" for i in range(1, 300, 2))
+        assert collection.get(ids=["id7"])["metadatas"] == [{"source": "a.txt", "n": 7}]
+
+    results = measure_recall(chroma_dir, [10, 50], queries=20, k=5)
+    assert [r["ef"] for r in results] == [10, 50]
+    assert all(r["recall"] > 0.9 for r in results)
+    with open_collection(chroma_dir) as collection:
+        assert collection.configuration["hnsw"]["ef_search"] == HNSW_EF_SEARCH
+
+def test_identical_chunks_are_stored_once(tmp_path):
+    """
+    A chunk identical to a stored one is not embedded again; when the stored copy's file is
+    deleted, the other copy takes its record over without re-embedding.
+    """
+    import json
+    from src.dedup import get_duplicate_index
+
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "a.txt").write_text("Intro\nhello\n\nLead\n0.1%")
+    (data_dir / "b.txt").write_text("Lead\n0.1%")
+
+    vectorstore = MagicMock()
+    embeddings = FakeEmbeddings()
+    summary = run_ingestion(tmp_path, vectorstore, embeddings)
+    assert summary == {"added": 3, "updated": 0, "deleted": 0, "skipped": 0, "deduplicated": 1, "failed": 0}
+    assert len(vectorstore._collection.upsert.call_args.kwargs["ids"]) == 2
+    manifest = json.loads((tmp_path / "chroma_db" / "ingest_manifest.json").read_text())
+    ((alias_id, entry),) = manifest["duplicates"].items()
+    assert entry["metadata"]["source"] == "b.txt"
+    stored_id = entry["of"]
+    assert [ref["source"] for ref in get_duplicate_index().references(stored_id)] == ["b.txt"]
+
+    # The stored copy goes away: its record is copied to the alias, nothing is embedded
+    (data_dir / "a.txt").unlink()
+    vectorstore.reset_mock()
+    vectorstore._collection.get.return_value = {"ids": [stored_id], "embeddings": [[0.1, 0.2]], "documents": ["Lead\n0.1%"]}
+    calls = embeddings.calls
+    summary = run_ingestion(tmp_path, vectorstore, embeddings)
+    assert summary["deleted"] == 2 and summary["skipped"] == 1
+    assert embeddings.calls == calls
+    upserted = vectorstore._collection.upsert.call_args.kwargs
+    assert upserted["ids"] == [alias_id] and upserted["embeddings"] == [[0.1, 0.2]]
+    assert upserted["metadatas"][0]["source"] == "b.txt"
+    assert sorted(vectorstore.delete.call_args.kwargs["ids"]) == sorted(set(manifest["files"]["a.txt"]["chunks"]))
+    manifest = json.loads((tmp_path / "chroma_db" / "ingest_manifest.json").read_text())
+    assert manifest["duplicates"] == {}
+    assert get_duplicate_index().references(stored_id) == []
+
+class DiscardingVectorStore:
+    """
+    Vector store stand-in that keeps nothing, so only the pipeline's own memory is measured.
+    """
+    def __init__(self):
+        self._collection = self
+
+    def upsert(self, **kwargs):
+        pass
+
+    def delete(self, ids):
+        pass
+
+def test_ingestion_memory_stays_flat_with_file_size(tmp_path):
+    """
+    Chunks stream from the parser through embedding and upsert in bounded batches:
+    peak memory of a 4x larger file stays within the same ceiling.
+    """
+    import tracemalloc
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    filler = "lorem ipsum dolor " * 400
+
+    def big_parser(path):
+        for i in range(int(path.read_text())):
+            yield {"content": f"row {i} {filler}", "metadata": {"source": path.name, "section_title": f"row {i}"}}
+
+    def peak_ingesting(chunks: int) -> int:
+        (data_dir / "big.txt").write_text(str(chunks))
+        vectorstore = DiscardingVectorStore()
+        chroma_dir = tmp_path / f"chroma_{chunks}"
+        with use_storage(data_dir, chroma_dir), \
+             patch.dict(PARSERS, {"big.txt": big_parser}), \
+             patch.object(ingestion, "EMBED_BATCH_SIZE", 8), \
+             patch.object(ingestion, "EMBED_CONCURRENCY", 1), \
+             patch("src.ingestion.get_vectorstore", return_value=vectorstore), \
+             patch("src.ingestion.get_embeddings", return_value=FakeEmbeddings()):
+            tracemalloc.start()
+            try:
+                summary = ingestion.ingest_data(verbose=False, workers=1)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        assert summary["added"] == chunks
+        return peak
+
+    small, large = peak_ingesting(100), peak_ingesting(400)
+    # Holding the file's chunks would add 300 x 7 KB; the batches in flight stay far below
+    assert large - small < 1_000_000
@@ -0,0 +1,125 @@
+import os
+import asyncio
+from unittest.mock import patch
+
+# Mock GOOGLE_API_KEY for tests that don't need it
+os.environ.setdefault("GOOGLE_API_KEY", "mock_key")
+
+from src import pipeline
+from src.scripts.load_test import run_load_test, install_stub_backends
+
+def test_async_pipeline_load():
+    """
+    Load test against stubbed embedding and LLM backends: concurrent queries overlap
+    their LLM calls instead of running one after another.
+    """
+    result = run_load_test(num_queries=60, concurrency=20, embedding_latency=0.005, llm_latency=0.1)
+    print(
+        f"\nthroughput={result['throughput_qps']:.1f} q/s "
+        f"p50={result['p50'] * 1000:.0f}ms p95={result['p95'] * 1000:.0f}ms p99={result['p99'] * 1000:.0f}ms"
+    )
+
+    assert result["llm_calls"] > 0
+    sequential_llm_seconds = result["llm_calls"] * 0.1
+    assert result["seconds"] < sequential_llm_seconds / 2
+    assert result["p50"] <= result["p95"] <= result["p99"]
+
+def test_async_pipeline_llm_timeout():
+    """
+    A stage exceeding its timeout returns a safe error response instead of hanging.
+    """
+    install_stub_backends(embedding_latency=0, llm_latency=5)
+    with patch.object(pipeline, "LLM_TIMEOUT", 0.1), patch("src.retriever.GROUNDING_THRESHOLD", 0.0):
+        response = asyncio.run(pipeline.aanswer_query("How much lead is in part TC-3541-A?"))
+    assert "timed out" in response.answer
+    assert response.is_compliant is None
+
+def test_streaming_query_reports_first_token(capsys):
+    """
+    In streaming mode the answer arrives in several pieces before the full response,
+    and the first token comes before the end of generation.
+    """
+    from src.main import run_query
+
+    install_stub_backends(embedding_latency=0, llm_latency=0.2)
+    tokens = []
+    with patch("src.retriever.GROUNDING_THRESHOLD", 0.0):
+        response = asyncio.run(pipeline.aanswer_query("Is Test Corporation REACH compliant?", on_token=tokens.append))
+    assert len(tokens) > 1
+    assert "".join(tokens) == response.answer
+
+    with patch("src.retriever.GROUNDING_THRESHOLD", 0.0):
+        timings = run_query("Is Test Corporation REACH compliant?", stream=True)
+    output = capsys.readouterr().out
+    assert f"ANSWER: {response.answer}" in output
+    assert "CONFIDENCE:" in output
+    assert 0 < timings["first_token"] < timings["total"]
+
+def test_batch_mode_streams_and_resumes(tmp_path):
+    """
+    Batch answers are streamed as JSON lines; a rerun only answers the missing questions.
+    """
+    import json
+    from src.main import run_batch
+
+    questions = tmp_path / "questions.jsonl"
+    questions.write_text("\n".join([
+        json.dumps({"id": "q1", "query": "How much lead is in part TC-3541-A?"}),
+        json.dumps({"id": "q2", "question": "Does TC-3541-B contain cadmium?"}),
+        json.dumps("What is the weight of part TC-8812-C?"),
+    ]))
+    output = tmp_path / "answers.jsonl"
+    # Simulate an interrupted run: q1 done, then a truncated line
+    output.write_text(json.dumps({"id": "q1", "answer": "done"}) + "\n" + '{"id": "q2", "ans')
+
+    chain = install_stub_backends(embedding_latency=0, llm_latency=0)
+    with patch("src.retriever.GROUNDING_THRESHOLD", 0.0):
+        run_batch(questions, output)
+
+    records = [json.loads(line) for line in output.read_text().splitlines()[2:]]
+    assert sorted(str(record["id"]) for record in records) == ["3", "q2"]
+    assert all({"answer", "is_compliant", "confidence", "sources"} <= record.keys() for record in records)
+    assert chain.calls == 2
+
+def test_cached_embeddings_batches_uncached_queries(tmp_path):
+    from unittest.mock import MagicMock
+    from src.embedding_cache import CachedEmbeddings
+    from src.fakes import FakeEmbeddings
+
+    fake = FakeEmbeddings()
+    query_batch = MagicMock(side_effect=lambda texts: [fake.embed_query(text) for text in texts])
+    cache = CachedEmbeddings(fake, "fake", tmp_path / "cache.sqlite3", query_batch=query_batch)
+
+    cache.embed_queries(["a", "b", "c"])
+    cache.embed_queries(["a", "b", "c", "d"])
+    assert [len(call.args[0]) for call in query_batch.call_args_list] == [3, 1]
+
+def test_benchmark_smoke(tmp_path):
+    """
+    The offline benchmark ingests a small synthetic corpus and answers queries
+    without touching the real index.
+    """
+    from src.config import CHROMA_DIR
+    from src.storage import storage_paths
+    from src.scripts.benchmark import run_benchmark, compare_results
+
+    existed = CHROMA_DIR.exists()
+    paths = storage_paths()
+    work_dir = tmp_path / "benchmark"
+    result = run_benchmark(fmd=1, reach=1, html=1, parts_per_file=3, queries=10, concurrency=4, workers=1, work_dir=work_dir, generic=1)
+
+    assert result["corpus"]["files"] == 6
+    assert result["ingestion"]["failed_files"] == 0
+    assert set(result["ingestion"]["parse_per_file"]) == {"pdf", "html", "md"}
+    # Every file is routed by its content to the parser it was generated for
+    assert result["parsers"]["misrouted"] == []
+    assert set(result["parsers"]["per_parser"]) == {"fmd", "reach", "measurement", "pdf", "html", "markdown"}
+    assert result["parsers"]["per_parser"]["fmd"]["pages_per_sec"] > 0
+    assert result["ingestion"]["embed_batches"] > 0 and result["ingestion"]["index_bytes"] > 0
+    assert result["query"]["count"] == 10 and result["query"]["p50_ms"] <= result["query"]["p99_ms"]
+    assert result["peak_rss_mb"] > 0
+    assert CHROMA_DIR.exists() == existed
+    # The index was built in the work directory and the storage paths are restored
+    assert (work_dir / "chroma_db" / "ingest_manifest.json").exists()
+    assert not paths.manifest_path.exists() and storage_paths() == paths
+    assert "query.p99_ms" in compare_results(result, result)
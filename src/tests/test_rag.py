@@ -3,6 +3,25 @@ from unittest.mock import MagicMock, patch
 from langchain_core.documents import Document
 from src.retriever import retrieve_context
 from src.inference import generate_answer, ComplianceResponse
+from langchain_core.embeddings import Embeddings
+
+def mock_vector_hits(vectorstore: MagicMock, hits):
+    """
+    Makes a mocked vector store return (Document, score) hits: the query embeds to a unit
+    vector and each hit's stored embedding has the given cosine similarity to it.
+    """
+    from src.resources import registry
+
+    embeddings = MagicMock(spec=Embeddings)
+    embeddings.embed_query.return_value = [1.0, 0.0]
+    registry.get("embeddings", lambda: embeddings)
+    docs = [doc for doc, _ in hits]
+    vectorstore._collection.query.return_value = {
+        "ids": [[doc.id or f"doc-{i}" for i, doc in enumerate(docs)]],
+        "documents": [[doc.page_content for doc in docs]],
+        "metadatas": [[doc.metadata for doc in docs]],
+        "embeddings": [[[score, (1.0 - score ** 2) ** 0.5] for _, score in hits]],
+    }
 
 @patch("src.retriever.get_vectorstore")
 def test_retrieval_accuracy_unit(mock_get_vs):
@@ -17,7 +36,7 @@ def test_retrieval_accuracy_unit(mock_get_vs):
     )
     
     mock_vectorstore = MagicMock()
-    mock_vectorstore.similarity_search_with_relevance_scores.return_value = [(mock_doc, 0.9)]
+    mock_vector_hits(mock_vectorstore, [(mock_doc, 0.9)])
     mock_get_vs.return_value = mock_vectorstore
     
     query = "How much Lead is in part TC-3541-A?"
@@ -41,7 +60,7 @@ def test_grounding_threshold_unit(mock_get_vs):
     
     mock_vectorstore = MagicMock()
     # Below the 0.7 default threshold
-    mock_vectorstore.similarity_search_with_relevance_scores.return_value = [(mock_doc, 0.4)]
+    mock_vector_hits(mock_vectorstore, [(mock_doc, 0.4)])
     mock_get_vs.return_value = mock_vectorstore
     
     query = "What is the weight limit for Pluto?"
@@ -62,16 +81,11 @@ def test_inference_safe_failure():
     assert response.confidence == 0.4
     assert len(response.sources) == 0
 
-@patch("src.inference.ChatPromptTemplate.from_messages")
-@patch("src.inference.ChatGoogleGenerativeAI")
-def test_inference_success(mock_llm_class, mock_prompt_class):
+@patch("src.inference.get_chain")
+def test_inference_success(mock_get_chain):
     """
     Test successful inference with mocked Gemini response.
     """
-    mock_llm = MagicMock()
-    mock_structured_llm = MagicMock()
-    mock_prompt = MagicMock()
-    
     # Mocking the response from the structured LLM
     mock_response = ComplianceResponse(
         answer="Part TC-3541-A contains 0.1% Lead.",
@@ -83,12 +97,7 @@ def test_inference_success(mock_llm_class, mock_prompt_class):
     # Mock prompt | structured_llm
     mock_chain = MagicMock()
     mock_chain.invoke.return_value = mock_response
-    
-    mock_prompt.__or__.return_value = mock_chain
-    mock_prompt_class.return_value = mock_prompt
-    
-    mock_llm.with_structured_output.return_value = mock_structured_llm
-    mock_llm_class.return_value = mock_llm
+    mock_get_chain.return_value = mock_chain
     
     query = "How much Lead is in part TC-3541-A?"
     context = [Document(page_content="Lead: 0.1%", metadata={"source": "FMD.pdf", "section_title": "All"})]
@@ -98,3 +107,266 @@ def test_inference_success(mock_llm_class, mock_prompt_class):
     assert response.answer == "Part TC-3541-A contains 0.1% Lead."
     assert response.confidence == 0.9
     assert response.is_compliant is True
+
+def test_semantic_answer_cache():
+    """
+    Paraphrased queries grounded on the same chunks reuse the cached answer;
+    changed or re-ingested chunks never do.
+    """
+    from src.answer_cache import SemanticAnswerCache
+
+    cache = SemanticAnswerCache(max_distance=0.05, ttl=60, max_entries=10)
+    chunk = Document(id="c1", page_content="Lead: 0.1%", metadata={"content_hash": "h1"})
+    response = ComplianceResponse(answer="0.1% Lead.", is_compliant=True, confidence=0.9, sources=[])
+
+    cache.store([1.0, 0.0, 0.0], [chunk], response)
+
+    hit = cache.lookup([0.99, 0.05, 0.0], [chunk])
+    assert hit is not None and hit[0].answer == "0.1% Lead."
+    assert cache.lookup([0.0, 1.0, 0.0], [chunk]) is None
+
+    edited = Document(id="c1", page_content="Lead: 0.2%", metadata={"content_hash": "h2"})
+    assert cache.lookup([1.0, 0.0, 0.0], [edited]) is None
+
+    cache.invalidate_chunks(["c1"])
+    assert cache.lookup([1.0, 0.0, 0.0], [chunk]) is None
+    assert cache.stats() == {"hits": 1, "misses": 3, "entries": 0}
+
+def test_exact_identifier_query_skips_vector_search():
+    """
+    A query whose part number is the part number of indexed chunks is answered without
+    embedding the query; a part only mentioned in a chunk's text goes through vector search.
+    """
+    from langchain_chroma import Chroma
+    from src.fakes import FakeEmbeddings
+    from src.resources import registry
+    from src.lexical import LexicalIndex, extract_identifiers
+    from src.inference import chunk_scores
+
+    docs = [
+        Document(id="fmd", page_content="| TC-3541-A | Lead | 7439-92-1 | 0.1% |",
+                 metadata={"source": "FMD.pdf", "section_title": "FMD", "doc_type": "fmd", "part_number": "TC-3541-A", "cas": "7439-92-1"}),
+        Document(id="note", page_content="Part TC-3541-B replaces TC-3541-A from lot 7.",
+                 metadata={"source": "notes.md", "section_title": "Notes"}),
+    ]
+    vectorstore = Chroma(collection_name="exact_match_test", embedding_function=FakeEmbeddings())
+    vectorstore.add_documents(docs, ids=[doc.id for doc in docs])
+    index = LexicalIndex()
+    index.add(docs)
+    embeddings = FakeEmbeddings()
+    registry.invalidate("lexical_index")
+    registry.get("lexical_index", lambda: index)
+    registry.get("vectorstore", lambda: vectorstore)
+    registry.get("embeddings", lambda: embeddings)
+
+    for query in ("How much lead is in TC-3541-A?", "lead in tc-3541-a", "Which part contains CAS 7439-92-1?"):
+        found, max_score = retrieve_context(query, threshold=0.5)
+        assert [doc.id for doc in found] == ["fmd"] and found[0].metadata["match_type"] == "exact"
+        assert max_score == 1.0
+    assert chunk_scores(found) == [{"file": "FMD.pdf", "section": "FMD", "score": None}]
+    assert embeddings.calls == 0
+
+    # TC-3541-B is no chunk's part number: the query is embedded and searched
+    found, _ = retrieve_context("What replaces TC-3541-B?", threshold=0.0)
+    assert embeddings.calls == 1
+    assert all(doc.metadata.get("match_type") != "exact" for doc in found)
+    vectorstore.delete_collection()
+
+    # Dates and regulation numbers are not identifiers
+    assert extract_identifiers("Issued 2023-01-15 under 1907-2006 and rohs-2 for LOT-7Q1D2K9Z") == ["lot-7q1d2k9z"]
+
+@patch("src.retriever.get_vectorstore")
+def test_substance_query_retrieves_single_table_row(mock_get_vs):
+    """
+    "lead in <part>" resolves to the one matching FMD row through the table row index.
+    """
+    from src.resources import registry
+    from src.table_index import TableIndex
+
+    lead_row = Document(
+        id="row-lead", page_content="| TCC-8334-A | Lead (Pb) | 7439-92-1 |",
+        metadata={"chunk_type": "table_row", "part_number": "TCC-8334-A", "substance": "Lead (Pb)", "cas": "7439-92-1"}
+    )
+    gold_row = Document(
+        id="row-gold", page_content="| TCC-8334-A | Gold (Au) | 7440-57-5 |",
+        metadata={"chunk_type": "table_row", "part_number": "TCC-8334-A", "substance": "Gold (Au)", "cas": "7440-57-5"}
+    )
+    index = TableIndex()
+    index.add([lead_row, gold_row])
+    registry.invalidate("table_index")
+    registry.get("table_index", lambda: index)
+
+    mock_vectorstore = MagicMock()
+    mock_vector_hits(mock_vectorstore, [])
+    mock_vectorstore.get.return_value = {
+        "ids": ["row-lead"], "documents": [lead_row.page_content],
+        "metadatas": [{"source": "FMD.pdf", **lead_row.metadata}],
+    }
+    mock_get_vs.return_value = mock_vectorstore
+
+    docs, max_score = retrieve_context("lead in TCC-8334-A", threshold=0.5)
+
+    assert [doc.id for doc in docs] == ["row-lead"]
+    assert max_score == 1.0
+    # One metadata-only lookup of the row, kept only if the part number is its own
+    get_kwargs = mock_vectorstore.get.call_args.kwargs
+    assert get_kwargs["ids"] == ["row-lead"] and "embeddings" not in get_kwargs["include"]
+    route_filter, identifier_filter = get_kwargs["where"]["$and"]
+    assert route_filter == {"part_number": "TCC-8334-A"}
+    assert {"part_number": {"$in": ["TCC-8334-A", "tcc-8334-a"]}} in identifier_filter["$or"]
+    mock_vectorstore._collection.query.assert_not_called()
+    registry.get("embeddings", MagicMock).embed_query.assert_not_called()
+
+@patch("src.retriever.get_vectorstore")
+def test_hybrid_retrieval_fuses_lexical_hits(mock_get_vs):
+    """
+    Lexical hits join grounded vector hits through reciprocal-rank fusion; ungrounded queries stay empty.
+    """
+    from src.resources import registry
+    from src.lexical import LexicalIndex
+
+    index = LexicalIndex()
+    index.add([
+        Document(id="a", page_content="cadmium content of the housing"),
+        Document(id="b", page_content="cadmium cadmium restricted substance list"),
+    ])
+    registry.invalidate("lexical_index")
+    registry.get("lexical_index", lambda: index)
+
+    vector_doc = Document(id="a", page_content="cadmium content of the housing", metadata={"source": "x"})
+    mock_vectorstore = MagicMock()
+    mock_vector_hits(mock_vectorstore, [(vector_doc, 0.8)])
+    mock_vectorstore.get.return_value = {
+        "ids": ["b"], "documents": ["cadmium cadmium restricted substance list"], "metadatas": [{"source": "y"}]
+    }
+    mock_get_vs.return_value = mock_vectorstore
+
+    docs, max_score = retrieve_context("cadmium restricted", threshold=0.5)
+    assert {doc.id for doc in docs} == {"a", "b"}
+    assert max_score == 0.8
+
+    mock_vector_hits(mock_vectorstore, [(vector_doc, 0.2)])
+    docs, max_score = retrieve_context("cadmium restricted", threshold=0.5)
+    assert docs == []
+
+def test_router_detects_doc_types_regulations_and_parts():
+    from src.router import route_query
+
+    route = route_query("What is the article-level threshold for SVHC content under REACH?")
+    assert route.doc_types == ["reach"] and route.regulations == ["REACH", "SVHC"]
+    assert route.where() == {"doc_type": "reach"}
+
+    route = route_query("Did part TR-7820-D pass the Connector Height (H) measurement?")
+    assert route.where() == {"$and": [{"doc_type": "measurement"}, {"part_number": "TR-7820-D"}]}
+    assert route.matches({"doc_type": "measurement", "part_number": "TR-7820-D"})
+    assert not route.matches({"doc_type": "measurement", "part_number": "TC-3541-A"})
+
+    # Part numbers only narrow row-chunked documents, and only if the index knows them
+    assert route_query("Is part TCC-9856-B listed in the REACH certificate?").where() == {"doc_type": "reach"}
+    assert route_query("Which procedure is TC-QSP-17?", known_part=lambda part: False).where() is None
+    # "reach" the verb is not the regulation; off-topic questions are not routed
+    assert route_query("What is the weight limit to reach Pluto?").where() is None
+
+def test_routed_retrieval_filters_and_falls_back():
+    """
+    Routed queries only search their document type; a routed search finding nothing
+    falls back to the whole collection.
+    """
+    from langchain_chroma import Chroma
+    from src.fakes import FakeEmbeddings
+    from src.resources import registry
+    from src.retriever import retrieve_context_batch
+
+    chunks = {
+        "reach": ("SVHC threshold 0.1% w/w for articles", "reach"),
+        "meas": ("SVHC threshold measured on the production line", "measurement"),
+        "fmd": ("threshold of lead content 0.1% in the material disclosure", "fmd"),
+    }
+    vectorstore = Chroma(collection_name="routing_test", embedding_function=FakeEmbeddings())
+    vectorstore.add_documents(
+        [Document(id=doc_id, page_content=text, metadata={"source": f"{doc_id}.pdf", "doc_type": doc_type})
+         for doc_id, (text, doc_type) in chunks.items()],
+        ids=list(chunks),
+    )
+    registry.get("vectorstore", lambda: vectorstore)
+    registry.get("embeddings", FakeEmbeddings)
+
+    docs, _ = retrieve_context("SVHC threshold in the REACH certificate", threshold=0.0)
+    assert [doc.id for doc in docs] == ["reach"]
+
+    (routed, _), (unrouted, _) = retrieve_context_batch(["SVHC threshold under REACH", "threshold 0.1%"], threshold=0.0)[0]
+    assert [doc.id for doc in routed] == ["reach"]
+    assert {doc.id for doc in unrouted} == set(chunks)
+
+    vectorstore.delete(ids=["reach"])
+    docs, _ = retrieve_context("SVHC threshold in the REACH certificate", threshold=0.0)
+    assert {doc.id for doc in docs} == {"meas", "fmd"}
+    vectorstore.delete_collection()
+
+def test_part_routing_filters_exact_matches_and_vector_search():
+    """
+    A known part number narrows the vector search to its rows, and exact matches outside
+    the route (FMD rows of a part asked about in the REACH certificate) are dropped.
+    """
+    from langchain_chroma import Chroma
+    from src.fakes import FakeEmbeddings
+    from src.resources import registry
+    from src.lexical import LexicalIndex
+    from src.table_index import TableIndex
+
+    chunks = {
+        "meas-a": ("Overall thickness of part TC-3541-A is 2.5 mm", {"doc_type": "measurement", "part_number": "TC-3541-A"}),
+        "meas-b": ("Overall thickness of part TC-3541-B is 2.5 mm", {"doc_type": "measurement", "part_number": "TC-3541-B"}),
+        "fmd-a": ("| TC-3541-A | Lead (Pb) | 7439-92-1 |", {"doc_type": "fmd", "part_number": "TC-3541-A", "chunk_type": "table_row"}),
+        "reach": ("All parts listed in this certificate comply with REACH", {"doc_type": "reach"}),
+    }
+    docs = [Document(id=doc_id, page_content=text, metadata={"source": f"{doc_id}.pdf", **metadata})
+            for doc_id, (text, metadata) in chunks.items()]
+    vectorstore = Chroma(collection_name="part_routing_test", embedding_function=FakeEmbeddings())
+    vectorstore.add_documents(docs, ids=list(chunks))
+    lexical_index, table_index = LexicalIndex(), TableIndex()
+    lexical_index.add(docs)
+    table_index.add(docs)
+    for name, resource in (("lexical_index", lexical_index), ("table_index", table_index)):
+        registry.invalidate(name)
+        registry.get(name, lambda resource=resource: resource)
+    registry.get("vectorstore", lambda: vectorstore)
+    registry.get("embeddings", FakeEmbeddings)
+
+    # No chunk names the procedure, so there is no exact match: the vector search is
+    # restricted to the measurement rows of TC-3541-A
+    docs, _ = retrieve_context("Overall thickness of TC-3541-A per TC-QSP-17?", threshold=0.0)
+    assert [doc.id for doc in docs] == ["meas-a"]
+    assert docs[0].metadata.get("match_type") != "exact"
+
+    # The exact match in the FMD is outside the REACH route
+    docs, _ = retrieve_context("Is part TC-3541-A listed in the REACH certificate?", threshold=0.0)
+    assert [doc.id for doc in docs] == ["reach"]
+
+    docs, _ = retrieve_context("Overall thickness of TC-3541-A?", threshold=0.0)
+    assert [doc.id for doc in docs] == ["meas-a"] and docs[0].metadata["match_type"] == "exact"
+    vectorstore.delete_collection()
+
+@patch("src.retriever.get_vectorstore")
+def test_per_source_thresholds_and_chunk_scores(mock_get_vs):
+    """
+    Calibrated thresholds apply per source; the score of every context chunk reaches the response.
+    """
+    from src.resources import registry
+    from src.rerank import GroundingThresholds
+    from src.inference import chunk_scores
+
+    fmd = Document(id="fmd", page_content="Material composition table", metadata={"source": "FMD.pdf", "section_title": "FMD"})
+    reach = Document(id="reach", page_content="Declaration of conformity", metadata={"source": "REACH.pdf", "section_title": "Scope"})
+    mock_vectorstore = MagicMock()
+    mock_vector_hits(mock_vectorstore, [(fmd, 0.7), (reach, 0.6)])
+    mock_get_vs.return_value = mock_vectorstore
+    registry.invalidate("grounding_thresholds")
+    registry.get("grounding_thresholds", lambda: GroundingThresholds({"FMD.pdf": 0.8, "REACH.pdf": 0.5}))
+
+    docs, max_score = retrieve_context("Which document declares conformity?")
+    assert [doc.id for doc in docs] == ["reach"] and max_score == pytest.approx(0.7)
+    # An explicit threshold applies to every source
+    docs, _ = retrieve_context("Which document declares conformity?", threshold=0.65)
+    assert [doc.id for doc in docs] == ["fmd"]
+    assert chunk_scores(docs) == [{"file": "FMD.pdf", "section": "FMD", "score": 0.7}]
@@ -0,0 +1,129 @@
+import os
+import json
+import asyncio
+from unittest.mock import patch
+
+# Mock GOOGLE_API_KEY for tests that don't need it
+os.environ.setdefault("GOOGLE_API_KEY", "mock_key")
+
+import httpx
+from src.server import ComplianceServer
+from src.storage import use_storage
+from src.scripts.load_test import install_stub_backends
+
+def _client(app: ComplianceServer) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+def _write_manifest(path, files):
+    path.write_text(json.dumps({"version": 1, "files": {
+        name: {"hash": name, "chunks": {f"{name}-{i}": "h" for i in range(3)}} for name in files
+    }}))
+
+def test_server_endpoints(tmp_path):
+    manifest = tmp_path / "ingest_manifest.json"
+
+    async def scenario():
+        with use_storage(chroma_dir=manifest.parent), patch("src.retriever.GROUNDING_THRESHOLD", 0.0):
+            app = ComplianceServer(max_batch=2, warm=lambda: install_stub_backends(0, 0))
+            await app.startup()
+            async with _client(app) as client:
+                assert (await client.get("/health")).json() == {"status": "ok"}
+                assert (await client.get("/ready")).status_code == 503
+
+                _write_manifest(manifest, ["FMD.pdf"])
+                app.index_version = manifest.stat().st_mtime_ns
+                ready = await client.get("/ready")
+                assert ready.status_code == 200 and ready.json()["chunks"] == 3
+
+                answer = await client.post("/query", json={"query": "How much lead is in part TC-3541-A?"})
+                assert answer.status_code == 200
+                assert {"answer", "is_compliant", "confidence", "sources"} <= answer.json().keys()
+
+                batch = await client.post("/batch", json={"queries": [{"id": "a", "query": "REACH threshold?"}, "Lead?"]})
+                assert [result["id"] for result in batch.json()["results"]] == ["a", 1]
+
+                assert (await client.post("/batch", json={"queries": ["a", "b", "c"]})).status_code == 413
+                assert (await client.post("/query", json={"query": ""})).status_code == 400
+                assert (await client.post("/query", content=b"{not json")).status_code == 400
+                assert (await client.get("/query")).status_code == 405
+                assert (await client.get("/nope")).status_code == 404
+
+    asyncio.run(scenario())
+
+def test_server_limits_and_reloads_without_dropping_requests(tmp_path):
+    """
+    Queries beyond the admission limit get 503; an index change on disk is picked up
+    after the query in flight completes, and both queries succeed.
+    """
+    manifest = tmp_path / "ingest_manifest.json"
+    _write_manifest(manifest, ["FMD.pdf"])
+    warmups = []
+
+    def warm():
+        warmups.append(1)
+        install_stub_backends(0, 0.2)
+
+    async def scenario():
+        with use_storage(chroma_dir=manifest.parent), patch("src.retriever.GROUNDING_THRESHOLD", 0.0):
+            app = ComplianceServer(max_pending=1, warm=warm)
+            await app.startup()
+            async with _client(app) as client:
+                first = asyncio.create_task(client.post("/query", json={"query": "Which parts are not compliant?"}))
+                await asyncio.sleep(0.05)
+                busy = await client.post("/query", json={"query": "REACH threshold?"})
+                assert busy.status_code == 503 and busy.headers["retry-after"] == "1"
+
+                app.max_pending = 2
+                _write_manifest(manifest, ["FMD.pdf", "REACH.pdf"])
+                second = await client.post("/query", json={"query": "REACH threshold?"})
+                assert (await first).status_code == 200 and second.status_code == 200
+                assert app.reloads == 1 and len(warmups) == 2
+                assert (await client.get("/ready")).json()["files"] == 2
+
+    asyncio.run(scenario())
+
+def test_ingest_runs_in_a_child_process_with_a_timeout(tmp_path):
+    """
+    /ingest returns the child's summary and reopens the index; a run past the timeout is
+    killed and queries held back meanwhile go through.
+    """
+    import sys
+
+    manifest = tmp_path / "ingest_manifest.json"
+    _write_manifest(manifest, ["FMD.pdf"])
+    warmups = []
+
+    def warm():
+        warmups.append(1)
+        install_stub_backends(0, 0)
+
+    summary = {"added": 2, "updated": 0, "deleted": 0, "skipped": 1, "deduplicated": 0, "failed": 0}
+    succeed = [sys.executable, "-c", f"print('Parsing...'); print({json.dumps(json.dumps(summary))})"]
+    hang = [sys.executable, "-c", "import time; time.sleep(30)"]
+    fail = [sys.executable, "-c", "raise SystemExit('no data directory')"]
+
+    async def scenario():
+        with use_storage(chroma_dir=manifest.parent), patch("src.retriever.GROUNDING_THRESHOLD", 0.0):
+            app = ComplianceServer(warm=warm, ingest_command=succeed, ingest_timeout=0.5)
+            await app.startup()
+            async with _client(app) as client:
+                response = await client.post("/ingest")
+                assert response.status_code == 200
+                assert {key: response.json()[key] for key in summary} == summary
+                assert len(warmups) == 2
+
+                app.ingest_command = hang
+                start = asyncio.get_running_loop().time()
+                ingest = asyncio.create_task(client.post("/ingest"))
+                await asyncio.sleep(0.1)
+                query = await client.post("/query", json={"query": "REACH threshold?"})
+                assert query.status_code == 200
+                assert (await ingest).status_code == 504
+                assert asyncio.get_running_loop().time() - start < 5
+                assert not app.ingesting and len(warmups) == 3
+
+                app.ingest_command = fail
+                failed = await client.post("/ingest")
+                assert failed.status_code == 500 and "no data directory" in failed.json()["error"]
+
+    asyncio.run(scenario())
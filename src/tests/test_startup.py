@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+import subprocess
+from pathlib import Path
+from typing import Dict
+from unittest.mock import patch
+
+import pytest
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+# Libraries that must only load on the code path that uses them
+HEAVY_MODULES = ("langchain_google_genai", "langchain_chroma", "chromadb", "pymupdf4llm", "bs4", "markdownify")
+
+def _run(*args: str) -> subprocess.CompletedProcess:
+    env = {key: value for key, value in os.environ.items() if key != "GOOGLE_API_KEY"}
+    env["PYTHONPATH"] = str(BASE_DIR)
+    return subprocess.run([sys.executable, *args], cwd=BASE_DIR, env=env, capture_output=True, text=True)
+
+def _import_times(statement: str) -> Dict[str, int]:
+    """
+    Runs `statement` under `python -X importtime` and returns the cumulative
+    import time (microseconds) of every module it loaded.
+    """
+    result = _run("-X", "importtime", "-c", statement)
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+# Runs `main.py --wipe` up to the wipe, with the database left alone
+WIPE_STATEMENT = (
+    "import sys, src.main, src.manifest; "
+    "src.manifest.clear_database = lambda: sys.exit(0); "
+    "sys.argv = ['main.py', '--wipe']; src.main.main()"
+)
+
+@pytest.mark.parametrize("statement", ["import src.main", "from src.manifest import clear_database", WIPE_STATEMENT])
+def test_cli_startup_defers_heavy_imports(statement):
+    times = _import_times(statement)
+    assert not [name for name in times if name.split(".")[0] in HEAVY_MODULES]
+
+def test_help_runs_fast_without_api_key():
+    start = time.perf_counter()
+    result = _run("src/main.py", "--help")
+    elapsed = time.perf_counter() - start
+    assert result.returncode == 0 and "usage" in result.stdout
+    assert elapsed < 1.0, f"--help took {elapsed:.2f}s"
+    assert _import_times("import src.main")["src.main"] < 500_000
+
+def test_missing_api_key_raises_when_client_is_built():
+    from src.retriever import get_embeddings
+
+    with patch("src.config.GOOGLE_API_KEY", None), pytest.raises(ValueError, match="GOOGLE_API_KEY"):
+        get_embeddings()
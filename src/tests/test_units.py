@@ -12,15 +12,26 @@ DATA_DIR = BASE_DIR / "data"
 
 def test_ingest_fmd_pdf():
     fmd_path = DATA_DIR / "FMD_Test_Corporation.pdf"
-    chunks = ingest_fmd_pdf(fmd_path)
-    assert len(chunks) == 1
-    assert chunks[0]["metadata"]["source"] == "FMD_Test_Corporation.pdf"
-    assert "content" in chunks[0]
-    assert len(chunks[0]["content"]) > 0
+    chunks = list(ingest_fmd_pdf(fmd_path))
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk["metadata"]["source"] == "FMD_Test_Corporation.pdf"
+        assert len(chunk["content"]) > 0
+
+    # One chunk per substance row, header repeated, including rows of the table continued on page 2
+    rows = [chunk for chunk in chunks if chunk["metadata"]["chunk_type"] == "table_row"]
+    lead = [row for row in rows if row["metadata"].get("substance") == "Lead (Pb)"]
+    assert len(lead) == 1
+    assert lead[0]["metadata"]["part_number"] == "TCC-8334-A"
+    assert lead[0]["metadata"]["cas"] == "7439-92-1"
+    assert lead[0]["metadata"]["status"] == "Not Compliant"
+    assert "| Part Number |" in lead[0]["content"]
+    assert any(row["metadata"]["part_number"] == "TP-4317-D" for row in rows)
+    assert all("| Part Number |" in row["content"] for row in rows)
 
 def test_ingest_reach_pdf():
     reach_path = DATA_DIR / "REACH_Certificate_of_Compliance_Test_Corporation.pdf"
-    chunks = ingest_reach_pdf(reach_path)
+    chunks = list(ingest_reach_pdf(reach_path))
     assert len(chunks) > 1
     for chunk in chunks:
         assert "source" in chunk["metadata"]
@@ -28,7 +39,495 @@ def test_ingest_reach_pdf():
 
 def test_ingest_parts_html():
     html_path = DATA_DIR / "part_measurements_test_corporation.html"
-    chunks = ingest_parts_html(html_path)
-    assert len(chunks) == 1
-    assert "<table>" in chunks[0]["content"].lower() or "| " in chunks[0]["content"] # markdown conversion
-    assert chunks[0]["metadata"]["source"] == "part_measurements_test_corporation.html"
+    chunks = list(ingest_parts_html(html_path))
+    assert all(chunk["metadata"]["source"] == "part_measurements_test_corporation.html" for chunk in chunks)
+
+    rows = [chunk for chunk in chunks if chunk["metadata"]["chunk_type"] == "table_row"]
+    assert len(rows) == 6
+    assert rows[0]["metadata"]["part_number"] == "TC-3541-A"
+    assert rows[0]["metadata"]["revision"] == "R3"
+    assert "| Part Number | Feature |" in rows[0]["content"] # header repeated in markdown
+    # Notes after the table stay in a text chunk
+    assert any("TC-QSP-05" in chunk["content"] for chunk in chunks if chunk["metadata"]["chunk_type"] == "text")
+
+def test_parser_registry_dispatches_on_content(tmp_path):
+    """
+    Files are routed by media type and content, not by name; unidentified documents of a
+    supported type get the generic parser, and unsupported files are rejected.
+    """
+    import shutil
+    import pymupdf
+    from src.parser import resolve_parser, is_supported
+
+    shutil.copy(DATA_DIR / "FMD_Test_Corporation.pdf", tmp_path / "supplier_17.pdf")
+    shutil.copy(DATA_DIR / "REACH_Certificate_of_Compliance_Test_Corporation.pdf", tmp_path / "cert")
+    shutil.copy(DATA_DIR / "part_measurements_test_corporation.html", tmp_path / "report.htm")
+    (tmp_path / "page.html").write_text("<html><body><h1>Packaging</h1><table><tr><th>Part Number</th><th>Box</th></tr>"
+                                        "<tr><td>TC-1000-A</td><td>B12</td></tr></table></body></html>", encoding="utf-8")
+    (tmp_path / "notes.md").write_text("# Notes\n\n| Part Number | Finish |\n|---|---|\n| TC-2000-B | Matte |\n", encoding="utf-8")
+    (tmp_path / "blob.bin").write_bytes(b"\x00\x01")
+    with pymupdf.open() as doc:
+        doc.new_page().insert_text((72, 72), "Supplier quality agreement")
+        doc.save(tmp_path / "agreement.pdf")
+
+    names = {path.name: resolve_parser(path)[0] for path in tmp_path.iterdir() if is_supported(path)}
+    assert names == {
+        "supplier_17.pdf": "fmd", "cert": "reach", "report.htm": "measurement",
+        "page.html": "html", "notes.md": "markdown", "agreement.pdf": "pdf",
+    }
+    with pytest.raises(KeyError):
+        resolve_parser(tmp_path / "blob.bin")
+
+    # Generic parsers chunk tables per row like the specialized ones
+    _, parse = resolve_parser(tmp_path / "notes.md")
+    rows = [chunk for chunk in parse(tmp_path / "notes.md") if chunk["metadata"]["chunk_type"] == "table_row"]
+    assert rows[0]["metadata"]["part_number"] == "TC-2000-B" and rows[0]["metadata"]["doc_type"] == "document"
+    _, parse = resolve_parser(tmp_path / "agreement.pdf")
+    assert "Supplier quality agreement" in next(iter(parse(tmp_path / "agreement.pdf")))["content"]
+
+def test_pdf_text_only_pages_skip_layout_analysis():
+    """
+    Pages without images or vector graphics are converted from their text spans and keep
+    their headings; pages with ruled tables still go through the layout model.
+    """
+    from src.tracing import tracer
+
+    tracer.enable(keep=True)
+    try:
+        tracer.drain()
+        chunks = list(ingest_reach_pdf(DATA_DIR / "REACH_Certificate_of_Compliance_Test_Corporation.pdf"))
+        spans = tracer.drain()
+    finally:
+        tracer.disable()
+
+    fast_pages = {span.attributes["page"] for span in spans if span.name == "convert" and span.attributes.get("fast_path")}
+    assert fast_pages == {3, 4, 5, 6, 7}
+    # Chunking is timed apart from the conversion it pulls in
+    (split,) = [span for span in spans if span.name == "split"]
+    assert split.attributes["chunks"] == len(chunks)
+    assert 0 < split.duration < sum(span.duration for span in spans if span.name == "convert")
+    titles = {chunk["metadata"]["section_title"] for chunk in chunks}
+    # Headings of the text-only pages (4 and 7) are still detected with the document's levels
+    assert {"**Administrative & Technical Notes**", "**Authorized Signatory**"} <= titles
+    assert any("PN=TCC-9856-B" in chunk["content"] for chunk in chunks)
+
+def test_pdf_falls_back_to_public_api_on_untested_pymupdf4llm():
+    """
+    With another pymupdf4llm release, pages go through pymupdf4llm.to_markdown instead
+    of the private layout helpers.
+    """
+    from unittest.mock import patch
+    import pymupdf4llm
+    from src import parser
+
+    parser._has_layout_api.cache_clear()
+    try:
+        assert parser._has_layout_api()
+        with patch.object(pymupdf4llm, "__version__", "99.0.0"), \
+             patch.object(pymupdf4llm, "to_markdown", wraps=pymupdf4llm.to_markdown) as to_markdown, \
+             patch.object(parser, "_text_page_layout") as text_page_layout:
+            parser._has_layout_api.cache_clear()
+            pages = list(parser.iter_pdf_markdown(DATA_DIR / "REACH_Certificate_of_Compliance_Test_Corporation.pdf"))
+        assert to_markdown.call_count == len(pages) == 7
+        text_page_layout.assert_not_called()
+        assert "TCC-9856-B" in "".join(pages)
+    finally:
+        parser._has_layout_api.cache_clear()
+
+def test_html_parser_streams_large_tables():
+    """
+    HTML is converted while it is read: rows are chunked as they close, so memory does
+    not grow with the table, and the Markdown matches markdownify's.
+    """
+    import tempfile
+    import tracemalloc
+    import markdownify
+    from src.parser import iter_html_markdown
+
+    html_path = DATA_DIR / "part_measurements_test_corporation.html"
+    expected = markdownify.markdownify(html_path.read_text(encoding="utf-8"), heading_style="ATX")
+    assert [line for line in iter_html_markdown(html_path) if line] == [line for line in expected.splitlines() if line]
+
+    row = "<tr><td><b>TC-{i}-A</b><br/>Rev R1</td><td>Length</td><td>25.00</td><td>Pass</td></tr>\n"
+    header = "<html><body><h1>Report</h1><table><tr><th>Part Number</th><th>Feature</th><th>Nominal</th><th>Status</th></tr>\n"
+
+    def peak_parsing(rows: int) -> int:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "report.html"
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(header)
+                for i in range(rows):
+                    f.write(row.format(i=i))
+                f.write("</table><p>End of report</p></body></html>")
+            tracemalloc.start()
+            try:
+                count = sum(1 for _ in ingest_parts_html(path))
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        assert count == rows + 1
+        return peak
+
+    small, large = peak_parsing(2000), peak_parsing(8000)
+    # The file grows by about 500 KB; only the block being converted is held
+    assert large < small * 1.5
+
+def test_parse_cache_hits_evicts_and_skips_failures(tmp_path):
+    """
+    Parser output is replayed for an unchanged key, a failed parse leaves no entry and
+    the least recently used entries are evicted beyond the size budget.
+    """
+    from src.parse_cache import ParseCache
+
+    cache = ParseCache(tmp_path, max_bytes=1 << 20)
+    calls = []
+
+    def produce(text):
+        def chunks():
+            calls.append(text)
+            for i in range(3):
+                yield {"content": f"{text} {i}", "metadata": {"source": "a.pdf"}}
+        return chunks
+
+    key = ParseCache.key("digest", "parser", {"parser_version": 2})
+    first = list(cache.through(key, produce("row")))
+    assert list(cache.through(key, produce("row"))) == first
+    assert calls == ["row"] and (cache.hits, cache.misses) == (1, 1)
+    # Any option change is another entry
+    assert ParseCache.key("digest", "parser", {"parser_version": 3}) != key
+
+    def failing():
+        yield {"content": "partial", "metadata": {}}
+        raise RuntimeError("broken file")
+
+    failed_key = ParseCache.key("other", "parser", {})
+    with pytest.raises(RuntimeError):
+        list(cache.through(failed_key, failing))
+    assert cache.stats()["entries"] == 1
+    assert not list(tmp_path.glob("*.tmp"))
+
+    # Incompressible entries of about 40 KB in a 100 KB cache: the oldest ones go first
+    cache.max_bytes = 100_000
+    for i in range(4):
+        big = {"content": os.urandom(30_000).hex(), "metadata": {}}
+        list(cache.through(ParseCache.key(f"big-{i}", "parser", {}), lambda: iter([big])))
+    assert cache.stats()["bytes"] <= 100_000
+    assert not cache._path(key).exists()
+    assert cache._path(ParseCache.key("big-3", "parser", {})).exists()
+
+def test_parse_cache_key_covers_parser_source(tmp_path):
+    """
+    Editing src/parser.py without bumping PARSER_VERSION is a parse cache miss.
+    """
+    from unittest.mock import patch
+    import src.parser as parser_module
+    from src.manifest import file_hash
+
+    calls = []
+
+    @parser_module.cached_parser()
+    def parse(path):
+        calls.append(path)
+        yield {"content": path.read_text(), "metadata": {"source": path.name}}
+
+    doc = tmp_path / "doc.md"
+    doc.write_text("# Title")
+    module_path = Path(parser_module.__file__)
+
+    def edited_module_hash(path):
+        return "edited" if path == module_path else file_hash(path)
+
+    parser_module._parser_options.cache_clear()
+    try:
+        list(parse(doc))
+        list(parse(doc))
+        assert len(calls) == 1
+        with patch("src.parser.file_hash", edited_module_hash):
+            parser_module._parser_options.cache_clear()
+            list(parse(doc))
+        assert len(calls) == 2
+    finally:
+        parser_module._parser_options.cache_clear()
+
+def test_resource_registry_reuse_and_invalidate():
+    from src.resources import ResourceRegistry
+    reg = ResourceRegistry()
+    built, closed = [], []
+
+    def factory():
+        built.append(object())
+        return built[-1]
+
+    first = reg.get("store", factory, close=closed.append)
+    assert reg.get("store", factory) is first
+    assert len(built) == 1
+    assert reg.setup_count == 1
+
+    reg.invalidate("store")
+    assert closed == [first]
+    assert reg.get("store", factory) is not first
+    assert len(built) == 2
+
+    with reg.track_query():
+        pass
+    assert reg.stats()["query_count"] == 1
+
+def test_cached_embeddings_hits_and_lru_eviction(tmp_path):
+    from src.embedding_cache import CachedEmbeddings
+    from src.fakes import FakeEmbeddings
+
+    fake = FakeEmbeddings()
+    cache = CachedEmbeddings(fake, model_name="fake", path=tmp_path / "cache.sqlite3", max_entries=3)
+
+    first = cache.embed_documents(["lead", "cadmium", "lead"])
+    assert fake.embedded_texts == 2
+    cached = cache.embed_documents(["lead", "cadmium"])
+    assert cached[0] == pytest.approx(first[0], abs=1e-6)
+    assert fake.embedded_texts == 2
+    assert cache.stats()["hits"] == 2
+
+    # Queries are cached separately from documents, and the cache persists on disk
+    cache.embed_query("lead")
+    cache.close()
+    reopened = CachedEmbeddings(fake, model_name="fake", path=tmp_path / "cache.sqlite3", max_entries=3)
+    reopened.embed_query("lead")
+    assert fake.embedded_texts == 3
+
+    # A fourth entry evicts the least recently used one
+    reopened.embed_documents(["mercury"])
+    assert reopened.stats()["entries"] == 3
+
+def test_lexical_index_identifiers_and_persistence(tmp_path):
+    from langchain_core.documents import Document
+    from src.lexical import LexicalIndex, extract_identifiers
+
+    assert extract_identifiers("Lead (CAS 7439-92-1) in TC-3541-A at 0.1%?") == ["7439-92-1", "tc-3541-a"]
+
+    index = LexicalIndex(tmp_path / "lexical.json")
+    index.add([
+        Document(id="1", page_content="TC-3541-A contains lead"),
+        Document(id="2", page_content="TC-3541-B contains cadmium"),
+    ])
+    index.save()
+
+    reloaded = LexicalIndex.load(tmp_path / "lexical.json")
+    assert [doc_id for doc_id, _ in reloaded.search("lead in TC-3541-A", require=["tc-3541-a"])] == ["1"]
+    reloaded.remove(["1"])
+    assert reloaded.search("TC-3541-A", require=["tc-3541-a"]) == []
+
+def test_table_index_resolves_substance_rows(tmp_path):
+    from src.parser import chunk_markdown_tables
+    from src.ingestion import chunks_to_documents
+    from src.table_index import TableIndex
+
+    md_text = "\n".join([
+        "# FMD",
+        "| Part Number | Substance | CAS No. |",
+        "|---|---|---|",
+        "|TC-3541-A|Silver (Ag)|7440-22-4|",
+        "|TC-3541-A|Aluminum (Al)|7429-90-5|",
+        "Page 1",
+        "|TCC-8334-A|Lead (Pb)|7439-92-1|",
+        "|---|---|---|",
+    ])
+    docs = chunks_to_documents(chunk_markdown_tables(md_text, "fmd.pdf", "fmd"))
+    rows = {doc.metadata["substance"]: doc.id for doc in docs if doc.metadata["chunk_type"] == "table_row"}
+    assert set(rows) == {"Silver (Ag)", "Aluminum (Al)", "Lead (Pb)"}
+
+    index = TableIndex(tmp_path / "table.json")
+    index.add(docs)
+    index.save()
+    reloaded = TableIndex.load(tmp_path / "table.json")
+
+    assert reloaded.lookup("Is there lead in TCC-8334-A?") == [rows["Lead (Pb)"]]
+    assert reloaded.lookup("CAS 7440-22-4 in TC-3541-A") == [rows["Silver (Ag)"]]
+    # Lead is a known substance but not in TC-3541-A: its whole composition proves the absence
+    assert reloaded.lookup("lead in TC-3541-A") == [rows["Silver (Ag)"], rows["Aluminum (Al)"]]
+    assert reloaded.lookup("Is TC-3541-A compliant?") == []
+
+    reloaded.remove([rows["Lead (Pb)"]])
+    assert reloaded.lookup("lead in TCC-8334-A") == []
+
+def test_near_duplicates_merge_boilerplate_not_table_rows(tmp_path):
+    from langchain_core.documents import Document
+    from src.dedup import DuplicateIndex, collapse_near_duplicates, fingerprint, is_near_duplicate
+
+    header = "| Part Number | Substance | CAS No. | Weight (mg) |\n|---|---|---|---|\n"
+    silver = fingerprint(header + "|TC-3541-A|Silver (Ag)|7440-22-4|0.12|")
+    aluminum = fingerprint(header + "|TC-3541-A|Aluminum (Al)|7429-90-5|0.12|")
+    assert not is_near_duplicate(silver, aluminum)
+
+    notice = ("This declaration is based on information provided by our suppliers and is accurate "
+              "to the best of our knowledge as of the date of issue. Supplier data was reviewed by {}.")
+    docs = [
+        Document(id="1", page_content=notice.format("Quality"), metadata={"source": "a.pdf", "section_title": "Notice"}),
+        Document(id="2", page_content=header + "|TC-3541-A|Silver (Ag)|7440-22-4|0.12|", metadata={"source": "a.pdf"}),
+        Document(id="3", page_content=notice.format("Compliance"), metadata={"source": "b.pdf", "section_title": "Legal"}),
+    ]
+    assert is_near_duplicate(fingerprint(docs[0].page_content), fingerprint(docs[2].page_content))
+    assert collapse_near_duplicates(docs) == [0, 1]
+    assert docs[0].metadata["references"] == [
+        {"source": "a.pdf", "section_title": "Notice"}, {"source": "b.pdf", "section_title": "Legal"},
+    ]
+    assert collapse_near_duplicates(docs, max_distance=-1) == [0, 1, 2]
+
+    index = DuplicateIndex(tmp_path / "duplicates.json")
+    index.add(docs[:2])
+    index.set_references({"9": {"of": "2", "metadata": {"source": "c.pdf", "page": 2}}})
+    index.save()
+    reloaded = DuplicateIndex.load(tmp_path / "duplicates.json")
+    assert reloaded.near_duplicates(fingerprint(docs[2].page_content)) == ["1"]
+    assert reloaded.near_duplicates(aluminum) == []
+    assert reloaded.references("2") == [{"source": "c.pdf", "page": 2}]
+    reloaded.remove(["1"])
+    assert reloaded.near_duplicates(fingerprint(docs[2].page_content)) == []
+
+def test_tracer_nesting_export_and_profile(tmp_path):
+    import json
+    from src.tracing import Tracer, JsonLinesExporter, profile_report
+
+    tracer = Tracer()
+    with tracer.span("noop") as span:
+        span.set(ignored=1)
+    assert tracer.drain() == []
+
+    tracer.enable(JsonLinesExporter(tmp_path / "trace.jsonl", "otlp"), keep=True)
+    with tracer.span("query"):
+        with tracer.span("retrieve"):
+            tracer.current().add(cache_hits=1)
+            tracer.current().add(cache_hits=2)
+        # Spans recorded in a worker process are re-parented under the current span
+        def work():
+            with tracer.span("parse") as parse_span:
+                parse_span.set(chunks=3)
+            return "done"
+
+        result, records = tracer.collect(work)
+        assert result == "done" and records[0]["parent_id"] is None
+        tracer.adopt(records)
+    spans = tracer.drain()
+    tracer.disable()
+
+    by_name = {span.name: span for span in spans}
+    assert by_name["retrieve"].parent_id == by_name["query"].span_id
+    assert by_name["parse"].parent_id == by_name["query"].span_id
+    assert by_name["parse"].trace_id == by_name["query"].trace_id
+    assert by_name["retrieve"].attributes == {"cache_hits": 3}
+
+    records = [json.loads(line) for line in (tmp_path / "trace.jsonl").read_text().splitlines()]
+    assert {record["name"] for record in records} == {"query", "retrieve", "parse"}
+    assert all("startTimeUnixNano" in record and "spanId" in record for record in records)
+
+    report = profile_report(spans)
+    assert "  retrieve" in report and "cache_hits=3" in report and "chunks=3" in report
+
+def test_generate_answer_traces_llm_call_and_json_parse():
+    from langchain_core.documents import Document
+    from langchain_core.messages import AIMessage
+    from langchain_core.output_parsers import PydanticOutputParser
+    from langchain_core.runnables import RunnableLambda
+    from src.inference import generate_answer, _build_prompt, ComplianceAnswer
+    from src.resources import registry
+    from src.tracing import tracer
+
+    payload = '{"answer": "55.24%", "is_compliant": false, "confidence": 0.0, "sources": []}'
+    model = RunnableLambda(lambda _: AIMessage(
+        content=payload, usage_metadata={"input_tokens": 120, "output_tokens": 20, "total_tokens": 140}
+    ))
+    chain = _build_prompt() | model | PydanticOutputParser(pydantic_object=ComplianceAnswer)
+    registry.get("chain", lambda: chain)
+
+    tracer.enable(keep=True)
+    try:
+        response = generate_answer("lead?", [Document(page_content="| TCC-8334-A | Lead (Pb) | 55.24% |")], 0.9)
+        spans = {span.name: span for span in tracer.drain()}
+    finally:
+        tracer.disable()
+
+    assert response.answer == "55.24%" and response.confidence == 0.9
+    assert spans["llm_call"].attributes == {"input_tokens": 120, "output_tokens": 20}
+    assert "json_parse" in spans
+    assert spans["prompt_build"].attributes["prompt_tokens"] > 0
+
+def test_llm_schema_leaves_out_retrieval_scores():
+    """
+    The LLM fills ComplianceAnswer only; chunk scores are attached to the response after the call.
+    """
+    from unittest.mock import patch
+    from langchain_core.documents import Document
+    from src.inference import _build_structured_llm, _to_response, ComplianceAnswer, ComplianceResponse
+
+    with patch("langchain_google_genai.ChatGoogleGenerativeAI") as llm_class, \
+         patch("src.inference.require_google_api_key", return_value="key"):
+        _build_structured_llm()
+    llm_class.return_value.with_structured_output.assert_called_once_with(ComplianceAnswer)
+    assert "chunk_scores" not in ComplianceAnswer.model_json_schema()["properties"]
+
+    answer = ComplianceAnswer(answer="0.1% Lead.", is_compliant=True, confidence=0.0, sources=[])
+    doc = Document(page_content="Lead: 0.1%", metadata={"source": "FMD.pdf", "section_title": "FMD", "score": 0.8})
+    response = _to_response(answer, 0.8, [doc])
+    assert isinstance(response, ComplianceResponse) and response.answer == "0.1% Lead."
+    assert response.confidence == 0.8
+    assert response.chunk_scores == [{"file": "FMD.pdf", "section": "FMD", "score": 0.8}]
+
+def test_local_hashing_embeddings():
+    import numpy as np
+    from unittest.mock import MagicMock
+    from src.local_embeddings import HashingEmbeddings, OnnxEmbeddings
+
+    texts = ["Lead (Pb) content of part TC-3541-A", "Lead content of TC-3541-A", "REACH certificate signatory"] * 5
+    sequential = HashingEmbeddings(dim=256, batch_size=4).encode(texts)
+    threaded = HashingEmbeddings(dim=256, batch_size=4, workers=3)
+    assert np.array_equal(threaded.encode(texts), sequential)
+    threaded.close()
+
+    # Concurrent first calls share one executor
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from unittest.mock import patch
+    created = []
+
+    def slow_executor(*args, **kwargs):
+        time.sleep(0.05)
+        created.append(ThreadPoolExecutor(*args, **kwargs))
+        return created[-1]
+
+    threaded = HashingEmbeddings(dim=256, batch_size=4, workers=3)
+    with patch("src.local_embeddings.ThreadPoolExecutor", side_effect=slow_executor), ThreadPoolExecutor(8) as callers:
+        results = list(callers.map(lambda _: threaded.encode(texts), range(8)))
+    assert len(created) == 1 and all(np.array_equal(result, sequential) for result in results)
+    threaded.close()
+
+    assert np.allclose(np.linalg.norm(sequential, axis=1), 1.0)
+    assert sequential[0] @ sequential[1] > sequential[0] @ sequential[2]
+    assert HashingEmbeddings(dim=256).embed_query("Lead in TC-3541-A") == HashingEmbeddings(dim=256).embed_query("Lead in TC-3541-A")
+
+    # Model outputs are batched and renormalized
+    model = MagicMock(side_effect=lambda batch: [[3.0, 4.0]] * len(batch))
+    onnx = OnnxEmbeddings(batch_size=2, model=model)
+    assert np.allclose(onnx.embed_documents(["a", "b", "c"]), [[0.6, 0.8]] * 3)
+    assert [len(call.args[0]) for call in model.call_args_list] == [2, 1]
+
+def test_mmr_rerank_and_grounding_calibration(tmp_path):
+    import numpy as np
+    from src.rerank import GroundingThresholds, cosine_similarities, mmr_select
+    from src.scripts.eval_retrieval import load_questions
+
+    query = np.array([1.0, 0.0, 0.0])
+    docs = np.array([[0.9, 0.1, 0.0], [0.9, 0.1, 0.01], [0.6, 0.0, 0.8]])
+    assert np.allclose(cosine_similarities(query, docs)[0], [0.9939, 0.9938, 0.6], atol=1e-4)
+    # Relevance only keeps the near-duplicate; diversity swaps it for the distinct chunk
+    assert mmr_select(query, docs, k=2, lambda_mult=1.0) == [0, 1]
+    assert mmr_select(query, docs, k=2, lambda_mult=0.5) == [0, 2]
+    assert mmr_select(query, docs, k=5, lambda_mult=0.5) == [0, 2, 1]
+
+    path = tmp_path / "thresholds.json"
+    GroundingThresholds({"FMD.pdf": 0.2}, "hashing-1024").save(path)
+    assert list(GroundingThresholds.load(path, "hashing-1024").for_sources(["FMD.pdf", "REACH.pdf"], 0.06)) == [0.2, 0.06]
+    # A calibration made for another embedding model is ignored
+    assert GroundingThresholds.load(path, "models/embedding-001").sources == {}
+
+    questions = {q["number"]: q for q in load_questions()}
+    assert len(questions) == 17 and not questions[16]["answerable"]
+    assert questions[5]["facts"][:2] == ["TP-1198-B", "TC-9053-E"] and questions[10]["facts"] == ["1907/2006"]
+    assert questions[11]["source"] == "part_measurements_test_corporation.html" and questions[15]["source"] is None
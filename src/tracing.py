@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+class Span:
+    """
+    A finished or in-progress timed operation. Times are wall-clock nanoseconds so
+    spans recorded in worker processes line up with the parent process.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes")
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        span_id: str,
+        parent_id: Optional[str],
+        start_ns: int,
+        end_ns: Optional[int] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+        self.attributes = attributes or {}
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, **counters):
+        """
+        Increments numeric attributes (e.g. cache hits accumulated over several calls).
+        """
+        for key, value in counters.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Span":
+        return cls(
+            data["name"], data["trace_id"], data["span_id"], data["parent_id"],
+            data["start_ns"], data["end_ns"], dict(data["attributes"]),
+        )
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """
+        The span in the OpenTelemetry OTLP/JSON span layout.
+        """
+        def value(v: Any) -> Dict[str, Any]:
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+
+        record = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": value(v)} for key, v in self.attributes.items()],
+        }
+        if self.parent_id:
+            record["parentSpanId"] = self.parent_id
+        return record
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+    def add(self, **counters):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+class JsonLinesExporter:
+    """
+    Appends every finished span to a file as one JSON object per line.
+
+    Args:
+        path: Output file.
+        fmt: "json" for flat records, "otlp" for the OpenTelemetry OTLP/JSON span layout.
+    """
+
+    def __init__(self, path: Path, fmt: str = "json"):
+        if fmt not in ("json", "otlp"):
+            raise ValueError(f"Unknown trace format: {fmt}")
+        self.fmt = fmt
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, span: Span):
+        record = span.to_otlp() if self.fmt == "otlp" else span.to_dict()
+        with self._lock:
+            self._file.write(json.dumps(record, default=str) + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class Tracer:
+    """
+    Minimal in-process tracer. Disabled by default: `span()` then costs one flag check.
+
+    Spans nest through a context variable, so they follow asyncio tasks and
+    `asyncio.to_thread`; threads from executors need `contextvars.copy_context()`.
+    Finished spans are kept in memory (for --profile) and/or handed to exporters.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.keep = False
+        self.exporters: List[JsonLinesExporter] = []
+        self._finished: List[Span] = []
+        self._lock = threading.Lock()
+
+    def enable(self, exporter: Optional[JsonLinesExporter] = None, keep: bool = False):
+        """
+        Turns tracing on. `keep` retains finished spans until drained; `exporter` receives each of them.
+        """
+        self.enabled = True
+        self.keep = self.keep or keep
+        if exporter is not None:
+            self.exporters.append(exporter)
+
+    def disable(self):
+        self.enabled = False
+        self.keep = False
+        for exporter in self.exporters:
+            exporter.close()
+        self.exporters = []
+        self.drain()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Times the wrapped block as a child of the current span.
+        Yields the span so attributes can be added while it runs.
+        """
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+        parent = _current_span.get()
+        span = Span(
+            name,
+            parent.trace_id if parent is not None else _new_id(16),
+            _new_id(8),
+            parent.span_id if parent is not None else None,
+            time.time_ns(),
+            attributes=attributes,
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            self._finish(span)
+
+    def record(self, name: str, seconds: float, **attributes):
+        """
+        Records a span that was not timed as one block, such as time accumulated over the
+        steps of a generator, as a child of the current span ending now.
+        """
+        if not self.enabled:
+            return
+        parent = _current_span.get()
+        end_ns = time.time_ns()
+        self._finish(Span(
+            name,
+            parent.trace_id if parent is not None else _new_id(16),
+            _new_id(8),
+            parent.span_id if parent is not None else None,
+            end_ns - int(seconds * 1e9),
+            end_ns,
+            attributes,
+        ))
+
+    def current(self):
+        """
+        The active span, or a no-op stand-in when tracing is off or no span is open.
+        """
+        span = _current_span.get() if self.enabled else None
+        return span if span is not None else _NOOP_SPAN
+
+    def _finish(self, span: Span):
+        with self._lock:
+            if self.keep:
+                self._finished.append(span)
+            for exporter in self.exporters:
+                exporter.export(span)
+
+    def drain(self) -> List[Span]:
+        """
+        Returns and forgets the spans finished so far.
+        """
+        with self._lock:
+            spans, self._finished = self._finished, []
+        return spans
+
+    def collect(self, fn: Callable, *args) -> Tuple[Any, List[Dict[str, Any]]]:
+        """
+        Runs `fn` with tracing on and returns (result, finished spans as dicts).
+        Used in worker processes, whose spans are sent back to the parent and `adopt`ed there.
+        """
+        saved = (self.enabled, self.keep, self.exporters, self.drain())
+        self.enabled, self.keep, self.exporters = True, True, []
+        try:
+            result = contextvars.Context().run(fn, *args)
+            return result, [span.to_dict() for span in self.drain()]
+        finally:
+            self.enabled, self.keep, self.exporters, self._finished = saved
+
+    def adopt(self, records: Iterable[Dict[str, Any]]):
+        """
+        Records spans from another process, re-parenting their roots under the current span.
+        """
+        if not self.enabled:
+            return
+        parent = _current_span.get()
+        for record in records:
+            span = Span.from_dict(record)
+            if span.parent_id is None and parent is not None:
+                span.parent_id = parent.span_id
+            if parent is not None:
+                span.trace_id = parent.trace_id
+            self._finish(span)
+
+tracer = Tracer()
+
+def span(name: str, **attributes):
+    """
+    Shortcut for tracer.span().
+    """
+    return tracer.span(name, **attributes)
+
+def traced(name: str):
+    """
+    Decorator running a function inside a span.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def profile_report(spans: List[Span]) -> str:
+    """
+    Formats a per-stage breakdown of finished spans.
+
+    Spans are grouped by their path of names (e.g. query > retrieve > vector_search);
+    each line shows the call count, total time, share of the root time and the sum
+    of numeric attributes (token counts, cache hits, ...).
+    """
+    if not spans:
+        return "No spans recorded."
+
+    by_id = {span.span_id: span for span in spans}
+
+    def path(span: Span) -> Tuple[str, ...]:
+        names = [span.name]
+        parent = by_id.get(span.parent_id)
+        while parent is not None:
+            names.append(parent.name)
+            parent = by_id.get(parent.parent_id)
+        return tuple(reversed(names))
+
+    groups: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    for span in sorted(spans, key=lambda span: span.start_ns):
+        group = groups.setdefault(path(span), {"count": 0, "seconds": 0.0, "attributes": {}})
+        group["count"] += 1
+        group["seconds"] += span.duration
+        for key, value in span.attributes.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                group["attributes"][key] = group["attributes"].get(key, 0) + value
+
+    root_seconds = sum(group["seconds"] for key, group in groups.items() if len(key) == 1) or 1e-9
+    width = max(2 * (len(key) - 1) + len(key[-1]) for key in groups) + 2
+
+    def order(key: Tuple[str, ...]):
+        # Children right after their parent, in order of first start
+        return [list(groups).index(key[:i + 1]) if key[:i + 1] in groups else 0 for i in range(len(key))]
+
+    lines = [f"{'stage':<{width}} {'calls':>5} {'total':>9} {'share':>6}"]
+    for key in sorted(groups, key=order):
+        group = groups[key]
+        label = "  " * (len(key) - 1) + key[-1]
+        extras = " ".join(
+            f"{name}={value:g}" if isinstance(value, float) else f"{name}={value}"
+            for name, value in group["attributes"].items()
+        )
+        lines.append(
+            f"{label:<{width}} {group['count']:>5} {group['seconds']:>8.3f}s "
+            f"{group['seconds'] / root_seconds:>6.1%} {extras}".rstrip()
+        )
+    return "\n".join(lines)
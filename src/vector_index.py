@@ -0,0 +1,311 @@
+import time
+import shutil
+import random
+import sqlite3
+import struct
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from src.config import VECTOR_SPACE, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH
+from src.local_embeddings import normalize_rows
+from src.resources import registry
+
+# Collection LangChain's Chroma wrapper opens by default, which every index so far was built as
+COLLECTION_NAME = "langchain"
+# HNSW parameters fixed when the index is built (ef_search can be changed in place)
+BUILD_PARAMETERS = ("space", "max_neighbors", "ef_construction")
+# hnswlib's persisted header: version, offsetLevel0, max_elements, cur_element_count, size_data_per_element,
+# label_offset, offsetData, maxlevel, enterpoint_node, maxM, maxM0, M, mult, ef_construction
+_HNSW_HEADER = struct.Struct("<iQQQQQQiIQQQdQ")
+
+def index_configuration() -> Dict[str, Any]:
+    """
+    Chroma collection configuration of the vector index, from VECTOR_SPACE and the HNSW_* settings.
+    """
+    return {"hnsw": {
+        "space": VECTOR_SPACE,
+        "max_neighbors": HNSW_M,
+        "ef_construction": HNSW_EF_CONSTRUCTION,
+        "ef_search": HNSW_EF_SEARCH,
+    }}
+
+def _hnsw_configuration(collection) -> Dict[str, Any]:
+    return dict((collection.configuration or {}).get("hnsw") or {})
+
+def parameter_drift(collection) -> Dict[str, Tuple[Any, Any]]:
+    """
+    Build parameters of an existing collection that differ from the configured ones.
+
+    Returns:
+        Parameter name -> (current value, configured value); empty if the index is up to date.
+    """
+    current = _hnsw_configuration(collection)
+    configured = index_configuration()["hnsw"]
+    return {name: (current.get(name), configured[name]) for name in BUILD_PARAMETERS if current.get(name) != configured[name]}
+
+def index_drift(chroma_dir: Path) -> Dict[str, Tuple[Any, Any]]:
+    """
+    `parameter_drift` of the index at `chroma_dir`; empty if there is no index yet.
+    """
+    from chromadb.errors import NotFoundError
+
+    if not (chroma_dir / "chroma.sqlite3").exists():
+        return {}
+    try:
+        with open_collection(chroma_dir) as collection:
+            return parameter_drift(collection)
+    except NotFoundError:
+        return {}
+
+def apply_search_parameters(collection, ef_search: int = HNSW_EF_SEARCH):
+    """
+    Sets the collection's search candidate list size, if it differs. Unlike the build
+    parameters, ef_search can change on an existing index; Chroma applies it when the
+    index is loaded, i.e. before the collection's first query in a process.
+    """
+    if _hnsw_configuration(collection).get("ef_search") != ef_search:
+        collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+
+@contextmanager
+def open_collection(chroma_dir: Path):
+    """
+    Opens the vector index at `chroma_dir` with a bare Chroma client: no embedding
+    model (or API key) is needed to read stored records or to search by vector.
+    Raises chromadb's NotFoundError if the directory holds no index.
+    """
+    import chromadb
+
+    client = chromadb.PersistentClient(path=str(chroma_dir))
+    try:
+        yield client.get_collection(COLLECTION_NAME, embedding_function=None)
+    finally:
+        client.close()
+
+def iter_pages(
+    collection,
+    page_size: int = 1000,
+    include: Sequence[str] = ("metadatas",),
+    where: Optional[Dict[str, Any]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Reads the collection page by page, so inspecting or copying it never holds more
+    than `page_size` records (and their embeddings) in memory.
+
+    Yields:
+        Chroma `get` results of at most `page_size` records each.
+    """
+    offset = 0
+    while True:
+        page = collection.get(limit=page_size, offset=offset, include=list(include), where=where)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+        if len(page["ids"]) < page_size:
+            return
+
+def _vector_segment(chroma_dir: Path, collection) -> Optional[Path]:
+    with closing(sqlite3.connect(f"file:{chroma_dir / 'chroma.sqlite3'}?mode=ro", uri=True)) as conn:
+        row = conn.execute(
+            "SELECT id FROM segments WHERE collection = ? AND scope = 'VECTOR'", (str(collection.id),)
+        ).fetchone()
+    return chroma_dir / row[0] if row else None
+
+def _hnsw_header(segment_dir: Optional[Path]) -> Optional[Dict[str, int]]:
+    """
+    Element counts and build parameters of a persisted HNSW segment, or None if it has
+    not been written yet (Chroma persists it every sync_threshold additions).
+    """
+    try:
+        data = (segment_dir / "header.bin").read_bytes() if segment_dir else b""
+    except FileNotFoundError:
+        return None
+    if len(data) < _HNSW_HEADER.size:
+        return None
+    fields = _HNSW_HEADER.unpack_from(data)
+    if fields[0] != 1:
+        return None
+    return {"capacity": fields[2], "elements": fields[3], "bytes_per_element": fields[4], "M": fields[11], "ef_construction": fields[13]}
+
+def _directory_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) if path and path.exists() else 0
+
+def index_stats(chroma_dir: Path) -> Dict[str, Any]:
+    """
+    Size and fragmentation of the vector index at `chroma_dir`.
+
+    Deleting or updating chunks only marks their HNSW nodes deleted, and the SQLite
+    file keeps the pages it freed: after many incremental ingestions the index holds
+    far more nodes than live records, which costs memory and search time.
+
+    Returns:
+        records: live records in the collection.
+        hnsw_elements: nodes in the persisted HNSW graph, deleted ones included.
+        fragmentation: share of the HNSW nodes that are deleted.
+        bytes, sqlite_bytes, vector_bytes: on-disk size in total, of the SQLite file and of the HNSW segment.
+        sqlite_free_bytes: SQLite pages freed but not returned to the file system.
+        configuration: current HNSW configuration; drift: build parameters differing from the settings.
+    """
+    with open_collection(chroma_dir) as collection:
+        records = collection.count()
+        configuration = _hnsw_configuration(collection)
+        drift = parameter_drift(collection)
+        segment_dir = _vector_segment(chroma_dir, collection)
+
+    sqlite_path = chroma_dir / "chroma.sqlite3"
+    with closing(sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)) as conn:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    header = _hnsw_header(segment_dir)
+    elements = max(header["elements"], records) if header else records
+    return {
+        "records": records,
+        "hnsw_elements": elements,
+        "deleted_elements": elements - records,
+        "fragmentation": (elements - records) / elements if elements else 0.0,
+        "bytes": _directory_size(chroma_dir),
+        "sqlite_bytes": sqlite_path.stat().st_size,
+        "vector_bytes": _directory_size(segment_dir),
+        "sqlite_free_bytes": free_pages * page_size,
+        "configuration": configuration,
+        "drift": drift,
+    }
+
+def _distances(space: str, queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    # Same distances as hnswlib, so exact and approximate neighbours rank alike
+    if space == "cosine":
+        return 1.0 - normalize_rows(queries) @ normalize_rows(vectors).T
+    if space == "ip":
+        return 1.0 - queries @ vectors.T
+    return (queries ** 2).sum(1)[:, None] - 2.0 * queries @ vectors.T + (vectors ** 2).sum(1)[None, :]
+
+def measure_recall(
+    chroma_dir: Path,
+    ef_values: Sequence[int],
+    queries: int = 100,
+    k: int = 10,
+    page_size: int = 1000,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Recall and latency of the approximate search for several ef_search values.
+
+    The queries are stored embeddings sampled from the collection; their exact top-k
+    neighbour distances are found by a brute-force scan of the collection, page by page,
+    in the collection's metric, and a search result counts as found if it is as close as
+    the exact k-th neighbour. The index is then reopened with each ef (Chroma reads ef_search
+    when it loads the index) and every query is timed. The configured ef_search is
+    restored afterwards.
+
+    Returns:
+        One dict per ef: ef, recall (share of the exact top-k found), mean_ms and p95_ms per query.
+    """
+    # A store open in this process would keep the index loaded with its own ef_search
+    registry.invalidate("vectorstore")
+    with open_collection(chroma_dir) as collection:
+        count = collection.count()
+        if count == 0:
+            return []
+        k = min(k, count)
+        space = _hnsw_configuration(collection).get("space", "l2")
+        offsets = set(random.Random(seed).sample(range(count), min(queries, count)))
+
+        # Pass 1: the sampled query vectors
+        sample, offset = [], 0
+        for page in iter_pages(collection, page_size, include=("embeddings",)):
+            sample.extend(page["embeddings"][i] for i in range(len(page["ids"])) if offset + i in offsets)
+            offset += len(page["ids"])
+        query_vectors = np.asarray(sample, dtype=np.float32)
+
+        # Pass 2: exact k-th neighbour distance by brute force, keeping the best k per query across pages
+        best = np.full((len(query_vectors), 0), np.inf, dtype=np.float32)
+        for page in iter_pages(collection, page_size, include=("embeddings",)):
+            distances = np.hstack([best, _distances(space, query_vectors, np.asarray(page["embeddings"], dtype=np.float32))])
+            best = np.partition(distances, k - 1, axis=1)[:, :k] if distances.shape[1] > k else distances
+        # Results tied with the k-th neighbour count as hits (identical chunks have identical embeddings)
+        kth = best.max(axis=1) + 1e-4
+
+    results = []
+    try:
+        for ef in ef_values:
+            with open_collection(chroma_dir) as collection:
+                apply_search_parameters(collection, ef)
+            with open_collection(chroma_dir) as collection:
+                collection.query(query_embeddings=query_vectors[:1], n_results=k, include=[])
+                found, latencies = 0, []
+                for vector, limit in zip(query_vectors, kth):
+                    start = time.perf_counter()
+                    distances = collection.query(query_embeddings=vector[None, :], n_results=k, include=["distances"])["distances"][0]
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    found += sum(distance <= limit for distance in distances)
+            results.append({
+                "ef": ef,
+                "recall": float(found / (k * len(query_vectors))),
+                "mean_ms": float(np.mean(latencies)),
+                "p95_ms": float(np.percentile(latencies, 95)),
+            })
+    finally:
+        with open_collection(chroma_dir) as collection:
+            apply_search_parameters(collection)
+    return results
+
+def compact_index(chroma_dir: Path, page_size: int = 1000) -> Dict[str, Any]:
+    """
+    Rebuilds the vector index at `chroma_dir` from its stored records, with the
+    configured metric and HNSW parameters.
+
+    Every record (ID, embedding, document, metadata) is copied page by page into a
+    fresh index next to the current one, so nothing is re-embedded, deleted nodes and
+    freed SQLite pages are dropped, and build parameter changes take effect. The side
+    files (manifest, lexical and table indexes) are carried over, then the new directory
+    replaces the old one. The manifest is touched last, so a running server reloads.
+
+    Returns:
+        records copied, bytes before and after, and the HNSW configuration before and after.
+    """
+    import chromadb
+
+    target = chroma_dir.with_name(f"{chroma_dir.name}.compact")
+    backup = chroma_dir.with_name(f"{chroma_dir.name}.old")
+    shutil.rmtree(target, ignore_errors=True)
+    shutil.rmtree(backup, ignore_errors=True)
+    # The shared store keeps the old files open; it is reopened from the new ones on next use
+    registry.invalidate("vectorstore")
+
+    before_bytes = _directory_size(chroma_dir)
+    client = chromadb.PersistentClient(path=str(target))
+    try:
+        with open_collection(chroma_dir) as source:
+            before = _hnsw_configuration(source)
+            destination = client.create_collection(COLLECTION_NAME, configuration=index_configuration(), embedding_function=None)
+            for page in iter_pages(source, page_size, include=("embeddings", "documents", "metadatas")):
+                destination.add(
+                    ids=page["ids"], embeddings=page["embeddings"],
+                    documents=page["documents"], metadatas=page["metadatas"],
+                )
+        records = destination.count()
+        after = _hnsw_configuration(destination)
+    except BaseException:
+        client.close()
+        shutil.rmtree(target, ignore_errors=True)
+        raise
+    client.close()
+
+    for side_file in chroma_dir.glob("*.json"):
+        shutil.copy2(side_file, target / side_file.name)
+    chroma_dir.rename(backup)
+    target.rename(chroma_dir)
+    shutil.rmtree(backup, ignore_errors=True)
+    manifest = chroma_dir / "ingest_manifest.json"
+    if manifest.exists():
+        manifest.touch()
+
+    return {
+        "records": records,
+        "bytes_before": before_bytes,
+        "bytes_after": _directory_size(chroma_dir),
+        "configuration_before": before,
+        "configuration_after": after,
+    }